@@ -1,10 +1,14 @@
-from queue import Queue
 from enum import Enum
-from dataclasses import dataclass
-from typing import Optional, Dict
+from dataclasses import dataclass, field
+from typing import Optional, Dict, List
+import time
 import uuid
 import threading
 
+from job_store import (
+    JobStore, JOB_RETENTION_HOURS, JOB_MAX_FINISHED, JOB_PRUNE_INTERVAL
+)
+
 class JobStatus(Enum):
     PENDING = "pending"
     PROCESSING = "processing"
@@ -12,6 +16,15 @@ class JobStatus(Enum):
     FAILED = "failed"
     CANCELLED = "cancelled"
 
+class JobPriority(Enum):
+    """Classes de prioridade, da mais à menos urgente (ver scheduler.py)"""
+    INTERACTIVE = "interactive"  # usuário aguardando a resposta
+    BATCH = "batch"              # lotes de perguntas de clientes automatizados
+    MAINTENANCE = "maintenance"  # reindexação e outras tarefas de fundo
+
+# Status em que o job terminou (Job.done marcado)
+FINISHED_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+
 @dataclass
 class Job:
     job_id: str
@@ -22,16 +35,82 @@ class Job:
     result: Optional[dict] = None
     error: Optional[str] = None
     webhook_url: Optional[str] = None
+    # Opções repassadas à execução (ex.: mmr, mmr_lambda)
+    options: dict = field(default_factory=dict)
+    priority: JobPriority = JobPriority.INTERACTIVE
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Segundos de execução permitidos, contados a partir de PROCESSING; None = sem prazo
+    timeout: Optional[float] = None
+    # Prazo (epoch) para o job terminar, definido quando ele começa (ver JobScheduler)
+    deadline: Optional[float] = None
+    # Sinalizado quando o job termina: quem precisa do resultado espera por ele em vez de
+    # consultar o status. Se for sinalizado durante a execução (cancelamento, prazo), é o
+    # aviso para a execução parar (ver RagEngine.answer(cancel=...))
+    done: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+
+    @property
+    def queue_wait(self) -> Optional[float]:
+        """Segundos entre a entrada na fila e o início da execução (None se não começou)"""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.created_at
+
+    def to_row(self) -> dict:
+        """Colunas do job no JobStore"""
+        return {
+            "job_id": self.job_id,
+            "status": self.status.value,
+            "priority": self.priority.value,
+            "command": self.command,
+            "base_dir": self.base_dir,
+            "question": self.question,
+            "webhook_url": self.webhook_url,
+            "options": self.options,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timeout": self.timeout,
+            "deadline": self.deadline
+        }
+
+    @classmethod
+    def from_row(cls, row: dict) -> "Job":
+        job = cls(**dict(
+            row, status=JobStatus(row["status"]), priority=JobPriority(row["priority"]),
+            options=row["options"] or {}
+        ))
+        if job.status in FINISHED_STATUSES:
+            job.done.set()
+        return job
 
 class JobQueue:
-    def __init__(self):
-        self.queue: Queue = Queue()
+    """
+    Registro dos jobs, persistido no JobStore (job_store.py); a ordem de
+    execução fica com o JobScheduler (scheduler.py).
+
+    Só os jobs ativos (PENDING e PROCESSING) ficam em memória; os terminados
+    são lidos do SQLite e removidos conforme a retenção. As contagens por
+    status são mantidas a cada transição, sem percorrer os jobs.
+    """
+    def __init__(self, store: Optional[JobStore] = None, retention_hours: Optional[float] = None,
+                 max_finished: Optional[int] = None):
+        self.store = store or JobStore()
+        self.retention_hours = JOB_RETENTION_HOURS if retention_hours is None else retention_hours
+        self.max_finished = JOB_MAX_FINISHED if max_finished is None else max_finished
         self.jobs: Dict[str, Job] = {}
-        self.processing = False
         self.lock = threading.Lock()
-    
-    def add_job(self, command: str, base_dir: str, question: Optional[str] = None, webhook_url: Optional[str] = None) -> str:
-        """Adiciona um job à fila e retorna o job_id"""
+        stored = self.store.count_by_status()
+        self.counts: Dict[JobStatus, int] = {status: stored.get(status.value, 0) for status in JobStatus}
+        self._last_prune = 0.0
+
+    def add_job(self, command: str, base_dir: str, question: Optional[str] = None, webhook_url: Optional[str] = None,
+                options: Optional[dict] = None, priority: JobPriority = JobPriority.INTERACTIVE,
+                timeout: Optional[float] = None) -> str:
+        """Adiciona um job à fila e retorna o job_id (timeout: segundos de execução, a partir do início)"""
         job_id = str(uuid.uuid4())
         job = Job(
             job_id=job_id,
@@ -39,39 +118,109 @@ class JobQueue:
             command=command,
             base_dir=base_dir,
             question=question,
-            webhook_url=webhook_url
+            webhook_url=webhook_url,
+            options=options or {},
+            priority=priority,
+            timeout=timeout or None
         )
-        self.jobs[job_id] = job
-        self.queue.put(job_id)
+        with self.lock:
+            self.store.insert(job.to_row())
+            self.jobs[job_id] = job
+            self.counts[JobStatus.PENDING] += 1
         return job_id
-    
+
     def get_job(self, job_id: str) -> Optional[Job]:
-        """Retorna um job pelo ID"""
-        return self.jobs.get(job_id)
-    
+        """Retorna um job pelo ID (os terminados vêm do JobStore)"""
+        job = self.jobs.get(job_id)
+        if job:
+            return job
+        row = self.store.get(job_id)
+        return Job.from_row(row) if row else None
+
     def update_job_status(self, job_id: str, status: JobStatus, result: Optional[dict] = None, error: Optional[str] = None):
-        """Atualiza o status de um job"""
-        if job_id in self.jobs:
-            job = self.jobs[job_id]
+        """
+        Atualiza o status de um job e sinaliza job.done se ele terminou.
+        Jobs já terminados não mudam mais (ex.: resultado de um job cancelado).
+
+        Returns:
+            True se o status foi atualizado
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job.status == status:
+                return False
+            previous = job.status
             job.status = status
             if result:
                 job.result = result
             if error:
                 job.error = error
-    
+            if status == JobStatus.PROCESSING:
+                job.started_at = time.time()
+                if job.timeout:
+                    # O tempo na fila não consome o prazo de execução
+                    job.deadline = job.started_at + job.timeout
+            finished = status in FINISHED_STATUSES
+            if finished:
+                job.finished_at = time.time()
+            self.store.update(
+                job_id, status=status.value, result=job.result, error=job.error,
+                started_at=job.started_at, finished_at=job.finished_at, deadline=job.deadline
+            )
+            if finished:
+                # Gravado antes de sair da memória: get_job sempre encontra o job
+                del self.jobs[job_id]
+            self.counts[previous] -= 1
+            self.counts[status] += 1
+        if finished:
+            job.done.set()
+            self.prune()
+        return True
+
+    def recover(self) -> List[str]:
+        """
+        Retoma os jobs ativos gravados antes de um reinício: os que estavam
+        PROCESSING falham (a execução foi perdida) e os PENDING voltam para a
+        memória.
+
+        Returns:
+            job_ids PENDING, do mais antigo ao mais novo, para o escalonador
+        """
+        pending = []
+        for row in self.store.with_status(JobStatus.PENDING.value, JobStatus.PROCESSING.value):
+            if row["job_id"] in self.jobs:
+                continue
+            job = Job.from_row(row)
+            with self.lock:
+                self.jobs[job.job_id] = job
+            if job.status == JobStatus.PROCESSING:
+                self.update_job_status(job.job_id, JobStatus.FAILED, error="Interrompido: o servidor foi reiniciado durante a execução")
+            else:
+                pending.append(job.job_id)
+        if pending:
+            print(f"🔁 {len(pending)} job(s) pendente(s) retomado(s) da fila")
+        self.prune(force=True)
+        return pending
+
+    def prune(self, force: bool = False):
+        """Remove jobs terminados fora da retenção (no máximo a cada JOB_PRUNE_INTERVAL segundos)"""
+        now = time.time()
+        with self.lock:
+            if not force and now - self._last_prune < JOB_PRUNE_INTERVAL:
+                return
+            self._last_prune = now
+            removed = self.store.prune(now - self.retention_hours * 3600, self.max_finished)
+            for status, count in removed.items():
+                self.counts[JobStatus(status)] -= count
+
     def get_queue_status(self) -> dict:
-        """Retorna o status da fila"""
-        pending = sum(1 for j in self.jobs.values() if j.status == JobStatus.PENDING)
-        processing = sum(1 for j in self.jobs.values() if j.status == JobStatus.PROCESSING)
-        completed = sum(1 for j in self.jobs.values() if j.status == JobStatus.COMPLETED)
-        failed = sum(1 for j in self.jobs.values() if j.status == JobStatus.FAILED)
-        
+        """Retorna o status da fila (contagens mantidas incrementalmente)"""
+        counts = self.counts
         return {
-            "pending": pending,
-            "processing": processing,
-            "completed": completed,
-            "failed": failed,
-            "total": len(self.jobs),
-            "is_processing": self.processing
+            "pending": counts[JobStatus.PENDING],
+            "processing": counts[JobStatus.PROCESSING],
+            "completed": counts[JobStatus.COMPLETED],
+            "failed": counts[JobStatus.FAILED],
+            "total": sum(counts.values()),
+            "is_processing": counts[JobStatus.PROCESSING] > 0
         }
-
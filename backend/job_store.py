@@ -0,0 +1,169 @@
+"""
+Persistência dos jobs da fila em SQLite (WAL).
+
+Cada job é uma linha da tabela jobs, gravada quando entra na fila e a cada
+mudança de status. Em memória ficam só os jobs ativos (PENDING e PROCESSING,
+ver JobQueue); jobs terminados são lidos daqui quando consultados e removidos
+conforme a retenção:
+- JOB_RETENTION_HOURS: jobs terminados há mais tempo que isso são removidos
+- JOB_MAX_FINISHED: no máximo esse número de jobs terminados é mantido
+
+Os índices em status, created_at e finished_at mantêm consultas, contagens e
+a limpeza sem varrer a tabela.
+"""
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", str(Path(__file__).parent / "jobs.sqlite"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "168"))
+JOB_MAX_FINISHED = int(os.getenv("JOB_MAX_FINISHED", "10000"))
+# Intervalo mínimo entre duas limpezas (segundos)
+JOB_PRUNE_INTERVAL = float(os.getenv("JOB_PRUNE_INTERVAL", "60"))
+
+_COLUMNS = (
+    "job_id", "status", "priority", "command", "base_dir", "question", "webhook_url",
+    "options", "result", "error", "created_at", "started_at", "finished_at", "timeout", "deadline"
+)
+# Colunas adicionadas depois da primeira versão da tabela (migradas com ALTER TABLE)
+_ADDED_COLUMNS = {
+    "priority": "TEXT NOT NULL DEFAULT 'interactive'",
+    "deadline": "REAL",
+    "timeout": "REAL",
+}
+_JSON_COLUMNS = ("options", "result")
+
+
+def _dumps(value):
+    return None if value is None else json.dumps(value, ensure_ascii=False, default=str)
+
+
+class JobStore:
+    """Jobs por job_id em SQLite; linhas como dicts com as colunas de _COLUMNS"""
+
+    def __init__(self, path=None):
+        self.path = str(path or JOB_STORE_PATH)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                priority TEXT NOT NULL DEFAULT 'interactive',
+                command TEXT NOT NULL,
+                base_dir TEXT NOT NULL,
+                question TEXT,
+                webhook_url TEXT,
+                options TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                timeout REAL,
+                deadline REAL
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in _ADDED_COLUMNS.items():
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at) WHERE finished_at IS NOT NULL"
+        )
+        self._conn.commit()
+
+    def insert(self, row: dict):
+        values = [_dumps(row.get(c)) if c in _JSON_COLUMNS else row.get(c) for c in _COLUMNS]
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                values
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, **fields):
+        """Atualiza as colunas em fields do job"""
+        if not fields:
+            return
+        names = list(fields)
+        values = [_dumps(fields[c]) if c in _JSON_COLUMNS else fields[c] for c in names]
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{c} = ?' for c in names)} WHERE job_id = ?",
+                values + [job_id]
+            )
+            self._conn.commit()
+
+    def _to_dict(self, row) -> dict:
+        data = dict(zip(_COLUMNS, row))
+        for column in _JSON_COLUMNS:
+            if data[column] is not None:
+                data[column] = json.loads(data[column])
+        return data
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def with_status(self, *statuses: str) -> List[dict]:
+        """Jobs com um dos status, do mais antigo ao mais novo"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE status IN ({', '.join('?' * len(statuses))}) "
+                "ORDER BY created_at",
+                statuses
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def prune(self, finished_before: float, max_finished: int) -> Dict[str, int]:
+        """
+        Remove jobs terminados antes de finished_before e os que excedem
+        max_finished (os mais antigos primeiro).
+
+        Returns:
+            Número de jobs removidos por status
+        """
+        with self._lock:
+            # finished_at do job mais novo que já excede o limite
+            row = self._conn.execute(
+                "SELECT finished_at FROM jobs WHERE finished_at IS NOT NULL "
+                "ORDER BY finished_at DESC LIMIT 1 OFFSET ?",
+                (max(0, max_finished),)
+            ).fetchone()
+            cutoff = finished_before if row is None else max(finished_before, row[0] + 1e-6)
+            removed = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ? "
+                "GROUP BY status",
+                (cutoff,)
+            ).fetchall())
+            if removed:
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+                )
+                self._conn.commit()
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
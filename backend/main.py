@@ -1,14 +1,14 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import subprocess
 import os
+import sys
 import json
-import threading
-import requests
 import re
+import threading
 from pathlib import Path
-from typing import Optional
 from dotenv import load_dotenv
 
 # Carregar variáveis de ambiente do .env
@@ -22,7 +22,9 @@ from models import (
     SavePromptResponseRequest, SavePromptResponseResponse,
     BrowseRequest, BrowseResponse, BrowseItem
 )
-from job_queue import JobQueue, JobStatus
+from job_queue import JobQueue, JobStatus, JobPriority
+from scheduler import JobScheduler
+from webhooks import WebhookDispatcher
 
 app = FastAPI(title="Ragatanga RAG API")
 
@@ -35,13 +37,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Inicializar fila
+# Inicializar fila (persistida em SQLite, ver job_store.py)
 job_queue = JobQueue()
 
 # Diretório do projeto
 PROJECT_ROOT = Path(__file__).parent.parent.resolve()
 VENV_PYTHON = PROJECT_ROOT / ".venv" / "bin" / "python"
-CLI_SCRIPT = PROJECT_ROOT / "src" / "cli.py"
+
+# Módulos de src/ são importados em processo
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+
+from engine import RagEngine
+from index import run_index_all
+from postprocess import PostProcessor, reindex_chat_history
+
+# Motor RAG do processo: embeddings, LLM e vectorstores ficam aquecidos entre requisições
+rag_engine = RagEngine()
+# Tempo máximo que o pós-processamento espera por uma reindexação na fila
+REINDEX_JOB_WAIT = float(os.getenv("REINDEX_JOB_WAIT", "600"))
+# Marcado no encerramento: reindexações pendentes ficam gravadas na fila, sem espera
+shutting_down = threading.Event()
+
+def queue_reindex(base_dir: str):
+    """
+    Reindexação do pós-processamento como job de manutenção: roda com as vagas
+    de manutenção do BASE_DIR, sem segurar o chat, e a espera é limitada a
+    REINDEX_JOB_WAIT segundos. No encerramento, o job só é enfileirado (é
+    retomado no próximo início por JobQueue.recover).
+    """
+    # Sem prazo: uma reindexação longa não falha por tempo (cancelar a interrompe entre arquivos)
+    job_id = scheduler.submit("reindex", base_dir, priority=JobPriority.MAINTENANCE, timeout=0)
+    job = job_queue.get_job(job_id)
+    if not job.done.wait(0 if shutting_down.is_set() else REINDEX_JOB_WAIT):
+        print(f"⏳ Reindexação de {base_dir} segue na fila (job {job_id})")
+        return
+    job = job_queue.get_job(job_id)
+    if job.status == JobStatus.FAILED:
+        raise RuntimeError(job.error)
+
+# Título, histórico e reindexação rodam em background, depois da resposta
+postprocessor = PostProcessor(rag_engine, reindex=queue_reindex)
+
+# Tempo máximo que o stream espera pelo título antes de encerrar
+STREAM_TITLE_TIMEOUT = float(os.getenv("STREAM_TITLE_TIMEOUT", "30"))
 
 def validate_path(path: str) -> Path:
     """Valida e retorna path absoluto, prevenindo path traversal"""
@@ -54,139 +92,139 @@ def validate_path(path: str) -> Path:
     except Exception as e:
         raise ValueError(f"Path inválido: {e}")
 
-def execute_cli_command(command: str, base_dir: str, question: Optional[str] = None, webhook_url: Optional[str] = None, job_id: Optional[str] = None):
-    """Executa comando CLI e retorna resultado"""
-    base_dir_path = validate_path(base_dir)
-    env = dict(**os.environ, BASE_DIR=str(base_dir_path))
-    
-    cmd = [str(VENV_PYTHON), str(CLI_SCRIPT), "--base-dir", str(base_dir_path)]
-    
-    if command == "chat":
-        cmd.append("chat")
-        if question:
-            cmd.extend(["-q", question, "--json"])
-    elif command == "prompt":
-        cmd.append("prompt")
-    else:
-        raise ValueError(f"Comando desconhecido: {command}")
-    
-    # Se webhook_url fornecido, executar em background
-    if webhook_url:
-        # Usar o webhook_url fornecido (já inclui job_id no query param)
-        cmd.extend(["--webhook-url", webhook_url])
-        if job_id:
-            cmd.extend(["--job-id", job_id])
-        
-        # Executar em background (não esperar)
-        subprocess.Popen(cmd, env=env)
-        return {"success": True, "data": {"status": "started", "job_id": job_id}}
-    
+def run_chat(base_dir: str, question: str, cancel=None, with_title=False, **retrieval_options) -> dict:
+    """
+    Responde uma pergunta em processo; título e histórico ficam para o pós-processamento.
+    Com with_title, espera o título do pós-processamento (até STREAM_TITLE_TIMEOUT segundos).
+    Se cancel (threading.Event) for marcado, a geração para no próximo token (AnswerCancelled).
+    """
+    base_dir_path = str(validate_path(base_dir))
+    result = rag_engine.answer(base_dir_path, question, with_title=False, cancel=cancel, **retrieval_options)
+    future = postprocessor.submit(base_dir_path, question, result["message"], sources=result["sources"])
+    if with_title:
+        try:
+            result["title"] = future.result(timeout=STREAM_TITLE_TIMEOUT)["title"]
+        except Exception:
+            pass
+    return result
+
+def sse_event(event: str, data: dict) -> str:
+    """Formata um evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_chat(base_dir: str, question: str, **retrieval_options):
+    """Gera os eventos SSE de uma resposta em fluxo e salva o histórico ao final"""
     try:
-        result = subprocess.run(
-            cmd,
-            env=env,
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minutos timeout
-        )
-        
-        if result.returncode == 0:
-            if command == "chat" and question:
-                try:
-                    output = json.loads(result.stdout)
-                    return {"success": True, "data": output}
-                except json.JSONDecodeError:
-                    return {"success": True, "data": {"message": result.stdout}}
-            return {"success": True, "data": result.stdout}
-        else:
-            return {"success": False, "error": result.stderr or "Erro desconhecido"}
-    except subprocess.TimeoutExpired:
-        return {"success": False, "error": "Timeout ao executar comando"}
-    except Exception as e:
-        return {"success": False, "error": str(e)}
-
-def process_queue():
-    """Processa a fila de jobs sequencialmente"""
-    while True:
-        if not job_queue.queue.empty():
-            with job_queue.lock:
-                if job_queue.processing:
-                    continue
-                job_queue.processing = True
-            
+        base_dir_path = str(validate_path(base_dir))
+        answer = None
+        events = rag_engine.stream_answer(base_dir_path, question, with_title=False, **retrieval_options)
+        try:
+            for item in events:
+                if item["event"] == "answer":
+                    answer = item["data"]
+                yield sse_event(item["event"], item["data"])
+        finally:
+            # Cliente desconectado: fecha já o fluxo do LLM em vez de esperar o coletor de lixo
+            events.close()
+        if answer is not None:
+            # A resposta já foi entregue; o título vem do pós-processamento
+            future = postprocessor.submit(base_dir_path, question, answer["message"], sources=answer["sources"])
             try:
-                job_id = job_queue.queue.get(timeout=1)
-                job = job_queue.get_job(job_id)
-                
-                if not job:
-                    continue
-                
-                job_queue.update_job_status(job_id, JobStatus.PROCESSING)
-                
-                # Construir webhook URL interno que atualiza o job
-                webhook_url = f"http://localhost:8000/api/webhook?job_id={job_id}"
-                
-                # Executar comando com webhook (em background)
-                # O CLI executará em background e chamará o webhook quando terminar
-                execute_cli_command(
-                    job.command,
-                    job.base_dir,
-                    job.question,
-                    webhook_url,
-                    job_id
-                )
-                
-                # Aguardar até o job completar antes de processar próximo
-                # Polling do status do job
-                import time
-                max_wait = 300  # 5 minutos máximo
-                waited = 0
-                while waited < max_wait:
-                    updated_job = job_queue.get_job(job_id)
-                    if updated_job and updated_job.status in [JobStatus.COMPLETED, JobStatus.FAILED]:
-                        break
-                    time.sleep(1)
-                    waited += 1
-            except Exception as e:
-                print(f"Erro ao processar fila: {e}")
-            finally:
-                with job_queue.lock:
-                    job_queue.processing = False
-        else:
-            import time
-            time.sleep(0.5)
-
-# Iniciar thread de processamento da fila
-queue_thread = threading.Thread(target=process_queue, daemon=True)
-queue_thread.start()
+                title = future.result(timeout=STREAM_TITLE_TIMEOUT)["title"]
+                yield sse_event("title", {"title": title})
+            except Exception:
+                pass
+        yield sse_event("done", {"status": "completed"})
+    except Exception as e:
+        yield sse_event("error", {"error": str(e) or "Erro ao processar chat"})
+
+def run_job(job):
+    """Executa um job da fila em processo e retorna seu resultado"""
+    if job.command == "chat":
+        if not job.question:
+            raise ValueError("Job de chat sem pergunta")
+        # Job.done marcado durante a execução (cancelamento, prazo) interrompe o LLM;
+        # o resultado enviado ao webhook inclui o título
+        return run_chat(job.base_dir, job.question, cancel=job.done, with_title=True, **job.options)
+    if job.command == "reindex":
+        # Job.done marcado (cancelamento) interrompe a indexação entre um arquivo e outro,
+        # sem gravar o índice
+        base_dir_path = str(validate_path(job.base_dir))
+        if job.options.get("scope") == "all":
+            # /api/reindex: raiz e todos os shards
+            stats = run_index_all(
+                base_dir_path, partial=job.options.get("partial", False), silent=True, cancel=job.done
+            )
+            return {"status": "reindexed", "stats": stats}
+        # Pós-processamento: só o índice que contém o chat_history/
+        reindex_chat_history(base_dir_path, cancel=job.done)
+        return {"status": "reindexed"}
+    raise ValueError(f"Comando desconhecido: {job.command}")
+
+# Webhooks externos são entregues em background, com novas tentativas
+webhooks = WebhookDispatcher()
+# Jobs rodam em paralelo, limitados no total e por BASE_DIR (ver scheduler.py)
+scheduler = JobScheduler(job_queue, run_job, on_finish=webhooks.dispatch_job)
+# Jobs que aguardavam quando o servidor parou voltam para a fila
+scheduler.resume(job_queue.recover())
+
+@app.on_event("shutdown")
+def flush_postprocessing():
+    """Conclui históricos pendentes e reindexações agendadas antes de encerrar"""
+    # As reindexações pendentes do pós-processamento vão para a fila sem espera
+    # (as que não rodarem agora são retomadas no próximo início)
+    shutting_down.set()
+    postprocessor.shutdown(wait=True)
+    scheduler.shutdown(wait=False)
+    webhooks.shutdown(wait=True)
 
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """Endpoint de chat"""
     if request.webhook_url:
         # Modo assíncrono: adicionar à fila
-        job_id = job_queue.add_job(
+        try:
+            priority = JobPriority(request.priority or JobPriority.INTERACTIVE.value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"priority inválida: {request.priority}")
+        job_id = scheduler.submit(
             "chat",
             request.base_dir,
             request.question,
-            request.webhook_url
+            request.webhook_url,
+            options={"mmr": request.mmr, "mmr_lambda": request.mmr_lambda},
+            priority=priority,
+            timeout=request.timeout
         )
         return ChatResponse(
             job_id=job_id,
             status="queued"
         )
     else:
-        # Modo síncrono: executar imediatamente
-        result = execute_cli_command("chat", request.base_dir, request.question)
-        if result["success"]:
-            data = result["data"]
-            return ChatResponse(
-                answer=data.get("message", ""),
-                sources=data.get("sources", []),
-                status="completed"
+        # Modo síncrono: executar imediatamente no motor em processo
+        try:
+            data = await run_in_threadpool(
+                run_chat, request.base_dir, request.question, mmr=request.mmr, mmr_lambda=request.mmr_lambda
             )
-        else:
-            raise HTTPException(status_code=500, detail=result.get("error", "Erro ao processar chat"))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e) or "Erro ao processar chat")
+        return ChatResponse(
+            answer=data.get("message", ""),
+            sources=data.get("sources", []),
+            status="completed"
+        )
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Chat em fluxo (Server-Sent Events): envia `sources` primeiro, depois cada
+    `token` gerado, a resposta completa em `answer`, o `title` e por fim `done`.
+    """
+    return StreamingResponse(
+        stream_chat(request.base_dir, request.question, mmr=request.mmr, mmr_lambda=request.mmr_lambda),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/api/prompt", response_model=PromptResponse)
 async def generate_prompt(request: PromptRequest):
@@ -194,9 +232,6 @@ async def generate_prompt(request: PromptRequest):
     base_dir_path = validate_path(request.base_dir)
     
     # Importar e usar prompt_preview.py
-    import sys
-    sys.path.insert(0, str(PROJECT_ROOT / "src"))
-    
     from prompt_preview import generate_prompt_markdown
     
     try:
@@ -206,7 +241,9 @@ async def generate_prompt(request: PromptRequest):
             base_dir=str(base_dir_path),
             retriever_k=request.retriever_k,
             chat_history_path=request.chat_history_path,
-            chat_span=request.chat_span
+            chat_span=request.chat_span,
+            mmr=request.mmr,
+            mmr_lambda=request.mmr_lambda
         )
         return PromptResponse(markdown=markdown)
     except Exception as e:
@@ -268,7 +305,10 @@ async def generate_template_prompt(request: TemplateRequest):
 
 @app.post("/api/webhook")
 async def webhook(request: Request):
-    """Endpoint para receber callbacks do CLI"""
+    """
+    Endpoint para receber callbacks do CLI (`cli.py --webhook-url`).
+    Os jobs da fila rodam em processo e não passam por aqui; mantido por compatibilidade.
+    """
     # job_id pode vir do query param
     query_params = dict(request.query_params)
     target_job_id = query_params.get("job_id")
@@ -297,38 +337,22 @@ async def webhook(request: Request):
     # Atualizar status do job
     if status == "success":
         print(f"Webhook recebido - Job {target_job_id} completado. Result: {result_data}")
-        job_queue.update_job_status(
+        updated = job_queue.update_job_status(
             target_job_id,
             JobStatus.COMPLETED,
             result=result_data
         )
     else:
         print(f"Webhook recebido - Job {target_job_id} falhou. Error: {error_data}")
-        job_queue.update_job_status(
+        updated = job_queue.update_job_status(
             target_job_id,
             JobStatus.FAILED,
             error=error_data or "Erro desconhecido"
         )
     
-    # Se o job tinha webhook_url externo, chamá-lo
-    if job.webhook_url and not job.webhook_url.startswith("http://localhost:8000"):
-        try:
-            webhook_payload = {
-                "status": status,
-                "job_id": target_job_id
-            }
-            if result_data:
-                webhook_payload["result"] = result_data
-            if error_data:
-                webhook_payload["error"] = error_data
-            
-            requests.post(
-                job.webhook_url,
-                json=webhook_payload,
-                timeout=10
-            )
-        except Exception as e:
-            print(f"Erro ao chamar webhook externo: {e}")
+    # Se o job tinha webhook_url externo, chamá-lo (em background)
+    if updated:
+        webhooks.dispatch_job(job)
     
     return {"status": "received", "job_id": target_job_id}
 
@@ -348,6 +372,9 @@ async def get_job_status(job_id: str):
     response = {
         "job_id": job.job_id,
         "status": job.status.value,
+        "priority": job.priority.value,
+        # Segundos na fila antes de começar (None enquanto aguarda)
+        "queue_wait": job.queue_wait,
         "result": job.result,
         "error": job.error
     }
@@ -356,7 +383,11 @@ async def get_job_status(job_id: str):
 
 @app.post("/api/queue/job/{job_id}/cancel")
 async def cancel_job(job_id: str):
-    """Cancela um job"""
+    """
+    Cancela um job. Um chat em execução para no próximo token; uma reindexação,
+    entre um arquivo e outro (sem gravar o índice). A vaga é liberada quando a
+    execução de fato para.
+    """
     job = job_queue.get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job não encontrado")
@@ -368,7 +399,13 @@ async def cancel_job(job_id: str):
             detail=f"Job não pode ser cancelado. Status atual: {job.status.value}"
         )
     
-    job_queue.update_job_status(job_id, JobStatus.CANCELLED, error="Cancelado pelo usuário")
+    if not job_queue.update_job_status(job_id, JobStatus.CANCELLED, error="Cancelado pelo usuário"):
+        # Terminou entre a consulta e o cancelamento
+        job = job_queue.get_job(job_id)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Job não pode ser cancelado. Status atual: {job.status.value}"
+        )
     
     return {
         "job_id": job_id,
@@ -526,7 +563,11 @@ async def get_chat_history(request: ChatHistoryRequest):
 
 @app.post("/api/reindex", response_model=ReindexResponse)
 async def reindex(request: ReindexRequest):
-    """Reindexa arquivos usando index.py"""
+    """
+    Reindexa a raiz e os shards do BASE_DIR como job de manutenção da fila:
+    nunca roda junto com a reindexação do pós-processamento do mesmo BASE_DIR
+    (vagas de manutenção, ver scheduler.py). Espera até REINDEX_JOB_WAIT segundos.
+    """
     # Se base_dir não fornecido, usar o padrão do constants.py
     if request.base_dir:
         base_dir_path = validate_path(request.base_dir)
@@ -539,50 +580,34 @@ async def reindex(request: ReindexRequest):
         if not base_dir_path.exists():
             raise HTTPException(status_code=400, detail=f"BASE_DIR padrão não existe: {DEFAULT_BASE_DIR}")
     
-    # Preparar ambiente com BASE_DIR
-    env = dict(os.environ)
-    env['BASE_DIR'] = str(base_dir_path)
-    
-    # Preparar comando para index.py
-    index_script = (PROJECT_ROOT / "src" / "index.py").resolve()
-    venv_python = VENV_PYTHON
-    
-    cmd = [str(venv_python), str(index_script)]
-    
-    # Adicionar flag --partial se solicitado
-    if request.partial:
-        cmd.append("--partial")
-    
-    try:
-        result = subprocess.run(
-            cmd,
-            env=env,
-            capture_output=True,
-            text=True,
-            cwd=str(PROJECT_ROOT),
-            timeout=600  # 10 minutos timeout para indexação
-        )
-        
-        if result.returncode == 0:
-            return ReindexResponse(
-                success=True,
-                message="Indexação concluída com sucesso",
-                output=result.stdout
-            )
-        else:
-            return ReindexResponse(
-                success=False,
-                message="Erro ao executar indexação: " + str(cmd) + str(VENV_PYTHON), 
-                error=result.stderr or result.stdout
-            )
-    except subprocess.TimeoutExpired:
+    # Sem prazo: uma reindexação longa não falha por tempo (cancelar a interrompe entre arquivos)
+    job_id = scheduler.submit(
+        "reindex",
+        str(base_dir_path),
+        options={"scope": "all", "partial": request.partial},
+        priority=JobPriority.MAINTENANCE,
+        timeout=0
+    )
+    job = job_queue.get_job(job_id)
+    if not await run_in_threadpool(job.done.wait, REINDEX_JOB_WAIT):
         return ReindexResponse(
             success=False,
-            message="Indexação expirou (timeout de 10 minutos)",
-            error="Processo demorou mais de 10 minutos para completar"
+            message=f"Indexação segue na fila (job {job_id}); acompanhe em /api/queue/job/{job_id}",
+            error=f"Indexação não terminou em {REINDEX_JOB_WAIT:.0f} segundos"
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao executar indexação: {str(e)}")
+    
+    job = job_queue.get_job(job_id)
+    if job.status == JobStatus.COMPLETED:
+        return ReindexResponse(
+            success=True,
+            message="Indexação concluída com sucesso",
+            output=json.dumps(job.result.get("stats"), ensure_ascii=False)
+        )
+    return ReindexResponse(
+        success=False,
+        message="Erro ao executar indexação",
+        error=job.error
+    )
 
 @app.post("/api/prompt/save-response", response_model=SavePromptResponseResponse)
 async def save_prompt_response(request: SavePromptResponseRequest):
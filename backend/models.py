@@ -1,10 +1,14 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
 class ChatRequest(BaseModel):
     question: str
     base_dir: str
     webhook_url: Optional[str] = None
+    mmr: Optional[bool] = None  # padrão: MMR do .env
+    mmr_lambda: Optional[float] = Field(None, ge=0.0, le=1.0)
+    priority: Optional[str] = None  # fila: interactive (padrão), batch ou maintenance
+    timeout: Optional[float] = Field(None, ge=0)  # fila: prazo de execução em segundos (padrão: JOB_TIMEOUT; 0 = sem prazo)
 
 class ChatResponse(BaseModel):
     answer: Optional[str] = None
@@ -18,6 +22,8 @@ class PromptRequest(BaseModel):
     retriever_k: Optional[int] = 16
     chat_history_path: Optional[str] = None
     chat_span: Optional[int] = None  # horas
+    mmr: Optional[bool] = None  # padrão: MMR do .env
+    mmr_lambda: Optional[float] = Field(None, ge=0.0, le=1.0)
 
 class PromptResponse(BaseModel):
     markdown: str
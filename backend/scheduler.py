@@ -0,0 +1,274 @@
+"""
+Escalonador de jobs da fila do backend.
+
+Substitui a antiga thread que processava um job por vez (girando em
+queue.empty() e consultando o status de cada job a cada segundo). Aqui os
+jobs rodam em paralelo, limitados por:
+- JOB_WORKERS: jobs em execução ao mesmo tempo, no total
+- JOB_WORKERS_PER_BASE_DIR: jobs em execução ao mesmo tempo por BASE_DIR
+- JOB_MAINTENANCE_PER_BASE_DIR: jobs maintenance em execução ao mesmo tempo
+  por BASE_DIR, contados à parte: uma reindexação não ocupa a vaga do chat
+
+Um job lento de um BASE_DIR não segura a fila dos outros. Não há thread de
+despacho nem polling: jobs são despachados quando entram na fila e quando um
+job em execução termina. Os jobs rodam em processo, nas threads do
+escalonador, e são concluídos diretamente com o valor retornado por run_job
+(Job.done é sinalizado por JobQueue.update_job_status).
+
+Ordem de despacho:
+- Classes de prioridade (JobPriority): um job interactive sempre passa na
+  frente de batch, que passa na frente de maintenance. JOB_RESERVED_INTERACTIVE
+  vagas ficam livres só para interactive, para que lotes e reindexações não
+  ocupem todos os workers quando um usuário pergunta.
+- Dentro de cada classe, weighted fair queueing entre BASE_DIRs: cada job
+  recebe uma etiqueta de término virtual (início + 1 / peso do BASE_DIR) e sai
+  primeiro o de menor etiqueta. Uma rajada de jobs de um BASE_DIR intercala
+  com os dos outros em vez de passar na frente deles. Pesos em
+  JOB_BASE_DIR_WEIGHTS ("/caminho/a=3,/caminho/b=1"; padrão 1).
+
+Cancelamento e prazos: cancelar um job (ou estourar seu prazo, JOB_TIMEOUT
+segundos de execução, contados a partir do início e não da entrada na fila) o
+marca como terminado, o que sinaliza Job.done. Um job aguardando é descartado;
+um job em execução recebe Job.done como sinal de parada, que run_job precisa
+observar: o chat fecha o fluxo do LLM no próximo token e a reindexação para
+entre um arquivo e outro. A vaga só é liberada quando run_job retorna. Os
+prazos são vigiados por uma única thread, que dorme até o próximo vencimento.
+"""
+import heapq
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from job_queue import Job, JobPriority, JobQueue, JobStatus
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 1 mantém os jobs de um mesmo BASE_DIR em sequência (índice e histórico compartilhados)
+JOB_WORKERS_PER_BASE_DIR = int(os.getenv("JOB_WORKERS_PER_BASE_DIR", "1"))
+# Vagas próprias dos jobs maintenance por BASE_DIR (1 mantém as reindexações de um BASE_DIR em sequência)
+JOB_MAINTENANCE_PER_BASE_DIR = int(os.getenv("JOB_MAINTENANCE_PER_BASE_DIR", "1"))
+# Prazo padrão de um job, em segundos desde o início da execução (0 = sem prazo)
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))
+# Vagas que só jobs interactive podem ocupar (sempre sobra ao menos uma para as outras classes)
+JOB_RESERVED_INTERACTIVE = int(os.getenv("JOB_RESERVED_INTERACTIVE", "1"))
+
+
+def _base_dir_key(base_dir: str) -> str:
+    return str(Path(base_dir).expanduser().resolve())
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    """Lê "caminho=peso,caminho=peso" (pesos inválidos ou não positivos são ignorados)"""
+    weights = {}
+    for item in text.split(","):
+        path, _, weight = item.rpartition("=")
+        try:
+            value = float(weight)
+        except ValueError:
+            continue
+        if path.strip() and value > 0:
+            weights[_base_dir_key(path.strip())] = value
+    return weights
+
+
+JOB_BASE_DIR_WEIGHTS = parse_weights(os.getenv("JOB_BASE_DIR_WEIGHTS", ""))
+
+
+class JobScheduler:
+    """
+    Executa os jobs de um JobQueue com concorrência global e por BASE_DIR.
+
+    run_job(job) executa o job e retorna seu resultado (COMPLETED); uma exceção
+    marca o job como FAILED. on_finish(job), se fornecido, é chamado depois que
+    o job termina com COMPLETED ou FAILED, inclusive por prazo (ex.: webhook
+    externo); jobs cancelados pelo usuário não são notificados.
+    """
+
+    def __init__(self, job_queue: JobQueue, run_job: Callable[[Job], Optional[dict]],
+                 max_workers: Optional[int] = None, per_base_dir: Optional[int] = None,
+                 on_finish: Optional[Callable[[Job], None]] = None,
+                 reserved_interactive: Optional[int] = None, weights: Optional[Dict[str, float]] = None,
+                 maintenance_per_base_dir: Optional[int] = None):
+        self.job_queue = job_queue
+        self.run_job = run_job
+        self.on_finish = on_finish
+        self.max_workers = max(1, max_workers or JOB_WORKERS)
+        self.per_base_dir = max(1, per_base_dir or JOB_WORKERS_PER_BASE_DIR)
+        self.maintenance_per_base_dir = max(1, maintenance_per_base_dir or JOB_MAINTENANCE_PER_BASE_DIR)
+        reserved = JOB_RESERVED_INTERACTIVE if reserved_interactive is None else reserved_interactive
+        self.reserved_interactive = max(0, min(reserved, self.max_workers - 1))
+        self.weights = JOB_BASE_DIR_WEIGHTS if weights is None else weights
+        self._lock = threading.Lock()
+        # Classe -> BASE_DIR -> fila de (término virtual, início virtual, job_id)
+        self._waiting = {priority: {} for priority in JobPriority}
+        # Classe -> tempo virtual (início virtual do último job despachado)
+        self._virtual_time = {priority: 0.0 for priority in JobPriority}
+        # (classe, BASE_DIR) -> término virtual do último job enfileirado
+        self._last_finish = {}
+        # (BASE_DIR resolvido, é manutenção) -> jobs em execução
+        self._running = {}
+        self._active = 0
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        # Heap de (prazo, job_id), vigiado por _watch_deadlines
+        self._deadlines = []
+        self._deadlines_changed = threading.Condition(threading.Lock())
+        self._watchdog = threading.Thread(target=self._watch_deadlines, name="job-deadlines", daemon=True)
+        self._watchdog.start()
+
+    def submit(self, command: str, base_dir: str, question: Optional[str] = None,
+               webhook_url: Optional[str] = None, options: Optional[dict] = None,
+               priority: JobPriority = JobPriority.INTERACTIVE, timeout: Optional[float] = None) -> str:
+        """
+        Adiciona um job à fila, despacha o que couber e retorna o job_id.
+        timeout: prazo de execução em segundos, contado a partir do início
+            (padrão: JOB_TIMEOUT; 0 = sem prazo)
+        """
+        timeout = JOB_TIMEOUT if timeout is None else timeout
+        job_id = self.job_queue.add_job(command, base_dir, question, webhook_url, options, priority, timeout)
+        with self._lock:
+            self._enqueue(self.job_queue.get_job(job_id))
+            self._dispatch()
+        return job_id
+
+    def resume(self, job_ids):
+        """Recoloca na fila jobs PENDING já registrados (ex.: JobQueue.recover após reinício)"""
+        with self._lock:
+            for job_id in job_ids:
+                job = self.job_queue.get_job(job_id)
+                if job:
+                    self._enqueue(job)
+            self._dispatch()
+
+    def _enqueue(self, job: Job):
+        """Etiqueta o job com seu término virtual e o coloca na fila do BASE_DIR (chamado com o lock)"""
+        base_dir = _base_dir_key(job.base_dir)
+        key = (job.priority, base_dir)
+        start = max(self._virtual_time[job.priority], self._last_finish.get(key, 0.0))
+        finish = start + 1.0 / self.weights.get(base_dir, 1.0)
+        self._last_finish[key] = finish
+        self._waiting[job.priority].setdefault(base_dir, deque()).append((finish, start, job.job_id))
+
+    def _slot(self, priority: JobPriority, base_dir: str):
+        """Chave do limite por BASE_DIR: jobs maintenance têm vagas próprias"""
+        return base_dir, priority == JobPriority.MAINTENANCE
+
+    def _has_slot(self, priority: JobPriority, base_dir: str) -> bool:
+        limit = self.maintenance_per_base_dir if priority == JobPriority.MAINTENANCE else self.per_base_dir
+        return self._running.get(self._slot(priority, base_dir), 0) < limit
+
+    def _watch(self, job: Job):
+        """Passa o prazo de um job que começou para a thread de prazos"""
+        if job.deadline is not None:
+            with self._deadlines_changed:
+                heapq.heappush(self._deadlines, (job.deadline, job.job_id))
+                self._deadlines_changed.notify()
+
+    def _watch_deadlines(self):
+        """Marca como FAILED os jobs em execução cujo prazo venceu e notifica o término"""
+        while True:
+            with self._deadlines_changed:
+                while not self._closed:
+                    if not self._deadlines:
+                        self._deadlines_changed.wait()
+                        continue
+                    remaining = self._deadlines[0][0] - time.time()
+                    if remaining <= 0:
+                        break
+                    self._deadlines_changed.wait(remaining)
+                if self._closed:
+                    return
+                _, job_id = heapq.heappop(self._deadlines)
+            job = self.job_queue.jobs.get(job_id)
+            if job is None:
+                # Já terminou
+                continue
+            if self.job_queue.update_job_status(job_id, JobStatus.FAILED, error=f"Timeout: job excedeu o prazo de {job.timeout:.3g}s"):
+                print(f"⏱️ Job {job_id} excedeu o prazo de {job.timeout:.3g}s")
+                # run_job ainda está parando; o término já vale para quem aguarda o webhook
+                self._notify(job)
+
+    def _next_job(self) -> Optional[Job]:
+        """Retira o próximo job a executar, ou None se nenhum cabe nos limites (chamado com o lock)"""
+        for priority in JobPriority:
+            if priority != JobPriority.INTERACTIVE and self._active >= self.max_workers - self.reserved_interactive:
+                break
+            queues = self._waiting[priority]
+            while queues:
+                candidates = [
+                    (queue[0], base_dir) for base_dir, queue in queues.items()
+                    if self._has_slot(priority, base_dir)
+                ]
+                if not candidates:
+                    break
+                (finish, start, job_id), base_dir = min(candidates)
+                queue = queues[base_dir]
+                queue.popleft()
+                if not queue:
+                    del queues[base_dir]
+                job = self.job_queue.get_job(job_id)
+                if not job or job.status != JobStatus.PENDING:
+                    # Cancelado enquanto aguardava
+                    continue
+                self._virtual_time[priority] = start
+                return job
+        return None
+
+    def _dispatch(self):
+        """Inicia os jobs aguardando que cabem nos limites (chamado com o lock)"""
+        if self._closed:
+            return
+        while self._active < self.max_workers:
+            job = self._next_job()
+            if job is None:
+                break
+            slot = self._slot(job.priority, _base_dir_key(job.base_dir))
+            self._running[slot] = self._running.get(slot, 0) + 1
+            self._active += 1
+            self.job_queue.update_job_status(job.job_id, JobStatus.PROCESSING)
+            self._watch(job)
+            self._executor.submit(self._run, job)
+
+    def _run(self, job: Job):
+        try:
+            result = self.run_job(job)
+            finished = self.job_queue.update_job_status(job.job_id, JobStatus.COMPLETED, result=result)
+        except Exception as e:
+            finished = self.job_queue.update_job_status(job.job_id, JobStatus.FAILED, error=str(e) or "Erro desconhecido")
+            if finished:
+                print(f"❌ Erro ao executar job {job.job_id}: {e}")
+            else:
+                print(f"⏹️ Job {job.job_id} interrompido ({job.status.value})")
+        finally:
+            slot = self._slot(job.priority, _base_dir_key(job.base_dir))
+            with self._lock:
+                self._active -= 1
+                self._running[slot] -= 1
+                if not self._running[slot]:
+                    del self._running[slot]
+                self._dispatch()
+        # Jobs cancelados ou vencidos durante a execução já foram tratados por quem os terminou
+        if finished:
+            self._notify(job)
+
+    def _notify(self, job: Job):
+        if self.on_finish:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                print(f"⚠️ Erro ao notificar término do job {job.job_id}: {e}")
+
+    def shutdown(self, wait: bool = False):
+        """Para de despachar; jobs em execução terminam se wait=True"""
+        with self._lock:
+            self._closed = True
+        with self._deadlines_changed:
+            self._deadlines_changed.notify()
+        self._executor.shutdown(wait=wait)
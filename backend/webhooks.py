@@ -0,0 +1,91 @@
+"""
+Entrega dos webhooks externos dos jobs.
+
+O resultado de um job é enviado ao webhook_url informado pelo cliente em
+background, sem segurar o worker do job. As conexões vêm de um pool
+(requests.Session) reaproveitado entre entregas; falhas de rede, 429 e 5xx são
+tentadas de novo com espera exponencial.
+"""
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from job_queue import Job, JobStatus
+
+load_dotenv()
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+# Novas tentativas após a primeira falha
+WEBHOOK_RETRIES = int(os.getenv("WEBHOOK_RETRIES", "3"))
+# Espera antes da primeira nova tentativa (dobra a cada uma)
+WEBHOOK_BACKOFF = float(os.getenv("WEBHOOK_BACKOFF", "1"))
+
+
+def job_payload(job: Job) -> dict:
+    """Corpo do webhook de um job terminado (mesmo formato do /api/webhook)"""
+    payload = {
+        "status": "success" if job.status == JobStatus.COMPLETED else "error",
+        "job_id": job.job_id
+    }
+    if job.result:
+        payload["result"] = job.result
+    if job.error:
+        payload["error"] = job.error
+    return payload
+
+
+class WebhookDispatcher:
+    """Envia webhooks em background, com pool de conexões e novas tentativas"""
+
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None,
+                 retries: Optional[int] = None, backoff: Optional[float] = None):
+        workers = max(1, workers or WEBHOOK_WORKERS)
+        self.timeout = WEBHOOK_TIMEOUT if timeout is None else timeout
+        self.retries = WEBHOOK_RETRIES if retries is None else retries
+        self.backoff = WEBHOOK_BACKOFF if backoff is None else backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webhook")
+
+    def dispatch(self, url: str, payload: dict) -> Future:
+        """Agenda a entrega; o Future resolve para True se o webhook aceitou"""
+        return self._executor.submit(self._deliver, url, payload)
+
+    def dispatch_job(self, job: Job) -> Optional[Future]:
+        """Envia o resultado de job ao seu webhook_url, se houver"""
+        if not job.webhook_url:
+            return None
+        return self.dispatch(job.webhook_url, job_payload(job))
+
+    def _deliver(self, url: str, payload: dict) -> bool:
+        delay = self.backoff
+        attempts = self.retries + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+                if response.status_code < 400:
+                    return True
+                error = f"HTTP {response.status_code}"
+                if response.status_code < 500 and response.status_code != 429:
+                    # Erro do cliente: repetir não muda a resposta
+                    break
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt < attempts:
+                time.sleep(delay)
+                delay *= 2
+        print(f"❌ Erro ao chamar webhook {url} (job {payload.get('job_id')}, {attempt} tentativa(s)): {error}")
+        return False
+
+    def shutdown(self, wait: bool = True):
+        """Conclui (wait=True) as entregas pendentes e fecha o pool de conexões"""
+        self._executor.shutdown(wait=wait)
+        self.session.close()
@@ -0,0 +1,128 @@
+"""
+Cache semântico de respostas.
+
+Guarda respostas (com as fontes) indexadas pelo embedding da pergunta. Uma nova
+pergunta cujo embedding tenha similaridade de cosseno >= ANSWER_CACHE_THRESHOLD
+com uma pergunta em cache recebe a resposta armazenada, sem recuperação nem LLM.
+
+As respostas são separadas também pelas opções de recuperação (modo de busca,
+MMR): uma pergunta com MMR não recebe a resposta montada sem ele.
+
+As entradas valem para uma versão do corpus (`corpus_version` gravado pelo
+index.py em .rag_index_meta.json): quando os documentos do BASE_DIR são
+reindexados, as respostas daquele BASE_DIR são descartadas. Reindexações que
+só acrescentam o chat_history/ não mudam a versão.
+"""
+import os
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+from manifest import read_index_meta
+from shards import index_dirs
+from vectorstore_cache import index_signature
+
+load_dotenv()
+
+# Desativado por padrão: ANSWER_CACHE=1 ativa
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "0") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+
+
+def _corpus_version(index_dir):
+    """Versão do corpus de um índice (assinatura dos arquivos para índices antigos)"""
+    version = read_index_meta(index_dir).get("corpus_version")
+    if version:
+        return version
+    return repr(index_signature(index_dir))
+
+
+def index_version(base_dir):
+    """Versão do corpus indexado em base_dir, combinando a raiz e os shards"""
+    return "|".join(_corpus_version(index_dir) for index_dir in index_dirs(base_dir))
+
+
+class AnswerCache:
+    """Respostas por BASE_DIR, buscadas por similaridade de cosseno da pergunta"""
+
+    def __init__(self, threshold=None, max_entries=None):
+        self.threshold = ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        self.max_entries = ANSWER_CACHE_SIZE if max_entries is None else max_entries
+        # (base_dir, opções) -> {"version": str, "vectors": ndarray (n, d) normalizado, "answers": [dict]}
+        self._stores = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _store(self, base_dir, options, version):
+        """Entradas de base_dir e opções para a versão atual, descartando versões antigas (exige self._lock)"""
+        store = self._stores.get((base_dir, options))
+        if store is None or store["version"] != version:
+            store = {"version": version, "vectors": None, "answers": []}
+            self._stores[(base_dir, options)] = store
+        return store
+
+    def lookup(self, base_dir, version, vector, options=()):
+        """
+        Retorna a resposta em cache mais próxima (acima do limiar), ou None.
+        options: opções de recuperação (tupla) com que a resposta foi gerada
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            store = self._store(base_dir, options, version)
+            if store["vectors"] is None or store["vectors"].shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            scores = store["vectors"] @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(store["answers"][best], similarity=float(scores[best]))
+
+    def store(self, base_dir, version, vector, answer, options=()):
+        """Guarda a resposta (dict com message e sources) para a pergunta de embedding `vector`"""
+        if self.max_entries <= 0:
+            return
+        row = self._normalize(vector)[np.newaxis, :]
+        with self._lock:
+            store = self._store(base_dir, options, version)
+            if store["vectors"] is None or store["vectors"].shape[1] != row.shape[1]:
+                store["vectors"] = row
+                store["answers"] = [answer]
+            else:
+                store["vectors"] = np.vstack([store["vectors"], row])
+                store["answers"].append(answer)
+            # Descarta as entradas mais antigas acima do limite
+            overflow = len(store["answers"]) - self.max_entries
+            if overflow > 0:
+                store["vectors"] = store["vectors"][overflow:]
+                store["answers"] = store["answers"][overflow:]
+
+    def invalidate(self, base_dir=None):
+        """Descarta as respostas de base_dir (ou todas)"""
+        with self._lock:
+            if base_dir is None:
+                self._stores.clear()
+            else:
+                for key in [key for key in self._stores if key[0] == base_dir]:
+                    del self._stores[key]
+
+    def stats(self):
+        """Resumo do estado do cache"""
+        with self._lock:
+            return {
+                "entries": sum(len(store["answers"]) for store in self._stores.values()),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses
+            }
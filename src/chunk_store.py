@@ -0,0 +1,327 @@
+"""
+Armazenamento dos chunks indexados (texto + metadados) em SQLite.
+
+Substitui o index.pkl do FAISS.save_local: em vez de desserializar todos os
+chunks antes da primeira pergunta, cada busca lê apenas os k documentos
+retornados pelo FAISS. A posição de cada vetor no índice -> id do chunk fica
+em index_ids.npy (array de bytes de largura fixa), mapeado em memória.
+
+Os chunks são endereçados pelo id (determinístico, ver manifest.chunk_id),
+então gravar chunks novos nunca afeta quem ainda está lendo a versão anterior
+do índice. Chunks removidos só saem do banco na gravação seguinte (ver
+ChunkStore.retain), quando nenhuma das duas últimas versões os referencia.
+
+O mesmo banco guarda o índice lexical (FTS5, ranking BM25) do texto e do
+caminho de cada chunk. Ele acompanha o índice vetorial, não os chunks gravados:
+só é atualizado depois que o novo index.faiss entra no lugar (ver
+ChunkStore.sync_lexical), de modo que uma indexação interrompida não deixa na
+busca lexical chunks que a busca vetorial não conhece.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+CHUNK_STORE_FILE = "chunks.sqlite"
+INDEX_IDS_FILE = "index_ids.npy"
+
+# Sublinhado faz parte dos termos: ERR_42, nomes_de_funcao
+_FTS_TOKENIZER = "unicode61 remove_diacritics 2 tokenchars '_'"
+
+# Termos da pergunta para a busca lexical (identificadores, nomes de arquivo)
+_QUERY_TERM = re.compile(r"\w[\w.\-/]*")
+
+
+def _fts_rowid(doc_id):
+    """Rowid estável (63 bits) do chunk no índice FTS5"""
+    return int.from_bytes(hashlib.sha1(doc_id.encode("utf-8")).digest()[:8], "big") >> 1
+
+
+def lexical_query(text):
+    """
+    Converte uma pergunta em uma consulta FTS5: termos entre aspas unidos por OR
+    (sem operadores do usuário). Retorna None se não houver termos.
+    """
+    terms = {term.strip(".-/") for term in _QUERY_TERM.findall(text)}
+    terms = sorted(term for term in terms if len(term) > 1)
+    if not terms:
+        return None
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _fts5_available():
+    try:
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        conn.close()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+FTS5_AVAILABLE = _fts5_available()
+
+
+class ChunkStore:
+    """Texto e metadados dos chunks por id, em SQLite"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._db = None
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                doc_id TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        self.lexical = FTS5_AVAILABLE
+        if self.lexical:
+            self._create_lexical_index()
+        self._conn.commit()
+
+    @property
+    def _conn(self):
+        """
+        Conexão com o banco, aberta sob demanda: depois de close(), uma busca
+        que ainda use este store (ex.: vectorstore descartado do cache no meio
+        dela) reabre a conexão em vez de falhar
+        """
+        if self._db is None:
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        return self._db
+
+    def _create_lexical_index(self):
+        """Cria o índice FTS5 (e o preenche, para bancos anteriores a ele)"""
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks_fts'"
+        ).fetchone()
+        if exists:
+            return
+        self._conn.execute(
+            f"""
+            CREATE VIRTUAL TABLE chunks_fts USING fts5(
+                doc_id UNINDEXED, content, source, tokenize = "{_FTS_TOKENIZER}"
+            )
+            """
+        )
+        rows = self._conn.execute(
+            "SELECT doc_id, content, json_extract(metadata, '$.source') FROM chunks"
+        ).fetchall()
+        self._conn.executemany(
+            "INSERT INTO chunks_fts (rowid, doc_id, content, source) VALUES (?, ?, ?, ?)",
+            ((_fts_rowid(doc_id), doc_id, content, source or "") for doc_id, content, source in rows)
+        )
+
+    def get(self, doc_id):
+        """Retorna o Document do chunk, ou None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, metadata FROM chunks WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return Document(id=doc_id, page_content=row[0], metadata=json.loads(row[1]))
+
+    def put_many(self, items):
+        """Grava chunks: items é um iterável de (id, Document); o índice lexical fica para sync_lexical"""
+        rows = [
+            (doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+            for doc_id, doc in items
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (doc_id, content, metadata) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def retain(self, doc_ids):
+        """Remove os chunks cujo id não está em doc_ids"""
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (doc_id TEXT PRIMARY KEY) WITHOUT ROWID")
+            self._conn.execute("DELETE FROM keep")
+            self._conn.executemany("INSERT OR IGNORE INTO keep (doc_id) VALUES (?)", ((doc_id,) for doc_id in doc_ids))
+            deleted = self._conn.execute(
+                "DELETE FROM chunks WHERE doc_id NOT IN (SELECT doc_id FROM keep)"
+            ).rowcount
+            self._conn.execute("DELETE FROM keep")
+            self._conn.commit()
+        return deleted
+
+    def sync_lexical(self, doc_ids):
+        """
+        Faz o índice lexical conter exatamente os chunks de doc_ids (os do
+        índice vetorial em uso), numa única transação.
+
+        Returns:
+            (chunks incluídos, chunks removidos)
+        """
+        if not self.lexical:
+            return 0, 0
+        with self._lock:
+            self._conn.create_function("fts_rowid", 1, _fts_rowid, deterministic=True)
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (doc_id TEXT PRIMARY KEY) WITHOUT ROWID")
+            self._conn.execute("DELETE FROM keep")
+            self._conn.executemany("INSERT OR IGNORE INTO keep (doc_id) VALUES (?)", ((doc_id,) for doc_id in doc_ids))
+            deleted = self._conn.execute(
+                "DELETE FROM chunks_fts WHERE doc_id NOT IN (SELECT doc_id FROM keep)"
+            ).rowcount
+            # O id do chunk deriva do texto: um chunk já presente no índice lexical não muda
+            added = self._conn.execute(
+                """
+                INSERT INTO chunks_fts (rowid, doc_id, content, source)
+                SELECT fts_rowid(c.doc_id), c.doc_id, c.content, COALESCE(json_extract(c.metadata, '$.source'), '')
+                FROM keep k JOIN chunks c ON c.doc_id = k.doc_id
+                WHERE NOT EXISTS (SELECT 1 FROM chunks_fts f WHERE f.rowid = fts_rowid(c.doc_id))
+                """
+            ).rowcount
+            self._conn.execute("DELETE FROM keep")
+            self._conn.commit()
+        return added, deleted
+
+    def search_lexical(self, text, k, doc_ids=None):
+        """
+        Busca BM25 no texto e no caminho dos chunks: [(Document, bm25)], menor é melhor.
+        doc_ids: restringe a busca a esses chunks (ex.: os de uma entrada do .rag_priorities)
+        """
+        query = lexical_query(text)
+        if not self.lexical or query is None or k <= 0:
+            return []
+        restrict = ""
+        with self._lock:
+            if doc_ids is not None:
+                self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS allowed (doc_id TEXT PRIMARY KEY) WITHOUT ROWID")
+                self._conn.execute("DELETE FROM allowed")
+                self._conn.executemany("INSERT OR IGNORE INTO allowed (doc_id) VALUES (?)", ((doc_id,) for doc_id in doc_ids))
+                restrict = "AND chunks_fts.doc_id IN (SELECT doc_id FROM allowed)"
+            rows = self._conn.execute(
+                f"""
+                SELECT c.doc_id, c.content, c.metadata, bm25(chunks_fts) AS score
+                FROM chunks_fts JOIN chunks c ON c.doc_id = chunks_fts.doc_id
+                WHERE chunks_fts MATCH ? {restrict}
+                ORDER BY score
+                LIMIT ?
+                """,
+                (query, k)
+            ).fetchall()
+            if doc_ids is not None:
+                self._conn.execute("DELETE FROM allowed")
+                self._conn.commit()
+        return [
+            (Document(id=doc_id, page_content=content, metadata=json.loads(metadata)), score)
+            for doc_id, content, metadata, score in rows
+        ]
+
+    def metadata_values(self, field):
+        """Lista (id, metadata[field]) de todos os chunks (None se ausente)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT doc_id, json_extract(metadata, ?) FROM chunks", (f"$.{field}",)
+            ).fetchall()
+
+    def set_metadata(self, field, values):
+        """Grava metadata[field] dos chunks: values é um iterável de (id, valor)"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE chunks SET metadata = json_set(metadata, ?, ?) WHERE doc_id = ?",
+                ((f"$.{field}", value, doc_id) for doc_id, value in values)
+            )
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Docstore do LangChain sobre um ChunkStore.
+
+    Adições são gravadas direto no banco. Remoções ficam registradas em
+    `deleted` e só são aplicadas por ChunkStore.retain na gravação do índice,
+    para não afetar processos que ainda usam a versão anterior.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.deleted = set()
+
+    def search(self, search):
+        if search in self.deleted:
+            return f"ID {search} not found."
+        doc = self.store.get(search)
+        return doc if doc is not None else f"ID {search} not found."
+
+    def add(self, texts):
+        self.store.put_many(texts.items())
+        self.deleted.difference_update(texts)
+
+    def delete(self, ids):
+        self.deleted.update(ids)
+
+
+class PositionMap(Mapping):
+    """Posição no índice FAISS -> id do chunk, lida sob demanda de um array (mapeado)"""
+
+    def __init__(self, ids):
+        self._ids = ids
+
+    @property
+    def ids(self):
+        """Array (bytes) de ids por posição"""
+        return self._ids
+
+    def __getitem__(self, position):
+        position = int(position)
+        if not 0 <= position < len(self._ids):
+            raise KeyError(position)
+        return self._ids[position].decode("utf-8")
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(range(len(self._ids)))
+
+
+def ids_array(index_to_docstore_id):
+    """Array (bytes) de ids por posição, para PositionMap ou dict"""
+    if isinstance(index_to_docstore_id, PositionMap):
+        return index_to_docstore_id.ids
+    return np.array(
+        [index_to_docstore_id[i].encode("utf-8") for i in range(len(index_to_docstore_id))]
+    )
+
+
+def read_ids(path, mmap=True):
+    """Lê index_ids.npy (mapeado em memória por padrão)"""
+    return np.load(str(path), mmap_mode="r" if mmap else None)
+
+
+def write_ids(path, index_to_docstore_id):
+    """Grava o mapeamento posição -> id como array de bytes de largura fixa"""
+    ids = [index_to_docstore_id[i].encode("utf-8") for i in range(len(index_to_docstore_id))]
+    width = max((len(doc_id) for doc_id in ids), default=1)
+    with open(path, "wb") as f:
+        np.save(f, np.array(ids, dtype=f"S{width}"))
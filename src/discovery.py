@@ -0,0 +1,234 @@
+"""
+Descoberta e leitura de documentos para a indexação.
+
+Tudo aqui é gerador: os arquivos são encontrados, filtrados pelo .ragignore e
+lidos sob demanda, de modo que o indexador nunca precisa manter o corpus
+inteiro em memória.
+
+Os diretórios são listados em paralelo e subárvores ignoradas são podadas
+antes de serem percorridas; a leitura dos arquivos também usa um pool de
+threads com prefetch limitado (útil em BASE_DIRs montados pela rede).
+
+Sintaxe do .ragignore (subconjunto do .gitignore):
+- `# comentário` e linhas em branco são ignorados
+- `nome` sem `/` casa com o nome de arquivo ou diretório em qualquer nível
+- `dir/sub/arquivo.md` (com `/`, inclusive `/arquivo.md`) casa com o caminho
+  relativo ao BASE_DIR
+- `dir/` (barra final) casa apenas com diretórios
+- `*`, `?`, `[abc]` e `**` funcionam como no .gitignore
+- `!padrão` volta a incluir o que uma regra anterior ignorou (vale a última
+  regra que casar); como no .gitignore, um arquivo dentro de um diretório
+  ignorado não pode ser reincluído, pois a subárvore nem é percorrida.
+  `\!nome` casa com um nome que começa com `!`
+- caminhos absolutos dentro do BASE_DIR continuam aceitos
+"""
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+load_dotenv()
+
+DOCUMENT_SUFFIX = ".md"
+INDEX_READ_WORKERS = int(os.getenv("INDEX_READ_WORKERS", "8"))
+
+
+def _glob_to_regex(pattern):
+    """Converte um glob estilo .gitignore (com **) em regex sobre caminhos com /"""
+    i = 0
+    out = []
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("(?:/.*)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+            else:
+                out.append(pattern[i:end + 1])
+                i = end + 1
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return re.compile("".join(out) + r"\Z")
+
+
+class IgnoreRules:
+    """Regras do .ragignore, avaliadas sobre caminhos relativos ao BASE_DIR"""
+
+    def __init__(self, base_dir, patterns=()):
+        self.base_dir = Path(base_dir).resolve()
+        # (regex, só_diretórios, ancorado_no_base_dir, negada)
+        self.rules = []
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern):
+        pattern = pattern.strip()
+        if not pattern or pattern.startswith("#"):
+            return
+        negated = pattern.startswith("!")
+        if negated:
+            pattern = pattern[1:]
+        elif pattern.startswith("\\!"):
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # Barra inicial (ou caminho absoluto) ancora a regra no BASE_DIR
+        anchored = Path(pattern).is_absolute()
+        if anchored:
+            # Caminho absoluto: só vale se estiver dentro do BASE_DIR
+            try:
+                pattern = Path(pattern).resolve().relative_to(self.base_dir).as_posix()
+            except ValueError:
+                pattern = pattern.lstrip("/")
+        elif pattern.startswith("./"):
+            pattern = pattern[2:]
+        if not pattern:
+            return
+        anchored = anchored or "/" in pattern
+        self.rules.append((_glob_to_regex(pattern), dir_only, anchored, negated))
+
+    def exclude_dir(self, rel_path):
+        """Ignora o diretório rel_path (relativo ao BASE_DIR, sem curingas)"""
+        self.rules.append((re.compile(re.escape(rel_path) + r"\Z"), True, True, False))
+
+    @classmethod
+    def load(cls, base_dir):
+        """Lê BASE_DIR/.ragignore (regras vazias se não existir)"""
+        ragignore_file = Path(base_dir) / ".ragignore"
+        patterns = []
+        if ragignore_file.exists():
+            patterns = ragignore_file.read_text(encoding="utf-8").splitlines()
+        return cls(base_dir, patterns)
+
+    def is_ignored(self, rel_path, is_dir=False):
+        """rel_path: caminho relativo ao BASE_DIR, com / (vale a última regra que casar)"""
+        name = rel_path.rsplit("/", 1)[-1]
+        ignored = False
+        for regex, dir_only, anchored, negated in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path if anchored else name):
+                ignored = not negated
+        return ignored
+
+
+def _is_hidden(name):
+    return name.startswith(".")
+
+
+def _scan_dir(path):
+    """Lista um diretório: retorna (subdiretórios, arquivos)"""
+    dirs = []
+    files = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif entry.is_file():
+                        files.append(entry.path)
+                except OSError:
+                    continue
+    except OSError as e:
+        print(f"⚠️ Ignorando diretório {path}: {e}", file=sys.stderr)
+    return sorted(dirs), sorted(files)
+
+
+def iter_markdown_files(base_dir, rules=None, workers=None, root=None):
+    """
+    Gera os paths dos arquivos .md de base_dir que não são ignorados.
+
+    Diretórios são listados em paralelo; diretórios ocultos e os que casam com
+    o .ragignore são podados sem serem percorridos. Com root, só a subárvore
+    root (dentro de base_dir) é percorrida; as regras continuam relativas a base_dir.
+    """
+    base_dir = Path(base_dir).resolve()
+    rules = rules if rules is not None else IgnoreRules.load(base_dir)
+    root = Path(root).resolve() if root is not None else base_dir
+    workers = max(1, workers or INDEX_READ_WORKERS)
+
+    def rel(path):
+        return Path(path).relative_to(base_dir).as_posix()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as executor:
+        pending = {executor.submit(_scan_dir, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dirs, files = future.result()
+                for path in dirs:
+                    name = os.path.basename(path)
+                    if _is_hidden(name) or rules.is_ignored(rel(path), is_dir=True):
+                        continue
+                    pending.add(executor.submit(_scan_dir, path))
+                for path in files:
+                    name = os.path.basename(path)
+                    if not name.endswith(DOCUMENT_SUFFIX) or _is_hidden(name):
+                        continue
+                    if rules.is_ignored(rel(path)):
+                        continue
+                    yield Path(path)
+
+
+def read_document(path):
+    """Lê um arquivo como Document, ou None se não puder ser lido"""
+    try:
+        text = Path(path).read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"⚠️ Ignorando {path}: {e}", file=sys.stderr)
+        return None
+    return Document(page_content=text, metadata={"source": str(path)})
+
+
+def iter_documents(base_dir, workers=None, rules=None, root=None, unreadable=None):
+    """
+    Gera os documentos .md de base_dir sem os ignorados pelo .ragignore.
+    A leitura usa `workers` threads com no máximo 2 * workers arquivos adiantados.
+    unreadable(path), se fornecido, recebe os arquivos que existem mas não
+    puderam ser lidos (ex.: falha passageira de I/O num volume de rede).
+    """
+    workers = max(1, workers or INDEX_READ_WORKERS)
+    paths = iter_markdown_files(base_dir, rules=rules, workers=workers, root=root)
+    in_flight = deque()
+
+    def take():
+        path, future = in_flight.popleft()
+        doc = future.result()
+        if doc is None and unreadable is not None and Path(path).exists():
+            unreadable(path)
+        return doc
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="read") as executor:
+        for path in paths:
+            in_flight.append((path, executor.submit(read_document, path)))
+            if len(in_flight) >= workers * 2:
+                doc = take()
+                if doc is not None:
+                    yield doc
+        while in_flight:
+            doc = take()
+            if doc is not None:
+                yield doc
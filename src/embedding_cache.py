@@ -0,0 +1,95 @@
+"""
+Cache persistente de embeddings em SQLite.
+
+Chave: (modelo de embeddings, SHA-256 do texto do chunk). O vetor é guardado
+como float32 (mesma precisão usada pelo FAISS). Com o cache, reconstruir o
+índice com outro chunking ou outro tipo de índice só embeda textos inéditos.
+"""
+import os
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "0" desativa o cache; EMBEDDING_CACHE_PATH permite compartilhar um único arquivo entre BASE_DIRs
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "1") != "0"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+EMBEDDING_CACHE_FILE = ".rag_embedding_cache.sqlite"
+
+# Limite de parâmetros por consulta no SQLite
+_SQL_BATCH = 500
+
+
+def default_cache_path(base_dir):
+    """Caminho do cache para um BASE_DIR (EMBEDDING_CACHE_PATH tem precedência)"""
+    if EMBEDDING_CACHE_PATH:
+        return Path(EMBEDDING_CACHE_PATH).expanduser()
+    return Path(base_dir) / EMBEDDING_CACHE_FILE
+
+
+class EmbeddingCache:
+    """Vetores de embeddings por (modelo, hash do texto), persistidos em SQLite"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+
+    @classmethod
+    def for_base_dir(cls, base_dir):
+        """Abre o cache do base_dir, ou None se o cache estiver desativado"""
+        if not EMBEDDING_CACHE_ENABLED:
+            return None
+        return cls(default_cache_path(base_dir))
+
+    def get_many(self, model, hashes):
+        """Retorna {hash: vetor} para os hashes presentes no cache"""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for start in range(0, len(unique), _SQL_BATCH):
+                part = unique[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *part]
+                )
+                for chunk_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[chunk_hash] = vector.tolist()
+        return found
+
+    def put_many(self, model, items):
+        """Grava vetores: items é um iterável de (hash, vetor)"""
+        rows = [(model, chunk_hash, array("f", vector).tobytes()) for chunk_hash, vector in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,145 @@
+"""
+Pipeline de embeddings em lotes concorrentes.
+
+Divide os textos em lotes de tamanho configurável e mantém até N requisições
+simultâneas ao servidor de embeddings (Ollama), com retry e backoff
+exponencial por lote. Os resultados são devolvidos na ordem de entrada, à
+medida que ficam prontos, para que o indexador possa ir adicionando ao índice
+sem esperar o corpus inteiro.
+
+Com um EmbeddingCache, textos já embedados pelo mesmo modelo são lidos do
+cache e só os inéditos vão para o servidor.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from manifest import content_hash
+
+load_dotenv()
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+EMBED_RETRY_BACKOFF = float(os.getenv("EMBED_RETRY_BACKOFF", "1.0"))
+
+
+def iter_batches(items, batch_size):
+    """Agrupa um iterável em listas de até batch_size itens"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class EmbeddingPipeline:
+    """Gera embeddings em lotes, com várias requisições em paralelo e retry"""
+
+    def __init__(self, embeddings, batch_size=None, workers=None, max_retries=None, backoff=None, log=print, cache=None, model=None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.batch_size = max(1, batch_size or EMBED_BATCH_SIZE)
+        self.workers = max(1, workers or EMBED_WORKERS)
+        self.max_retries = EMBED_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = EMBED_RETRY_BACKOFF if backoff is None else backoff
+        self.log = log
+        self.chunks_done = 0
+        self.cache_hits = 0
+        self.seconds = 0.0
+
+    def _embed_batch(self, texts):
+        """Embeda um lote, tentando novamente com backoff exponencial em caso de falha"""
+        attempt = 0
+        while True:
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                attempt += 1
+                self.log(f"⚠️ Falha ao gerar embeddings ({e}); tentativa {attempt}/{self.max_retries} em {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed_batches(self, batches):
+        """
+        Embeda lotes mantendo até self.workers requisições em andamento.
+
+        Args:
+            batches: iterável de (payload, textos); payload é devolvido junto com os vetores
+
+        Yields:
+            (payload, vetores) na mesma ordem dos lotes de entrada
+        """
+        start = time.perf_counter()
+        last_report = start
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed") as executor:
+            for payload, texts in batches:
+                in_flight.append(self._submit(executor, payload, texts))
+                # Mantém no máximo `workers` lotes em andamento (memória limitada)
+                if len(in_flight) >= self.workers:
+                    yield self._collect(in_flight.popleft())
+                    last_report = self._report(start, last_report)
+            while in_flight:
+                yield self._collect(in_flight.popleft())
+                last_report = self._report(start, last_report)
+        self.seconds += time.perf_counter() - start
+
+    def _submit(self, executor, payload, texts):
+        """Consulta o cache e envia ao servidor apenas os textos que faltam"""
+        hashes = None
+        cached = {}
+        missing = list(range(len(texts)))
+        if self.cache is not None:
+            hashes = [content_hash(text) for text in texts]
+            cached = self.cache.get_many(self.model, hashes)
+            missing = [i for i, h in enumerate(hashes) if h not in cached]
+        future = executor.submit(self._embed_batch, [texts[i] for i in missing]) if missing else None
+        return payload, texts, hashes, cached, missing, future
+
+    def _collect(self, item):
+        payload, texts, hashes, cached, missing, future = item
+        computed = future.result() if future is not None else []
+        if hashes is None:
+            vectors = computed
+        else:
+            vectors = [cached.get(h) for h in hashes]
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+            self.cache.put_many(self.model, ((hashes[i], vector) for i, vector in zip(missing, computed)))
+            self.cache_hits += len(texts) - len(missing)
+        self.chunks_done += len(texts)
+        return payload, vectors
+
+    def _report(self, start, last_report, interval=10.0):
+        """Imprime o throughput parcial a cada `interval` segundos"""
+        now = time.perf_counter()
+        if now - last_report < interval:
+            return last_report
+        elapsed = now - start
+        self.log(f"   ⏳ {self.chunks_done} chunks embedados ({self.chunks_done / elapsed:.1f} chunks/s)")
+        return now
+
+    def embed_documents(self, texts):
+        """Embeda uma lista de textos e retorna os vetores na mesma ordem"""
+        vectors = []
+        for _, batch_vectors in self.embed_batches((None, batch) for batch in iter_batches(texts, self.batch_size)):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    def summary(self):
+        """Resumo do throughput acumulado"""
+        rate = self.chunks_done / self.seconds if self.seconds > 0 else 0.0
+        summary = f"⚡ Embeddings: {self.chunks_done} chunks em {self.seconds:.1f}s ({rate:.1f} chunks/s, lotes de {self.batch_size}, {self.workers} workers)"
+        if self.cache is not None:
+            summary += f", {self.cache_hits} do cache"
+        return summary
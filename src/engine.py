@@ -0,0 +1,284 @@
+"""
+Motor RAG em processo.
+
+Mantém embeddings, LLM e vectorstores carregados entre perguntas, de modo que
+o custo por requisição seja apenas recuperação + geração. Usado pelo backend
+(uma instância por processo) e pelo chat.py.
+"""
+import os
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+from langchain_ollama import OllamaLLM
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+from vectorstore_cache import shared_cache
+from retrieval import RETRIEVAL_MODE, search
+from mmr import MMR_ENABLED, MMR_LAMBDA
+from query_cache import get_cached_embeddings
+from answer_cache import AnswerCache, ANSWER_CACHE_ENABLED, index_version
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Configurações do .env com valores padrão
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3.1")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0"))
+EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "nomic-embed-text")
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "4"))
+
+# Prompt
+prompt = PromptTemplate(
+    template="""
+Use SOMENTE o contexto abaixo para responder.
+Use o contexto fornecido, mesmo que esteja em inglês.
+
+Se não encontrar a resposta, diga que não sabe.
+Responda sempre em português.
+Contexto:
+{context}
+
+Pergunta:
+{question}
+""",
+    input_variables=["context", "question"]
+)
+
+# Prompt para gerar título
+title_prompt = PromptTemplate(
+    template="""
+Com base na pergunta e resposta abaixo, gere um título contextual de até 10 palavras em português.
+O título deve ser conciso e descrever o assunto principal da conversa.
+
+Pergunta: {question}
+
+Resposta: {answer}
+
+Título (máximo 10 palavras):
+""",
+    input_variables=["question", "answer"]
+)
+
+
+class AnswerCancelled(Exception):
+    """A geração foi interrompida porque o sinal `cancel` foi marcado"""
+
+
+def _check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise AnswerCancelled("Geração interrompida")
+
+
+def format_docs(docs):
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+class RagEngine:
+    """Mantém embeddings, LLM e vectorstores (por BASE_DIR) aquecidos entre requisições"""
+
+    def __init__(self, llm_model=None, llm_temperature=None, embeddings_model=None, retriever_k=None):
+        self.llm_model = llm_model or LLM_MODEL
+        self.llm_temperature = LLM_TEMPERATURE if llm_temperature is None else llm_temperature
+        self.embeddings_model = embeddings_model or EMBEDDINGS_MODEL
+        self.retriever_k = retriever_k or RETRIEVER_K
+
+        # Embeddings de perguntas com cache LRU/TTL compartilhado no processo
+        self.embeddings = get_cached_embeddings(self.embeddings_model)
+        self.llm = OllamaLLM(
+            model=self.llm_model,
+            temperature=self.llm_temperature
+        )
+
+        # Vectorstores carregados ficam no cache compartilhado do processo
+        self.vectorstores = shared_cache
+
+        # Cache semântico de respostas (opcional, ANSWER_CACHE=1)
+        self.answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
+
+    def get_vectorstore(self, base_dir):
+        """Retorna o vectorstore do base_dir (recarregado só quando o índice muda no disco)"""
+        return self.vectorstores.get(base_dir, self.embeddings)
+
+    def get_answer_chain(self):
+        """Chain que gera a resposta a partir de {"context", "question"} já recuperados"""
+        return prompt | self.llm | StrOutputParser()
+
+    def retrieve(self, base_dir, question, k=None, mode=None, mmr=None, mmr_lambda=None):
+        """
+        Busca única por pergunta: retorna [(doc, score)] dos índices do base_dir
+        (raiz e shards, em paralelo). O mesmo resultado alimenta o contexto do
+        prompt e a lista de fontes. mode: vector, lexical ou hybrid (padrão:
+        RETRIEVAL_MODE); mmr/mmr_lambda: reordenação por diversidade (ver mmr.py)
+        """
+        return search(
+            base_dir, question, self.embeddings, k or self.retriever_k, mode=mode, cache=self.vectorstores,
+            mmr=mmr, mmr_lambda=mmr_lambda
+        )
+
+    def get_reference_files(self, base_dir, question):
+        """Obtém os arquivos de referência usados para responder a pergunta"""
+        return self.reference_files(base_dir, [doc for doc, _ in self.retrieve(base_dir, question)])
+
+    def reference_files(self, base_dir, docs):
+        """Arquivos de referência (relativos ao base_dir) dos documentos recuperados"""
+        reference_files = set()
+        for doc in docs:
+            # Extrair o caminho do arquivo dos metadados
+            source = doc.metadata.get("source", "")
+            if source:
+                # Tentar normalizar para caminho relativo ao BASE_DIR
+                try:
+                    reference_files.add(os.path.relpath(source, base_dir))
+                except ValueError:
+                    # Se não for possível calcular caminho relativo, usar o caminho completo
+                    reference_files.add(source)
+        return sorted(reference_files)
+
+    def generate_title(self, question, answer):
+        """Gera um título contextual baseado na pergunta e resposta"""
+        try:
+            title_chain = title_prompt | self.llm | StrOutputParser()
+            title = title_chain.invoke({"question": question, "answer": answer})
+            # Limitar usando split()[:9] para forçar o corte caso o modelo gere mais palavras
+            return " ".join(title.strip().split()[:9])
+        except Exception:
+            # Em caso de erro, usar um título padrão baseado na pergunta
+            return " ".join(question.strip().split()[:9])
+
+    def _lookup_answer(self, base_dir, question, mode=None, mmr=None, mmr_lambda=None):
+        """
+        Consulta o cache de respostas, separado pelas opções de recuperação.
+        A busca lexical não usa o cache: ela existe para dispensar o embedding.
+
+        Returns:
+            (resposta em cache ou None, argumentos de store() ou None se o cache não se aplica)
+        """
+        mode = mode or RETRIEVAL_MODE
+        if self.answer_cache is None or mode == "lexical":
+            return None, None
+        options = (mode,)
+        if mode == "vector" and (MMR_ENABLED if mmr is None else mmr):
+            options += ("mmr", MMR_LAMBDA if mmr_lambda is None else mmr_lambda)
+        key = str(Path(base_dir).resolve())
+        version = index_version(key)
+        # O embedding da pergunta fica no cache de perguntas e é reaproveitado pela busca
+        vector = self.embeddings.embed_query(question)
+        return self.answer_cache.lookup(key, version, vector, options), (key, version, vector, options)
+
+    def _store_answer(self, cache_key, message, sources):
+        key, version, vector, options = cache_key
+        self.answer_cache.store(key, version, vector, {"message": message, "sources": sources}, options)
+
+    def _generate(self, docs, question, cancel=None):
+        """
+        Gera a resposta. Com cancel (ex.: threading.Event), o LLM é lido em fluxo
+        e interrompido entre dois tokens quando cancel for marcado: o fluxo é
+        fechado, o que encerra a conexão e a geração no servidor do LLM.
+        """
+        inputs = {"context": format_docs(docs), "question": question}
+        if cancel is None:
+            return self.get_answer_chain().invoke(inputs)
+        return "".join(self._stream_tokens(inputs, cancel))
+
+    def _stream_tokens(self, inputs, cancel=None):
+        # Direto do LLM, sem a chain: fechar o fluxo de uma RunnableSequence consome o
+        # restante da geração antes de retornar. O StrOutputParser não altera texto.
+        stream = self.llm.stream(prompt.format(**inputs))
+        try:
+            for token in stream:
+                _check_cancelled(cancel)
+                yield token
+        finally:
+            stream.close()
+
+    def answer(self, base_dir, question, with_title=True, cancel=None, **retrieval_options):
+        """
+        Responde uma pergunta usando o vectorstore do base_dir.
+
+        Args:
+            with_title: Se False, não gera o título (title=None); use quando o título
+                for gerado depois, em background (ver postprocess.PostProcessor)
+            cancel: Sinal (threading.Event) que interrompe a geração com AnswerCancelled
+            retrieval_options: mode, mmr e mmr_lambda de retrieve()
+
+        Returns:
+            dict com question, question_timestamp, message, answer_timestamp, sources,
+            title e cached (True se a resposta veio do cache de respostas)
+        """
+        question_timestamp = datetime.now().isoformat()
+
+        cached, cache_key = self._lookup_answer(base_dir, question, **retrieval_options)
+        if cached is not None:
+            message = cached["message"]
+            reference_files = cached["sources"]
+        else:
+            # Uma única busca: os mesmos documentos viram contexto e fontes
+            docs = [doc for doc, _ in self.retrieve(base_dir, question, **retrieval_options)]
+            reference_files = self.reference_files(base_dir, docs)
+            _check_cancelled(cancel)
+
+            # Gerar resposta
+            message = self._generate(docs, question, cancel)
+            if cache_key is not None:
+                self._store_answer(cache_key, message, reference_files)
+        answer_timestamp = datetime.now().isoformat()
+
+        return {
+            "question": question,
+            "question_timestamp": question_timestamp,
+            "message": message,
+            "answer_timestamp": answer_timestamp,
+            "sources": reference_files,
+            "title": self.generate_title(question, message) if with_title else None,
+            "cached": cached is not None
+        }
+
+    def stream_answer(self, base_dir, question, with_title=True, cancel=None, **retrieval_options):
+        """
+        Responde uma pergunta em fluxo, gerando eventos à medida que ficam prontos:
+
+        - {"event": "sources", ...}: arquivos de referência (antes do primeiro token)
+        - {"event": "token", ...}: cada trecho gerado pelo LLM
+        - {"event": "answer", ...}: resposta completa (mesmos campos de answer(), sem title)
+        - {"event": "title", ...}: título gerado depois da resposta, fora do caminho crítico
+          (omitido com with_title=False)
+
+        Com cancel marcado, o fluxo do LLM é fechado e AnswerCancelled é lançada
+        no próximo token; fechar este gerador também encerra o fluxo do LLM.
+        """
+        question_timestamp = datetime.now().isoformat()
+        cached, cache_key = self._lookup_answer(base_dir, question, **retrieval_options)
+        if cached is not None:
+            # Resposta do cache: enviada como um único token
+            reference_files = cached["sources"]
+            yield {"event": "sources", "data": {"sources": reference_files}}
+            message = cached["message"]
+            yield {"event": "token", "data": {"token": message}}
+        else:
+            docs = [doc for doc, _ in self.retrieve(base_dir, question, **retrieval_options)]
+            reference_files = self.reference_files(base_dir, docs)
+            yield {"event": "sources", "data": {"sources": reference_files}}
+
+            parts = []
+            for token in self._stream_tokens({"context": format_docs(docs), "question": question}, cancel):
+                parts.append(token)
+                yield {"event": "token", "data": {"token": token}}
+            message = "".join(parts)
+            if cache_key is not None:
+                self._store_answer(cache_key, message, reference_files)
+
+        yield {
+            "event": "answer",
+            "data": {
+                "question": question,
+                "question_timestamp": question_timestamp,
+                "message": message,
+                "answer_timestamp": datetime.now().isoformat(),
+                "sources": reference_files,
+                "cached": cached is not None
+            }
+        }
+        if with_title:
+            yield {"event": "title", "data": {"title": self.generate_title(question, message)}}
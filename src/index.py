@@ -1,159 +1,425 @@
 import argparse
+import itertools
 import os
 import sys
 from pathlib import Path
 
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
+import faiss
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_ollama import OllamaEmbeddings
 from langchain_community.vectorstores import FAISS
+from dotenv import load_dotenv
+
+from manifest import IndexManifest, content_hash, chunk_id, read_index_meta, write_index_meta
+from embedding_pipeline import EmbeddingPipeline, EMBED_BATCH_SIZE, iter_batches
+from embedding_cache import EmbeddingCache
+from discovery import IgnoreRules, iter_documents
+from index_types import IndexSpec, convert_index, default_spec
+from index_io import read_vectorstore, write_vectorstore
+from chunk_store import CHUNK_STORE_FILE, ChunkStore, SQLiteDocstore
+from shards import read_shards, remove_stale_stores
+from priorities import PriorityMatcher
+
+load_dotenv()
 
 
 # -----------------------------
 # Config
 # -----------------------------
-BASE_DIR = Path(os.environ.get("BASE_DIR","docs")).resolve()
-INDEXED_FILE = BASE_DIR / ".rag_indexeds"
-VECTORSTORE_DIR = BASE_DIR  # FAISS já salva vários arquivos aqui
-RAGIGNORE_FILE = BASE_DIR / ".ragignore"
+EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "nomic-embed-text")
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 150
 
-# -----------------------------
-# Args
-# -----------------------------
-parser = argparse.ArgumentParser(description="Indexação RAG")
-parser.add_argument(
-    "-p",
-    "--partial",
-    action="store_true",
-    help="Indexa apenas arquivos novos (incremental)"
-)
-args = parser.parse_args()
 
-# -----------------------------
-# Load indexed paths
-# -----------------------------
-if INDEXED_FILE.exists():
-    indexed_paths = set(INDEXED_FILE.read_text(encoding="utf-8").splitlines())
-else:
-    indexed_paths = set()
+class OllamaConnectionError(RuntimeError):
+    """Falha ao conectar com o Ollama para gerar embeddings"""
 
-# -----------------------------
-# Load .ragignore paths
-# -----------------------------
-if RAGIGNORE_FILE.exists():
-    ragignore_paths = set(
-        line.strip()
-        for line in RAGIGNORE_FILE.read_text(encoding="utf-8").splitlines()
-        if line.strip() and not line.strip().startswith("#")
+
+class IndexCancelled(Exception):
+    """A indexação foi interrompida porque o sinal `cancel` foi marcado"""
+
+
+def _check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise IndexCancelled("Indexação interrompida")
+
+
+def _until_cancelled(documents, cancel):
+    """Repassa os documentos, parando entre um arquivo e outro se cancel for marcado"""
+    for document in documents:
+        _check_cancelled(cancel)
+        yield document
+
+
+def get_embeddings():
+    """Cria o cliente de embeddings e testa a conexão com o Ollama"""
+    try:
+        embeddings = OllamaEmbeddings(
+            model=EMBEDDINGS_MODEL
+        )
+        # Test connection by trying to embed a small text
+        _ = embeddings.embed_query("test")
+    except Exception as e:
+        raise OllamaConnectionError(str(e)) from e
+    return embeddings
+
+
+class ChangePlanner:
+    """
+    Compara os documentos atuais com o manifesto e decide o que indexar.
+
+    Arquivos com o mesmo hash são ignorados. Arquivos alterados são re-divididos:
+    chunks cujo texto já existia mantêm o mesmo id (e o vetor), os novos são
+    embedados e os que sumiram são removidos. Arquivos que não existem mais
+    (ou passaram a ser ignorados) têm todos os chunks removidos; arquivos que
+    existem mas não puderam ser lidos (keep) mantêm os chunks que já tinham.
+
+    O manifesto é atualizado in-place. Com um PriorityMatcher, cada documento
+    embedado recebe nos metadados o caminho da sua entrada do .rag_priorities.
+    """
+
+    def __init__(self, manifest, splitter, matcher=None):
+        self.manifest = manifest
+        self.splitter = splitter
+        self.matcher = matcher
+        self.delete_ids = []
+        self.changed_files = 0
+        self.added = 0
+        self._seen = set()
+
+    def iter_new_chunks(self, documents):
+        """Consome os documentos (um por vez) e gera (chunk, id) dos chunks a embedar"""
+        for doc in documents:
+            source = str(Path(doc.metadata["source"]).resolve())
+            self._seen.add(source)
+            file_hash = content_hash(doc.page_content)
+            if self.manifest.file_hash(source) == file_hash:
+                continue
+
+            self.changed_files += 1
+            if self.matcher is not None:
+                doc.metadata["priority_path"] = self.matcher.match_path(source)
+            old_by_hash = self.manifest.chunks_by_hash(source)
+            occurrences = {}
+            file_chunks = []
+            for chunk in self.splitter.split_documents([doc]):
+                h = content_hash(chunk.page_content)
+                occurrence = occurrences.get(h, 0)
+                occurrences[h] = occurrence + 1
+                reusable = old_by_hash.get(h)
+                if reusable:
+                    # Mesmo texto já indexado: mantém o vetor existente
+                    doc_id = reusable.pop(0)
+                else:
+                    doc_id = chunk_id(source, h, occurrence)
+                    self.added += 1
+                    yield chunk, doc_id
+                file_chunks.append((doc_id, h))
+
+            # Chunks antigos que não foram reaproveitados saem do índice
+            for ids in old_by_hash.values():
+                self.delete_ids.extend(ids)
+            self.manifest.set_file(source, file_hash, file_chunks)
+
+    def keep(self, path):
+        """Arquivo presente mas ilegível nesta execução: mantém sua entrada do manifesto e seus vetores"""
+        self._seen.add(str(Path(path).resolve()))
+
+    def finish(self):
+        """Marca para remoção os arquivos do manifesto que não apareceram nesta execução"""
+        for source in list(self.manifest.files):
+            if source not in self._seen:
+                self.delete_ids.extend(self.manifest.remove_file(source))
+
+
+def _source_rules(base_dir, shards, shard):
+    """Regras do .ragignore sem as subárvores que pertencem a outros shards"""
+    rules = IgnoreRules.load(base_dir)
+    for other in shards:
+        if shard is None or (other.root != shard.root and shard.contains(other.root)):
+            rules.exclude_dir(other.path)
+    return rules
+
+
+def _update_priority_paths(vectorstore_dir, matcher):
+    """Reassocia todos os chunks do índice às entradas atuais do .rag_priorities"""
+    store = ChunkStore(vectorstore_dir / CHUNK_STORE_FILE)
+    try:
+        store.set_metadata(
+            "priority_path",
+            [(doc_id, matcher.match_path(source)) for doc_id, source in store.metadata_values("source")]
+        )
+    finally:
+        store.close()
+
+
+def _find_shard(base_dir, shards, name):
+    for shard in shards:
+        if shard.name == name:
+            return shard
+    raise ValueError(f"Shard desconhecido em {base_dir}: {name} (disponíveis: {', '.join(s.name for s in shards) or 'nenhum'})")
+
+
+def run_index(base_dir, partial=False, silent=False, batch_size=None, workers=None, read_workers=None, index_spec=None, train_sample=None, shard=None, cancel=None):
+    """
+    Indexa os arquivos .md de base_dir (ou de um shard, ver shards.py).
+
+    Args:
+        base_dir: Diretório base (onde o índice FAISS é salvo)
+        partial: Se True, atualiza o índice existente embedando apenas chunks novos/alterados
+        silent: Se True, não imprime progresso
+        batch_size: Chunks por requisição de embeddings (padrão: EMBED_BATCH_SIZE)
+        workers: Requisições de embeddings simultâneas (padrão: EMBED_WORKERS)
+        read_workers: Threads de descoberta/leitura de arquivos (padrão: INDEX_READ_WORKERS)
+        index_spec: IndexSpec ou texto `tipo:param=valor,...` (padrão: INDEX_SPEC, senão o tipo já gravado)
+        train_sample: Máximo de vetores usados no treino de índices IVF (padrão: INDEX_TRAIN_SAMPLE)
+        shard: Nome (ou Shard) do .rag_shards a indexar; None indexa a raiz do
+               base_dir, sem as subárvores dos shards
+        cancel: Sinal (threading.Event) que interrompe a indexação entre um
+                arquivo e outro com IndexCancelled; o índice em disco não muda
+
+    Returns:
+        dict com files (arquivos indexados), changed, added e deleted
+    """
+    log = (lambda *a, **k: None) if silent else print
+    base_dir = Path(base_dir).resolve()
+    shards = read_shards(base_dir)
+    if isinstance(shard, str):
+        shard = _find_shard(base_dir, shards, shard)
+    # Índice, manifesto e metadados ficam no diretório do shard (ou no BASE_DIR)
+    vectorstore_dir = shard.index_dir if shard else base_dir
+    vectorstore_dir.mkdir(parents=True, exist_ok=True)
+    source_root = shard.root if shard else base_dir
+    rules = _source_rules(base_dir, shards, shard)
+    indexed_file = vectorstore_dir / ".rag_indexeds"
+    if shard:
+        log(f"🧩 Shard {shard.name}: {shard.path}")
+
+    stored_meta = read_index_meta(vectorstore_dir)
+    stored_spec = IndexSpec.from_meta(stored_meta.get("index_spec"))
+    matcher = PriorityMatcher.load(base_dir)
+    # Chunks já indexados só são reassociados se as entradas mudaram
+    priorities_changed = stored_meta.get("priorities_version") != matcher.version
+    if isinstance(index_spec, str):
+        index_spec = IndexSpec.parse(index_spec)
+    spec = index_spec or default_spec(stored_spec)
+    if partial and spec != stored_spec and (vectorstore_dir / "index.faiss").exists():
+        # Os vetores já embedados vêm do cache de embeddings
+        log(f"🔁 Tipo de índice mudou ({stored_spec} → {spec}): recriando índice completo")
+        partial = False
+
+    vectorstore = None
+    manifest = IndexManifest()
+    if partial and (vectorstore_dir / "index.faiss").exists():
+        log("📌 Modo parcial: carregando índice existente")
+        vectorstore = read_vectorstore(
+            vectorstore_dir,
+            # Embeddings só são necessários (e testados) se houver chunks novos
+            OllamaEmbeddings(model=EMBEDDINGS_MODEL),
+            # O índice será alterado: cópia no heap, não mapeada
+            mmap=False
+        )
+        manifest = IndexManifest.load(vectorstore_dir) or IndexManifest.from_docstore(vectorstore)
+    else:
+        log("📌 Modo completo: recriando índice")
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+    planner = ChangePlanner(manifest, splitter, matcher)
+
+    # Leitura, divisão e embeddings em fluxo: só `batch_size` chunks por lote
+    # (e `workers` lotes em andamento) ficam em memória de cada vez
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    batches = (
+        (items, [chunk.page_content for chunk, _ in items])
+        for items in iter_batches(planner.iter_new_chunks(_until_cancelled(iter_documents(
+            base_dir, workers=read_workers, rules=rules, root=source_root, unreadable=planner.keep
+        ), cancel)), batch_size)
     )
-    # Normaliza para paths absolutos
-    ragignore_paths = {
-        str((BASE_DIR / path).resolve()) if not Path(path).is_absolute() else str(Path(path).resolve())
-        for path in ragignore_paths
+    first_batch = next(batches, None)
+    if first_batch is not None:
+        embeddings = get_embeddings()
+        cache = EmbeddingCache.for_base_dir(base_dir)
+        pipeline = EmbeddingPipeline(
+            embeddings,
+            batch_size=batch_size,
+            workers=workers,
+            log=log,
+            cache=cache,
+            model=EMBEDDINGS_MODEL
+        )
+        try:
+            for items, vectors in pipeline.embed_batches(itertools.chain([first_batch], batches)):
+                text_embeddings = [(chunk.page_content, vector) for (chunk, _), vector in zip(items, vectors)]
+                metadatas = [chunk.metadata for chunk, _ in items]
+                ids = [doc_id for _, doc_id in items]
+                if vectorstore is None:
+                    # Chunks vão direto para o chunks.sqlite, sem acumular o corpus em memória
+                    vectorstore = FAISS(
+                        embeddings,
+                        faiss.IndexFlatL2(len(vectors[0])),
+                        SQLiteDocstore(ChunkStore(vectorstore_dir / CHUNK_STORE_FILE)),
+                        {}
+                    )
+                vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        finally:
+            if cache is not None:
+                cache.close()
+        vectorstore.embedding_function = embeddings
+        log(pipeline.summary())
+
+    # Último ponto de parada: depois daqui o novo índice é gravado
+    _check_cancelled(cancel)
+    planner.finish()
+    changed_files = planner.changed_files
+    delete_ids = planner.delete_ids
+    stats = {
+        "files": len(manifest.files),
+        "changed": changed_files,
+        "added": planner.added,
+        "deleted": len(delete_ids)
     }
-else:
-    ragignore_paths = set()
+    if not planner.added and not delete_ids:
+        if priorities_changed and (vectorstore_dir / CHUNK_STORE_FILE).exists():
+            _update_priority_paths(vectorstore_dir, matcher)
+            write_index_meta(vectorstore_dir, priorities_version=matcher.version)
+            log("🏷️ Prioridades atualizadas nos chunks existentes")
+        log("⚠️ Nenhum novo arquivo para indexar.")
+        return stats
 
-# -----------------------------
-# Load documents
-# -----------------------------
-loader = DirectoryLoader(
-    BASE_DIR,
-    glob="**/*.md",
-    loader_cls=TextLoader
-)
-
-documents = loader.load()
-
-# Filtra documentos se for parcial
-if args.partial and indexed_paths:
-    documents = [
-        doc for doc in documents
-        if str(Path(doc.metadata["source"]).resolve()) not in indexed_paths
-    ]
-
-# Filtra documentos ignorados pelo .ragignore
-if ragignore_paths:
-    documents = [
-        doc for doc in documents
-        if str(Path(doc.metadata["source"]).resolve()) not in ragignore_paths
-    ]
-
-if not documents:
-    print("⚠️ Nenhum novo arquivo para indexar.")
-    exit(0)
+    if delete_ids:
+        existing_ids = set(vectorstore.index_to_docstore_id.values())
+        delete_ids = [doc_id for doc_id in delete_ids if doc_id in existing_ids]
+        if delete_ids:
+            if not isinstance(vectorstore.index, faiss.IndexFlat):
+                # IVF/HNSW não removem vetores mantendo as posições: volta para flat
+                # e o índice é reconstruído abaixo
+                vectorstore.index, _ = convert_index(vectorstore.index, IndexSpec(), log=log)
+            vectorstore.delete(delete_ids)
 
-# -----------------------------
-# Split
-# -----------------------------
-splitter = RecursiveCharacterTextSplitter(
-    chunk_size=800,
-    chunk_overlap=150
-)
+    if not spec.is_flat and isinstance(vectorstore.index, faiss.IndexFlat):
+        vectorstore.index, spec = convert_index(vectorstore.index, spec, train_sample=train_sample, log=log)
 
-chunks = splitter.split_documents(documents)
+    # Troca atômica: processos com o índice antigo mapeado continuam consistentes
+    write_vectorstore(vectorstore, vectorstore_dir)
+    if priorities_changed:
+        _update_priority_paths(vectorstore_dir, matcher)
+    manifest.save(vectorstore_dir)
+    # Nova versão do índice (invalida o cache de respostas se o corpus mudou)
+    write_index_meta(
+        vectorstore_dir,
+        corpus_version=manifest.corpus_version(base_dir),
+        index_spec=spec.to_meta(),
+        priorities_version=matcher.version
+    )
 
-# -----------------------------
-# Embeddings
-# -----------------------------
-try:
-    embeddings = OllamaEmbeddings(
-        model="nomic-embed-text"
+    # .rag_indexeds reflete os arquivos presentes no índice
+    indexed_file.write_text(
+        "\n".join(sorted(manifest.files)),
+        encoding="utf-8"
     )
-    # Test connection by trying to embed a small text
-    _ = embeddings.embed_query("test")
-except Exception as e:
-    print("❌ Erro ao conectar com Ollama:", file=sys.stderr)
-    print(f"   {str(e)}", file=sys.stderr)
-    print("\n💡 Verifique se:", file=sys.stderr)
-    print("   1. Ollama está instalado (https://ollama.com/download)", file=sys.stderr)
-    print("   2. Ollama está rodando (execute: ollama serve)", file=sys.stderr)
-    print("   3. O modelo 'nomic-embed-text' está disponível (execute: ollama pull nomic-embed-text)", file=sys.stderr)
-    sys.exit(1)
 
-# -----------------------------
-# Vector store
-# -----------------------------
-try:
-    if args.partial and (VECTORSTORE_DIR / "index.faiss").exists():
-        print("📌 Modo parcial: carregando índice existente")
-        vectorstore = FAISS.load_local(
-            VECTORSTORE_DIR,
-            embeddings,
-            allow_dangerous_deserialization=True
+    log(
+        f"✅ Indexação concluída ({changed_files} arquivos alterados, "
+        f"{stats['added']} chunks novos, {stats['deleted']} removidos, {stats['files']} arquivos no índice)"
+    )
+    return stats
+
+
+def run_index_all(base_dir, silent=False, **kwargs):
+    """
+    Indexa a raiz de base_dir e, em seguida, cada shard do .rag_shards.
+    Por fim, apaga os índices de shards que não estão mais configurados (o
+    conteúdo deles já voltou para a raiz ou para outro shard).
+    Aceita os mesmos argumentos de run_index.
+
+    Returns:
+        dict nome do shard ("." para a raiz) -> estatísticas de run_index
+    """
+    base_dir = Path(base_dir).resolve()
+    shards = read_shards(base_dir)
+    results = {".": run_index(base_dir, silent=silent, **kwargs)}
+    for shard in shards:
+        results[shard.name] = run_index(base_dir, silent=silent, shard=shard, **kwargs)
+    for name in remove_stale_stores(base_dir, shards):
+        if not silent:
+            print(f"🧹 Índice do shard removido da configuração apagado: {name}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexação RAG")
+    parser.add_argument(
+        "-p",
+        "--partial",
+        action="store_true",
+        help="Atualiza o índice existente embedando apenas chunks novos ou alterados (incremental)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Chunks por requisição de embeddings (padrão: EMBED_BATCH_SIZE ou 64)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Requisições de embeddings simultâneas (padrão: EMBED_WORKERS ou 4)"
+    )
+    parser.add_argument(
+        "--read-workers",
+        type=int,
+        help="Threads para listar diretórios e ler arquivos (padrão: INDEX_READ_WORKERS ou 8)"
+    )
+    parser.add_argument(
+        "--index",
+        dest="index_spec",
+        help="Tipo de índice FAISS: flat, ivfflat, hnsw ou ivfpq, com parâmetros opcionais "
+             "(ex.: ivfflat:nlist=4096,nprobe=16). Padrão: INDEX_SPEC ou o tipo já usado no BASE_DIR"
+    )
+    parser.add_argument(
+        "--train-sample",
+        type=int,
+        help="Máximo de vetores usados para treinar índices IVF (padrão: INDEX_TRAIN_SAMPLE ou 100000)"
+    )
+    parser.add_argument(
+        "--shard",
+        help="Indexa apenas o shard indicado do .rag_shards (padrão: a raiz e todos os shards)"
+    )
+    args = parser.parse_args()
+
+    base_dir = Path(os.environ.get("BASE_DIR", "docs")).resolve()
+
+    try:
+        options = dict(
+            partial=args.partial,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            read_workers=args.read_workers,
+            index_spec=args.index_spec,
+            train_sample=args.train_sample
         )
-        vectorstore.add_documents(chunks)
-    else:
-        print("📌 Modo completo: recriando índice")
-        vectorstore = FAISS.from_documents(chunks, embeddings)
-except Exception as e:
-    print("❌ Erro ao criar vectorstore:", file=sys.stderr)
-    print(f"   {str(e)}", file=sys.stderr)
-    if "ConnectionError" in str(type(e)) or "Failed to connect" in str(e):
-        print("\n💡 Verifique se Ollama está rodando:", file=sys.stderr)
-        print("   ollama serve", file=sys.stderr)
-    sys.exit(1)
-
-vectorstore.save_local(VECTORSTORE_DIR)
+        if args.shard:
+            run_index(base_dir, shard=args.shard, **options)
+        else:
+            run_index_all(base_dir, **options)
+    except OllamaConnectionError as e:
+        print("❌ Erro ao conectar com Ollama:", file=sys.stderr)
+        print(f"   {str(e)}", file=sys.stderr)
+        print("\n💡 Verifique se:", file=sys.stderr)
+        print("   1. Ollama está instalado (https://ollama.com/download)", file=sys.stderr)
+        print("   2. Ollama está rodando (execute: ollama serve)", file=sys.stderr)
+        print(f"   3. O modelo '{EMBEDDINGS_MODEL}' está disponível (execute: ollama pull {EMBEDDINGS_MODEL})", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print("❌ Erro ao criar vectorstore:", file=sys.stderr)
+        print(f"   {str(e)}", file=sys.stderr)
+        if "ConnectionError" in str(type(e)) or "Failed to connect" in str(e):
+            print("\n💡 Verifique se Ollama está rodando:", file=sys.stderr)
+            print("   ollama serve", file=sys.stderr)
+        sys.exit(1)
 
-# -----------------------------
-# Update indexed file
-# -----------------------------
-new_paths = {
-    str(Path(doc.metadata["source"]).resolve())
-    for doc in documents
-}
-
-if args.partial:
-    # append (set garante unicidade)
-    indexed_paths |= new_paths
-else:
-    # sobrescreve tudo
-    indexed_paths = new_paths
-
-INDEXED_FILE.write_text(
-    "\n".join(sorted(indexed_paths)),
-    encoding="utf-8"
-)
-
-print(f"✅ Indexação concluída ({len(new_paths)} arquivos)")
+
+if __name__ == "__main__":
+    main()
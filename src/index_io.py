@@ -0,0 +1,191 @@
+"""
+Leitura e gravação do índice FAISS em disco.
+
+Layout em BASE_DIR:
+- index.faiss: vetores (faiss.write_index)
+- index_ids.npy: posição no índice -> id do chunk
+- chunks.sqlite: texto e metadados dos chunks e índice lexical (ver chunk_store)
+
+Leitores (chat, prompt_preview, backend) abrem index.faiss e index_ids.npy
+mapeados em memória e somente leitura: os vetores ficam no page cache do
+sistema e são compartilhados entre todos os processos que usam o mesmo
+BASE_DIR, em vez de uma cópia no heap de cada um. Flat e HNSW usam
+IO_FLAG_MMAP_IFC (vetores lidos direto do arquivo); IVF usa IO_FLAG_MMAP
+(listas invertidas mapeadas). Os chunks são lidos do SQLite só quando
+retornados por uma busca.
+
+Índices mapeados não podem ser alterados: o index.py lê o índice normalmente
+e grava os arquivos novos ao lado, trocando-os com os.replace. Quem ainda
+tiver o arquivo antigo mapeado continua lendo a versão anterior, sem nunca ver
+um arquivo pela metade.
+
+Índices antigos (index.pkl do FAISS.save_local) ainda são lidos, apenas para
+migração: a próxima gravação converte para o layout acima e apaga o index.pkl.
+"""
+import os
+import pickle
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import faiss
+from dotenv import load_dotenv
+from langchain_community.vectorstores import FAISS
+
+from chunk_store import (
+    CHUNK_STORE_FILE, INDEX_IDS_FILE,
+    ChunkStore, SQLiteDocstore, PositionMap, read_ids, write_ids
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+load_dotenv()
+
+# "0" lê o índice inteiro para o heap (comportamento do FAISS.load_local)
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") != "0"
+
+INDEX_FAISS_FILE = "index.faiss"
+LEGACY_PKL_FILE = "index.pkl"
+LOCK_FILE = ".rag_index.lock"
+
+# Tentativas de leitura quando o índice é trocado durante a carga
+_LOAD_RETRIES = 3
+
+
+def index_files(folder):
+    """Arquivos cuja troca indica uma nova versão do índice (layout atual ou legado)"""
+    if (Path(folder) / INDEX_IDS_FILE).exists() or not (Path(folder) / LEGACY_PKL_FILE).exists():
+        return (INDEX_FAISS_FILE, INDEX_IDS_FILE)
+    return (INDEX_FAISS_FILE, LEGACY_PKL_FILE)
+
+
+@contextmanager
+def _index_lock(folder, exclusive):
+    """
+    Lock entre processos: a troca de index.faiss + index_ids.npy (exclusivo)
+    não acontece no meio de uma leitura (compartilhado)
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(Path(folder) / LOCK_FILE, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _mmap_flags(kind=None):
+    """Flags de mapeamento a tentar, na ordem, para o tipo de índice (IndexSpec.kind)"""
+    read_only = faiss.IO_FLAG_READ_ONLY
+    if kind and kind.startswith("ivf"):
+        return [faiss.IO_FLAG_MMAP | read_only, faiss.IO_FLAG_MMAP_IFC | read_only]
+    return [faiss.IO_FLAG_MMAP_IFC | read_only, faiss.IO_FLAG_MMAP | read_only]
+
+
+def read_faiss_index(path, mmap=None, kind=None):
+    """Lê um índice FAISS, mapeado em memória (somente leitura) quando possível"""
+    mmap = INDEX_MMAP if mmap is None else mmap
+    if mmap:
+        for flags in _mmap_flags(kind):
+            try:
+                return faiss.read_index(str(path), flags)
+            except RuntimeError:
+                continue
+    return faiss.read_index(str(path))
+
+
+def _replace_atomically(path, write):
+    """Grava em <path>.tmp com write(tmp_path) e troca o arquivo final com os.replace"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def write_vectorstore(vectorstore, folder):
+    """
+    Grava o vectorstore em folder: chunks no SQLite, depois index_ids.npy e
+    index.faiss trocados atomicamente. Chunks que nem a versão anterior nem a
+    nova referenciam são removidos do SQLite.
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    docstore = vectorstore.docstore
+    if isinstance(docstore, SQLiteDocstore):
+        store = docstore.store
+    else:
+        # Vectorstore em memória (índice novo ou migrado do index.pkl)
+        store = ChunkStore(folder / CHUNK_STORE_FILE)
+        store.put_many(
+            (doc_id, docstore.search(doc_id))
+            for doc_id in vectorstore.index_to_docstore_id.values()
+        )
+
+    ids_path = folder / INDEX_IDS_FILE
+    previous_ids = set()
+    if ids_path.exists():
+        previous_ids = {doc_id.decode("utf-8") for doc_id in read_ids(ids_path)}
+
+    with _index_lock(folder, exclusive=True):
+        _replace_atomically(ids_path, lambda tmp_path: write_ids(tmp_path, vectorstore.index_to_docstore_id))
+        _replace_atomically(folder / INDEX_FAISS_FILE, lambda tmp_path: faiss.write_index(vectorstore.index, str(tmp_path)))
+
+    # Só agora, com o novo índice no lugar, a busca lexical passa para a nova
+    # versão; o texto dos chunks removidos fica para quem ainda lê a anterior
+    store.sync_lexical(vectorstore.index_to_docstore_id.values())
+    store.retain(previous_ids.union(vectorstore.index_to_docstore_id.values()))
+    if not isinstance(docstore, SQLiteDocstore):
+        store.close()
+
+    legacy_pkl = folder / LEGACY_PKL_FILE
+    if legacy_pkl.exists():
+        legacy_pkl.unlink()
+
+
+def _read_legacy(folder, mmap, kind):
+    """Lê um índice salvo pelo FAISS.save_local (index.pkl), só para migração"""
+    index = read_faiss_index(folder / INDEX_FAISS_FILE, mmap=mmap, kind=kind)
+    with open(folder / LEGACY_PKL_FILE, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return index, docstore, index_to_docstore_id
+
+
+def read_vectorstore(folder, embeddings, mmap=None, kind=None):
+    """
+    Lê o vectorstore salvo em folder.
+
+    Args:
+        mmap: Mapeia vetores e ids em memória, somente leitura (padrão: INDEX_MMAP).
+              Use False quando o vectorstore for alterado (index.py)
+        kind: Tipo do índice (IndexSpec.kind), para escolher o modo de mapeamento
+    """
+    folder = Path(folder)
+    mmap = INDEX_MMAP if mmap is None else mmap
+    if not (folder / INDEX_IDS_FILE).exists() and (folder / LEGACY_PKL_FILE).exists():
+        index, docstore, index_to_docstore_id = _read_legacy(folder, mmap, kind)
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+    for _ in range(_LOAD_RETRIES):
+        with _index_lock(folder, exclusive=False):
+            index = read_faiss_index(folder / INDEX_FAISS_FILE, mmap=mmap, kind=kind)
+            ids = read_ids(folder / INDEX_IDS_FILE, mmap=mmap)
+        if index.ntotal == len(ids):
+            break
+        # Sem lock entre processos, uma troca pode ter ocorrido no meio da leitura
+        time.sleep(0.1)
+    else:
+        raise RuntimeError(f"Índice inconsistente em {folder}: index.faiss e {INDEX_IDS_FILE} não correspondem")
+
+    if mmap:
+        index_to_docstore_id = PositionMap(ids)
+    else:
+        # O index.py altera o mapeamento (adições e remoções): dict em memória
+        index_to_docstore_id = {i: doc_id.decode("utf-8") for i, doc_id in enumerate(ids)}
+    docstore = SQLiteDocstore(ChunkStore(folder / CHUNK_STORE_FILE))
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
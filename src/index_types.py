@@ -0,0 +1,220 @@
+"""
+Tipos de índice FAISS selecionáveis na indexação.
+
+O index.py sempre acumula os vetores num índice flat (busca exata) e, no fim,
+converte para o tipo pedido, treinando com uma amostra dos vetores. O tipo e
+os parâmetros de busca ficam em .rag_index_meta.json (`index_spec`) e são
+aplicados ao carregar o índice.
+
+Formato da especificação (`--index` / INDEX_SPEC): `tipo[:param=valor,...]`
+
+- `flat`: busca exata, O(N) (padrão)
+- `ivfflat:nlist=4096,nprobe=16`: listas invertidas; nlist=auto usa 4*sqrt(N)
+- `hnsw:m=32,ef_construction=40,ef_search=64`: grafo HNSW
+- `ivfpq:nlist=4096,nprobe=16,m=16,nbits=8`: listas invertidas com
+  quantização por produto (m deve dividir a dimensão dos vetores)
+"""
+import math
+import os
+import threading
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INDEX_SPEC = os.getenv("INDEX_SPEC")
+INDEX_TRAIN_SAMPLE = int(os.getenv("INDEX_TRAIN_SAMPLE", "100000"))
+
+# Vetores copiados por vez ao converter índices grandes
+_COPY_BLOCK = 65536
+
+# O mapa direto de um índice IVF é criado uma vez, mesmo com buscas em paralelo
+_direct_map_lock = threading.Lock()
+
+INDEX_TYPES = {
+    "flat": {},
+    "ivfflat": {"nlist": "auto", "nprobe": 16},
+    "hnsw": {"m": 32, "ef_construction": 40, "ef_search": 64},
+    "ivfpq": {"nlist": "auto", "nprobe": 16, "m": 16, "nbits": 8},
+}
+
+
+class IndexSpec:
+    """Tipo de índice FAISS e seus parâmetros"""
+
+    def __init__(self, kind="flat", **params):
+        kind = kind.lower()
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"Tipo de índice desconhecido: {kind} (use {', '.join(INDEX_TYPES)})")
+        unknown = set(params) - set(INDEX_TYPES[kind])
+        if unknown:
+            raise ValueError(f"Parâmetros inválidos para {kind}: {', '.join(sorted(unknown))}")
+        self.kind = kind
+        self.params = dict(INDEX_TYPES[kind], **params)
+
+    @classmethod
+    def parse(cls, text):
+        """Lê uma especificação no formato `tipo:param=valor,...`"""
+        kind, _, rest = text.strip().partition(":")
+        params = {}
+        for item in filter(None, (p.strip() for p in rest.split(","))):
+            name, sep, value = item.partition("=")
+            if not sep:
+                raise ValueError(f"Parâmetro de índice inválido: {item!r} (use nome=valor)")
+            value = value.strip()
+            params[name.strip()] = value if value == "auto" else int(value)
+        return cls(kind or "flat", **params)
+
+    @classmethod
+    def from_meta(cls, data):
+        """Especificação gravada em .rag_index_meta.json (flat se ausente)"""
+        if not data:
+            return cls()
+        data = dict(data)
+        return cls(data.pop("type", "flat"), **data)
+
+    def to_meta(self):
+        return {"type": self.kind, **self.params}
+
+    @property
+    def is_flat(self):
+        return self.kind == "flat"
+
+    def __eq__(self, other):
+        return isinstance(other, IndexSpec) and self.to_meta() == other.to_meta()
+
+    def __str__(self):
+        params = ",".join(f"{k}={v}" for k, v in self.params.items())
+        return f"{self.kind}:{params}" if params else self.kind
+
+    def _nlist(self, ntotal):
+        nlist = self.params["nlist"]
+        if nlist == "auto":
+            nlist = int(4 * math.sqrt(ntotal))
+        # O FAISS precisa de pelo menos nlist vetores de treino
+        return max(1, min(nlist, ntotal))
+
+    def min_train_size(self):
+        """Mínimo de vetores para treinar este tipo de índice"""
+        if self.kind == "ivfpq":
+            return 2 ** self.params["nbits"]
+        return 1
+
+    def factory_string(self, dim, ntotal):
+        """String do faiss.index_factory para `ntotal` vetores de dimensão `dim`"""
+        if self.kind == "flat":
+            return "Flat"
+        if self.kind == "hnsw":
+            return f"HNSW{self.params['m']}"
+        if self.kind == "ivfflat":
+            return f"IVF{self._nlist(ntotal)},Flat"
+        m = self.params["m"]
+        if dim % m:
+            raise ValueError(f"ivfpq: m={m} deve dividir a dimensão dos vetores ({dim})")
+        return f"IVF{self._nlist(ntotal)},PQ{m}x{self.params['nbits']}"
+
+
+def default_spec(stored=None):
+    """Especificação a usar quando nenhuma é pedida: INDEX_SPEC, senão a gravada, senão flat"""
+    if INDEX_SPEC:
+        return IndexSpec.parse(INDEX_SPEC)
+    return stored or IndexSpec()
+
+
+def _enable_reconstruct(index):
+    """Índices IVF precisam do mapa direto para ler vetores por posição"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None or ivf.direct_map.type:
+        return
+    with _direct_map_lock:
+        if not ivf.direct_map.type:
+            ivf.make_direct_map()
+
+
+def reconstruct(index, start, count):
+    """Lê `count` vetores a partir da posição `start` de qualquer índice"""
+    _enable_reconstruct(index)
+    return index.reconstruct_n(start, count)
+
+
+def reconstruct_batch(index, positions):
+    """Lê os vetores das posições indicadas de qualquer índice"""
+    _enable_reconstruct(index)
+    return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+
+
+def exact_search(index, vector, k, positions):
+    """
+    Busca exata de `vector` entre as posições indicadas: os vetores são lidos
+    do índice e pontuados de uma vez (L2 ao quadrado, como o FAISS).
+
+    Returns:
+        (distâncias, posições) dos k mais próximos, do mais próximo ao mais distante
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    vectors = reconstruct_batch(index, positions)
+    distances = ((vectors - np.asarray(vector, dtype=np.float32)) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:k]
+    return distances[order], positions[order]
+
+
+def apply_search_params(index, spec):
+    """Aplica ao índice os parâmetros de busca da especificação (nprobe, efSearch)"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and "nprobe" in spec.params:
+        ivf.nprobe = spec.params["nprobe"]
+    if hasattr(index, "hnsw") and "ef_search" in spec.params:
+        index.hnsw.efSearch = spec.params["ef_search"]
+
+
+def search_parameters(index, selector, exhaustive=False):
+    """
+    SearchParameters que restringem a busca às posições de `selector`,
+    mantendo o nprobe/efSearch configurados no índice.
+    exhaustive: em índices IVF, visita todas as listas (nprobe=nlist), para
+    que posições em listas fora do nprobe não fiquem de fora
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist if exhaustive else ivf.nprobe)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def convert_index(index, spec, train_sample=None, log=print):
+    """
+    Cria um índice do tipo `spec` com os mesmos vetores (e posições) de `index`.
+    A amostra de treino tem até train_sample vetores escolhidos uniformemente.
+
+    Returns:
+        (novo índice, especificação efetiva); se houver poucos vetores para
+        treinar o tipo pedido, o índice é mantido e a especificação vira flat
+    """
+    ntotal, dim = index.ntotal, index.d
+    if spec.is_flat and isinstance(index, faiss.IndexFlat):
+        return index, spec
+    if ntotal < spec.min_train_size():
+        log(f"⚠️ Apenas {ntotal} vetores: poucos para treinar {spec.kind}; mantendo índice flat")
+        spec = IndexSpec()
+        if isinstance(index, faiss.IndexFlat):
+            return index, spec
+
+    new_index = faiss.index_factory(dim, spec.factory_string(dim, ntotal), faiss.METRIC_L2)
+    if spec.kind == "hnsw":
+        new_index.hnsw.efConstruction = spec.params["ef_construction"]
+
+    if not new_index.is_trained:
+        sample_size = min(ntotal, train_sample or INDEX_TRAIN_SAMPLE)
+        sample_size = max(sample_size, min(ntotal, spec.min_train_size()))
+        positions = np.sort(np.random.default_rng(0).choice(ntotal, size=sample_size, replace=False))
+        log(f"🎯 Treinando índice {spec} com {sample_size} de {ntotal} vetores")
+        new_index.train(reconstruct_batch(index, positions))
+
+    # Mesma ordem de inserção: as posições continuam batendo com index_to_docstore_id
+    for start in range(0, ntotal, _COPY_BLOCK):
+        new_index.add(reconstruct(index, start, min(_COPY_BLOCK, ntotal - start)))
+    apply_search_params(new_index, spec)
+    return new_index, spec
@@ -0,0 +1,157 @@
+"""
+Manifesto de indexação incremental.
+
+Guarda, para cada arquivo indexado, o hash do conteúdo e a lista de chunks
+(id no docstore + hash do texto). Com ele o index.py sabe quais arquivos
+mudaram, quais chunks podem ser mantidos e quais vetores devem ser removidos.
+
+Formato de .rag_manifest.json:
+{
+  "version": 1,
+  "files": {
+    "<path absoluto>": {"hash": "<sha256|null>", "chunks": [["<id>", "<sha256>"], ...]}
+  }
+}
+
+Metadados do índice em .rag_index_meta.json (reescrito a cada gravação do índice):
+{
+  "version": "<id único desta gravação>",
+  "corpus_version": "<sha256 dos arquivos indexados, exceto chat_history/>",
+  "updated_at": "<ISO 8601>"
+}
+"""
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+MANIFEST_FILE = ".rag_manifest.json"
+MANIFEST_VERSION = 1
+INDEX_META_FILE = ".rag_index_meta.json"
+
+
+def content_hash(text):
+    """Hash SHA-256 (hex) de um texto"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source, chunk_hash, occurrence=0):
+    """
+    ID determinístico de um chunk no docstore.
+    occurrence diferencia chunks com o mesmo texto dentro do mesmo arquivo.
+    """
+    return hashlib.sha1(f"{source}\0{chunk_hash}\0{occurrence}".encode("utf-8")).hexdigest()
+
+
+class IndexManifest:
+    """Hashes por arquivo e por chunk do índice de um BASE_DIR"""
+
+    def __init__(self, files=None):
+        # source -> {"hash": str | None, "chunks": [[id, hash], ...]}
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, base_dir):
+        """Carrega o manifesto de base_dir, ou None se não existir/for inválido"""
+        path = Path(base_dir) / MANIFEST_FILE
+        if not path.exists():
+            return None
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, OSError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(data.get("files", {}))
+
+    @classmethod
+    def from_docstore(cls, vectorstore):
+        """
+        Reconstrói o manifesto a partir dos documentos de um vectorstore existente
+        (índices criados antes do manifesto). O hash do arquivo fica desconhecido,
+        então todo arquivo é re-dividido na próxima execução, mas chunks com o
+        mesmo texto continuam sendo reaproveitados sem novo embedding.
+        """
+        files = {}
+        for doc_id in vectorstore.index_to_docstore_id.values():
+            doc = vectorstore.docstore.search(doc_id)
+            if isinstance(doc, str):
+                continue
+            source = str(Path(doc.metadata.get("source", "")).resolve())
+            entry = files.setdefault(source, {"hash": None, "chunks": []})
+            entry["chunks"].append([doc_id, content_hash(doc.page_content)])
+        return cls(files)
+
+    def save(self, base_dir):
+        """Grava o manifesto de forma atômica"""
+        path = Path(base_dir) / MANIFEST_FILE
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(
+            json.dumps({"version": MANIFEST_VERSION, "files": self.files}, ensure_ascii=False),
+            encoding="utf-8"
+        )
+        os.replace(tmp_path, path)
+
+    def file_hash(self, source):
+        entry = self.files.get(source)
+        return entry["hash"] if entry else None
+
+    def chunk_ids(self, source):
+        """IDs dos chunks de um arquivo"""
+        entry = self.files.get(source)
+        return [doc_id for doc_id, _ in entry["chunks"]] if entry else []
+
+    def chunks_by_hash(self, source):
+        """hash -> [ids] dos chunks atuais de um arquivo"""
+        by_hash = {}
+        entry = self.files.get(source)
+        if entry:
+            for doc_id, chunk_hash in entry["chunks"]:
+                by_hash.setdefault(chunk_hash, []).append(doc_id)
+        return by_hash
+
+    def set_file(self, source, file_hash, chunks):
+        """Registra o estado de um arquivo: chunks é uma lista de (id, hash)"""
+        self.files[source] = {"hash": file_hash, "chunks": [list(c) for c in chunks]}
+
+    def remove_file(self, source):
+        """Remove um arquivo do manifesto e retorna os IDs dos seus chunks"""
+        entry = self.files.pop(source, None)
+        return [doc_id for doc_id, _ in entry["chunks"]] if entry else []
+
+    def corpus_version(self, base_dir):
+        """
+        Hash do conjunto (arquivo, hash) indexado, sem os arquivos de chat_history/.
+        Muda quando os documentos mudam, mas não quando apenas o histórico cresce.
+        """
+        chat_history_dir = str(Path(base_dir).resolve() / "chat_history") + os.sep
+        digest = hashlib.sha256()
+        for source in sorted(self.files):
+            if source.startswith(chat_history_dir):
+                continue
+            digest.update(f"{source}\0{self.files[source]['hash']}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+
+def read_index_meta(base_dir):
+    """Lê .rag_index_meta.json de base_dir ({} se não existir/for inválido)"""
+    path = Path(base_dir) / INDEX_META_FILE
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError, OSError):
+        return {}
+
+
+def write_index_meta(base_dir, **fields):
+    """Grava .rag_index_meta.json de forma atômica, com um novo `version`"""
+    meta = read_index_meta(base_dir)
+    meta.update(fields)
+    meta["version"] = uuid.uuid4().hex
+    meta["updated_at"] = datetime.now().isoformat()
+    path = Path(base_dir) / INDEX_META_FILE
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+    return meta
@@ -0,0 +1,65 @@
+"""
+Reordenação por maximal marginal relevance (MMR).
+
+Com chunk_overlap no index.py, os k chunks mais próximos costumam ser trechos
+vizinhos (quase iguais) do mesmo arquivo. O MMR busca MMR_FETCH_K candidatos
+e escolhe k deles equilibrando relevância para a pergunta e diferença para os
+já escolhidos:
+
+    score = λ * sim(pergunta, chunk) - (1 - λ) * max sim(chunk, escolhidos)
+
+λ = 1 mantém a ordem por relevância; valores menores favorecem diversidade.
+Os vetores dos candidatos vêm da própria busca (search_and_reconstruct do
+FAISS), sem novos embeddings.
+"""
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Desativado por padrão: MMR=1 ativa (também por requisição)
+MMR_ENABLED = os.getenv("MMR", "0") == "1"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "20"))
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def mmr_select(query_vector, vectors, k, lambda_mult=None):
+    """
+    Escolhe k linhas de `vectors` por MMR em relação a query_vector (cosseno).
+
+    Returns:
+        Índices das linhas escolhidas, na ordem de escolha
+    """
+    lambda_mult = MMR_LAMBDA if lambda_mult is None else lambda_mult
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    if n == 0 or k <= 0:
+        return []
+    k = min(k, n)
+
+    vectors = _normalize_rows(vectors)
+    query = _normalize_rows(np.asarray(query_vector, dtype=np.float32)[np.newaxis, :])[0]
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    # Maior similaridade de cada candidato com os já escolhidos
+    redundancy = similarity[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
@@ -0,0 +1,193 @@
+"""
+Pós-processamento de respostas do chat, fora do caminho crítico.
+
+Depois que a resposta é entregue, um pool limitado de threads gera o título,
+grava o markdown em chat_history/ e atualiza font-refs.json. A reindexação
+incremental é agrupada por BASE_DIR: uma rajada de mensagens agenda uma única
+atualização do índice (após REINDEX_DEBOUNCE_SECONDS sem novas mensagens), e
+mensagens que chegam durante uma reindexação geram apenas mais uma execução.
+"""
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+POSTPROCESS_WORKERS = int(os.getenv("POSTPROCESS_WORKERS", "2"))
+POSTPROCESS_MAX_PENDING = int(os.getenv("POSTPROCESS_MAX_PENDING", "100"))
+REINDEX_DEBOUNCE_SECONDS = float(os.getenv("REINDEX_DEBOUNCE_SECONDS", "5"))
+
+
+def write_chat_history(base_dir, question, answer, title, sources=None):
+    """
+    Salva a pergunta e resposta em chat_history/<timestamp>_message.md e
+    registra as fontes em chat_history/font-refs.json.
+
+    Returns:
+        Nome do arquivo de mensagem criado
+    """
+    chat_history_dir = os.path.join(base_dir, "chat_history")
+    os.makedirs(chat_history_dir, exist_ok=True)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    message_filename = f"{timestamp}_message.md"
+    message_file = os.path.join(chat_history_dir, message_filename)
+    with open(message_file, "w", encoding="utf-8") as f:
+        f.write(f"# {title}\n\n")
+        f.write("# Pergunta\n\n")
+        f.write(f"{question}\n\n")
+        f.write("# Resposta\n\n")
+        f.write(f"{answer}\n\n")
+
+    # Carregar JSON existente ou criar novo
+    font_refs_file = os.path.join(chat_history_dir, "font-refs.json")
+    font_refs = {}
+    if os.path.exists(font_refs_file):
+        try:
+            with open(font_refs_file, "r", encoding="utf-8") as f:
+                font_refs = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            font_refs = {}
+
+    font_refs[message_filename] = sources if sources else []
+
+    # Gravação atômica para leitores concorrentes nunca verem JSON pela metade
+    tmp_file = font_refs_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(font_refs, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, font_refs_file)
+    return message_filename
+
+
+def reindex_chat_history(base_dir, cancel=None):
+    """
+    Atualização incremental do índice que contém o chat_history/, no próprio processo.
+    cancel: interrompe a indexação entre arquivos (ver index.run_index)
+    """
+    from index import run_index
+    from shards import owner_shard, read_shards
+    shard = owner_shard(read_shards(base_dir), Path(base_dir) / "chat_history")
+    run_index(base_dir, partial=True, silent=True, shard=shard, cancel=cancel)
+
+
+class PostProcessor:
+    """Gera título, salva histórico e agenda reindexação em background"""
+
+    def __init__(self, engine, workers=None, max_pending=None, debounce=None, reindex=None):
+        self.engine = engine
+        self.debounce = REINDEX_DEBOUNCE_SECONDS if debounce is None else debounce
+        self.reindex = reindex or reindex_chat_history
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, workers or POSTPROCESS_WORKERS),
+            thread_name_prefix="postprocess"
+        )
+        # Limita mensagens pendentes: submit() bloqueia se o pool estiver saturado
+        self._slots = threading.BoundedSemaphore(max(1, max_pending or POSTPROCESS_MAX_PENDING))
+        self._lock = threading.Lock()
+        # Sinaliza o fim de reindexações (usado por shutdown)
+        self._idle = threading.Condition(self._lock)
+        self._closing = False
+        # base_dir -> lock de escrita do chat_history (font-refs.json)
+        self._history_locks = {}
+        # base_dir -> {"timer": Timer | None, "running": bool, "dirty": bool}
+        self._reindex_state = {}
+
+    def submit(self, base_dir, question, answer, sources=None, title=None):
+        """
+        Agenda o pós-processamento de uma resposta.
+
+        Returns:
+            Future com {"title": ..., "filename": ...}
+        """
+        base_dir = str(Path(base_dir).resolve())
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._process, base_dir, question, answer, sources, title)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _process(self, base_dir, question, answer, sources, title):
+        if title is None:
+            title = self.engine.generate_title(question, answer)
+        with self._lock:
+            history_lock = self._history_locks.setdefault(base_dir, threading.Lock())
+        with history_lock:
+            filename = write_chat_history(base_dir, question, answer, title, sources)
+        self.schedule_reindex(base_dir)
+        return {"title": title, "filename": filename}
+
+    def schedule_reindex(self, base_dir, delay=None):
+        """Agenda (ou adia) a reindexação incremental de base_dir"""
+        delay = self.debounce if delay is None else delay
+        with self._lock:
+            state = self._reindex_state.setdefault(base_dir, {"timer": None, "running": False, "dirty": False})
+            if state["running"]:
+                # Já há uma reindexação em andamento: roda mais uma vez ao final
+                state["dirty"] = True
+                return
+            if self._closing:
+                # Encerrando: shutdown() executa a reindexação pendente diretamente
+                state["dirty"] = True
+                return
+            if state["timer"] is not None:
+                state["timer"].cancel()
+            timer = threading.Timer(delay, self._run_reindex, args=(base_dir,))
+            timer.daemon = True
+            state["timer"] = timer
+            timer.start()
+
+    def _run_reindex(self, base_dir):
+        with self._lock:
+            state = self._reindex_state[base_dir]
+            if state["running"]:
+                state["dirty"] = True
+                return
+            state["timer"] = None
+            state["running"] = True
+        try:
+            self.reindex(base_dir)
+        except Exception as e:
+            print(f"⚠️ Erro ao reindexar {base_dir}: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                state["running"] = False
+                rerun = state["dirty"] and not self._closing
+                if rerun:
+                    state["dirty"] = False
+                self._idle.notify_all()
+        if rerun:
+            self.schedule_reindex(base_dir)
+
+    def shutdown(self, wait=True):
+        """Conclui mensagens pendentes e executa já as reindexações agendadas"""
+        self._executor.shutdown(wait=wait)
+        if not wait:
+            return
+        while True:
+            with self._lock:
+                self._closing = True
+                # Espera reindexações em andamento terminarem
+                while any(state["running"] for state in self._reindex_state.values()):
+                    self._idle.wait()
+                pending = []
+                for base_dir, state in self._reindex_state.items():
+                    if state["timer"] is not None:
+                        state["timer"].cancel()
+                        state["timer"] = None
+                        state["dirty"] = True
+                    if state["dirty"]:
+                        state["dirty"] = False
+                        pending.append(base_dir)
+            if not pending:
+                return
+            for base_dir in pending:
+                self._run_reindex(base_dir)
@@ -0,0 +1,138 @@
+"""
+Leitura do .rag_priorities e associação de arquivos às entradas.
+
+Cada linha define uma entrada `priority, path, alias`: usada pelo
+prompt_preview.py para separar o contexto em blocos por prioridade e pelo
+index.py para criar um shard por entrada (ver shards.py).
+
+Um arquivo pertence à entrada (com priority != -1) de caminho mais longo que
+seja prefixo do seu caminho relativo ao BASE_DIR, comparando diretórios
+inteiros: `docs/api` vale para `docs/api/x.md`, mas não para `docs/api-old/x.md`;
+a entrada `.` vale para todo o BASE_DIR. O index.py resolve isso uma
+vez por chunk, com uma trie (PriorityMatcher), e grava o caminho da entrada
+nos metadados (`priority_path`); a versão das entradas usada fica em
+.rag_index_meta.json (`priorities_version`). Os chunks só são reescritos
+quando essa versão muda.
+"""
+import hashlib
+import os
+
+
+def read_rag_priorities(base_dir):
+    """
+    Lê .rag_priorities em base_dir e retorna uma lista de entradas:
+    [{ "priority": int, "path": <rel_path>, "alias": <str|None> }, ...]
+    Retorna None se arquivo não existir ou estiver vazio.
+    Formato por linha: priority, path, alias
+    """
+    priorities_file = os.path.join(base_dir, ".rag_priorities")
+    if not os.path.exists(priorities_file):
+        return None
+
+    entries = []
+    with open(priorities_file, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = [p.strip() for p in line.split(",")]
+            if len(parts) < 2:
+                continue
+            try:
+                priority = int(parts[0])
+            except Exception:
+                continue
+            path = parts[1]
+            alias = parts[2] if len(parts) >= 3 else None
+            if not os.path.isabs(path):
+                abs_path = os.path.normpath(os.path.join(base_dir, path))
+            else:
+                abs_path = os.path.normpath(path)
+            try:
+                rel_path = os.path.relpath(abs_path, base_dir)
+            except Exception:
+                rel_path = abs_path
+            entries.append({"priority": priority, "path": rel_path, "alias": alias})
+
+    return entries or None
+
+
+def context_entries(entries):
+    """Entradas usadas no contexto (priority != -1)"""
+    return [e for e in entries or [] if e["priority"] != -1]
+
+
+# Muda quando a regra de associação muda, para o index.py reassociar os chunks
+_MATCH_RULE = "componentes"
+
+
+def priorities_version(entries):
+    """Hash dos caminhos das entradas do contexto: muda só quando a associação pode mudar"""
+    paths = sorted({e["path"] for e in context_entries(entries)})
+    return hashlib.sha256("\n".join([_MATCH_RULE] + paths).encode("utf-8")).hexdigest()
+
+
+class PriorityMatcher:
+    """Trie de caracteres dos caminhos das entradas, para busca do prefixo mais longo"""
+
+    # Chave do nó que marca o fim de um caminho de entrada
+    _END = "\0"
+
+    def __init__(self, entries, base_dir):
+        self.base_dir = str(base_dir)
+        self.entries = context_entries(entries)
+        self.version = priorities_version(entries)
+        self._root = {}
+        self._by_path = {}
+        for idx, entry in enumerate(self.entries):
+            self._by_path.setdefault(entry["path"], idx)
+            node = self._root
+            # "." (o próprio BASE_DIR) fica na raiz da trie: casa com tudo
+            for char in "" if entry["path"] == "." else entry["path"]:
+                node = node.setdefault(char, {})
+            # Caminhos repetidos: vale a primeira entrada
+            node.setdefault(self._END, idx)
+
+    @classmethod
+    def load(cls, base_dir):
+        """Matcher do .rag_priorities de base_dir (sem entradas se não existir)"""
+        return cls(read_rag_priorities(str(base_dir)), base_dir)
+
+    def match_relative(self, rel_path):
+        """Índice (em self.entries) da entrada de prefixo mais longo de rel_path, ou None"""
+        best = self._root.get(self._END)
+        node = self._root
+        for i, char in enumerate(rel_path):
+            node = node.get(char)
+            if node is None:
+                break
+            # Só vale um prefixo que termine num limite de diretório
+            if self._END in node and (i + 1 == len(rel_path) or rel_path[i + 1] == "/"):
+                best = node[self._END]
+        return best
+
+    def match(self, source):
+        """Índice da entrada do arquivo source (absoluto ou relativo ao BASE_DIR), ou None"""
+        try:
+            rel_path = os.path.relpath(source or "", self.base_dir)
+        except ValueError:
+            rel_path = source or ""
+        return self.match_relative(rel_path)
+
+    def index_of_path(self, path):
+        """Índice da entrada com o caminho gravado em `priority_path`, ou None"""
+        return None if path is None else self._by_path.get(path)
+
+    def match_doc(self, doc, stored=True):
+        """
+        Índice da entrada de um documento: lê `priority_path` dos metadados
+        (se stored e presente) ou resolve pelo source
+        """
+        if stored and "priority_path" in doc.metadata:
+            return self.index_of_path(doc.metadata["priority_path"])
+        return self.match(doc.metadata.get("source"))
+
+    def match_path(self, source):
+        """Caminho da entrada do arquivo source (valor de `priority_path`), ou None"""
+        idx = self.match(source)
+        return None if idx is None else self.entries[idx]["path"]
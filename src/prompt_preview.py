@@ -1,5 +1,3 @@
-from langchain_ollama import OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import PromptTemplate
 from langchain_core.documents import Document
 import os
@@ -10,15 +8,19 @@ from datetime import datetime, timedelta
 import pyperclip
 from pathlib import Path
 
+from retrieval import (
+    get_vectorstores, partition_sizes, search_entries, stored_priorities_valid,
+    search as retrieval_search
+)
+from priorities import PriorityMatcher, context_entries, read_rag_priorities
+from query_cache import get_cached_embeddings
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
 EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "nomic-embed-text")
 RETRIEVER_K = int(os.getenv("RETRIEVER_K", "4"))
 
-# Embeddings
-embeddings = OllamaEmbeddings(model=EMBEDDINGS_MODEL)
-
 def get_base_dir():
     """Obtém BASE_DIR da variável de ambiente, ou do .env como fallback"""
     base_dir = os.getenv("BASE_DIR")
@@ -26,8 +28,8 @@ def get_base_dir():
         raise ValueError("BASE_DIR não configurado na variável de ambiente ou arquivo .env")
     return Path(base_dir)
 
-# Embeddings (criado uma vez, reutilizado)
-embeddings = OllamaEmbeddings(model=EMBEDDINGS_MODEL)
+# Embeddings (criado uma vez, reutilizado; perguntas repetidas vêm do cache)
+embeddings = get_cached_embeddings(EMBEDDINGS_MODEL)
 
 # Prompt original (idêntico ao do chat)
 prompt = PromptTemplate(
@@ -70,71 +72,24 @@ def format_docs(docs, base_dir):
 
     return "\n\n---\n\n".join(blocks)
 
-def _read_rag_priorities(base_dir):
-    """
-    Lê .rag_priorities em base_dir e retorna uma lista de entradas:
-    [{ "priority": int, "path": <rel_path>, "alias": <str|None> }, ...]
-    Retorna None se arquivo não existir ou estiver vazio.
-    Formato por linha: priority, path, alias
-    """
-    priorities_file = os.path.join(base_dir, ".rag_priorities")
-    if not os.path.exists(priorities_file):
-        return None
-
-    entries = []
-    with open(priorities_file, encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-            parts = [p.strip() for p in line.split(",")]
-            if len(parts) < 2:
-                continue
-            try:
-                priority = int(parts[0])
-            except Exception:
-                continue
-            path = parts[1]
-            alias = parts[2] if len(parts) >= 3 else None
-            if not os.path.isabs(path):
-                abs_path = os.path.normpath(os.path.join(base_dir, path))
-            else:
-                abs_path = os.path.normpath(path)
-            try:
-                rel_path = os.path.relpath(abs_path, base_dir)
-            except Exception:
-                rel_path = abs_path
-            entries.append({"priority": priority, "path": rel_path, "alias": alias})
-
-    return entries or None
-
-def _assign_docs_to_entries(docs, entries, base_dir):
+def _assign_docs_to_entries(docs, entries, base_dir, stored=False):
     """
     Atribui cada doc a uma entrada do .rag_priorities (ou 'others' se não casar).
+    Com stored, usa o `priority_path` gravado pelo index.py nos metadados do chunk.
     Retorna (entry_docs_map, others_list) onde entry_docs_map é dict idx -> [docs].
     """
+    matcher = PriorityMatcher(entries, base_dir)
     entry_docs = {i: [] for i in range(len(entries))}
     others = []
     for doc in docs:
-        src = doc.metadata.get("source", "") or ""
-        try:
-            relsrc = os.path.relpath(src, base_dir)
-        except Exception:
-            relsrc = src
-        best_idx = None
-        best_len = -1
-        for idx, e in enumerate(entries):
-            p = e["path"]
-            if relsrc.startswith(p) and len(p) > best_len:
-                best_idx = idx
-                best_len = len(p)
-        if best_idx is not None:
-            entry_docs[best_idx].append(doc)
+        idx = matcher.match_doc(doc, stored=stored)
+        if idx is not None:
+            entry_docs[idx].append(doc)
         else:
             others.append(doc)
     return entry_docs, others
 
-def format_docs_by_priorities(docs, entries, base_dir):
+def format_docs_by_priorities(docs, entries, base_dir, stored=False):
     """
     Formata os documentos separando blocos por cada entrada do .rag_priorities.
     Cada bloco começa com:
@@ -144,7 +99,7 @@ def format_docs_by_priorities(docs, entries, base_dir):
     Seguido dos blocos por arquivo (reaproveita format_docs para o conteúdo interno).
     Ao final, adiciona um bloco 'Outros' para docs sem match.
     """
-    entry_docs_map, others = _assign_docs_to_entries(docs, entries, base_dir)
+    entry_docs_map, others = _assign_docs_to_entries(docs, entries, base_dir, stored=stored)
 
     blocks = []
     # ordenar entries por priority asc (priority 0 primeiro)
@@ -311,7 +266,7 @@ def _load_chat_history_docs(chat_history_path: str, chat_span_hours: int, base_d
     
     return [doc for doc, _ in docs]
 
-def generate_prompt_markdown(question: str, base_dir: str = None, retriever_k: int = None, chat_history_path: str = None, chat_span: int = None) -> str:
+def generate_prompt_markdown(question: str, base_dir: str = None, retriever_k: int = None, chat_history_path: str = None, chat_span: int = None, retrieval_mode: str = None, mmr: bool = None, mmr_lambda: float = None) -> str:
     """
     Gera o prompt completo (contexto + pergunta) em Markdown
     sem chamar o modelo.
@@ -322,13 +277,15 @@ def generate_prompt_markdown(question: str, base_dir: str = None, retriever_k: i
         retriever_k: Número de documentos a recuperar. Se None, usa RETRIEVER_K do .env
         chat_history_path: Caminho do diretório de histórico de chat. Se None, usa base_dir/chat_history
         chat_span: Número de horas para incluir histórico de chat. Se None, não inclui histórico
+        retrieval_mode: vector, lexical ou hybrid. Se None, usa RETRIEVAL_MODE do .env
+        mmr: Reordena a busca geral por diversidade (MMR). Se None, usa MMR do .env
+        mmr_lambda: λ do MMR (0 = diversidade, 1 = relevância). Se None, usa MMR_LAMBDA do .env
     """
     # Usar base_dir fornecido ou fallback para BASE_DIR da variável de ambiente
     if base_dir is None:
         base_dir = str(get_base_dir())
-    else:
-        # Garantir que base_dir é um Path absoluto
-        base_dir_path = Path(base_dir).resolve()
+    # Garantir que base_dir é um Path absoluto
+    base_dir_path = Path(base_dir).resolve()
     
     # Converter para string para uso consistente em todas as operações
     base_dir_str = str(base_dir_path)
@@ -357,63 +314,35 @@ def generate_prompt_markdown(question: str, base_dir: str = None, retriever_k: i
     if retriever_k is None:
         retriever_k = RETRIEVER_K
     
-    # Carregar vectorstore dinamicamente baseado no base_dir
-    # FAISS.load_local espera o diretório onde estão os arquivos index.faiss e index.pkl
-    vectorstore_path = base_dir_str
-    # Sempre carregar do base_dir fornecido (não usar cache global)
-    local_vectorstore = FAISS.load_local(
-        vectorstore_path,
-        embeddings,
-        allow_dangerous_deserialization=True
-    )
-    local_retriever = local_vectorstore.as_retriever(search_kwargs={"k": retriever_k})
-    
+    # Índices do base_dir (raiz e shards) pelo cache compartilhado
+    # (cada índice só é relido do disco quando seus arquivos mudam)
+    vectorstores = get_vectorstores(base_dir_str, embeddings)
+
+    def search(k, exclude=()):
+        # Busca geral no modo configurado (vector, lexical ou hybrid)
+        hits = retrieval_search(
+            base_dir_str, question, embeddings, k + len(exclude), mode=retrieval_mode, vectorstores=vectorstores,
+            mmr=mmr, mmr_lambda=mmr_lambda
+        )
+        return [doc for doc, _ in hits if doc.id is None or doc.id not in exclude][:k]
+
     # Tenta obter as prioridades do .rag_priorities (se existir)
-    entries = _read_rag_priorities(base_dir_str)
+    entries = read_rag_priorities(base_dir_str)
 
     # Filtra entradas com priority == -1 (não usar no contexto)
-    if entries:
-        filtered_entries = [e for e in entries if e["priority"] != -1]
-    else:
-        filtered_entries = None
+    filtered_entries = context_entries(entries) or None
+    # entry de cada chunk gravada pelo index.py, se o .rag_priorities não mudou desde então
+    stored_entries = bool(filtered_entries) and stored_priorities_valid(base_dir_str, filtered_entries)
 
     if filtered_entries:
-        # busca ampla para depois filtrar/atribuir por entrada
-        try:
-            candidates = local_vectorstore.similarity_search(question, k=max(retriever_k * 5, 50))
-        except Exception:
-            candidates = local_retriever.invoke(question)
-
-        # agrupa candidates por entry (ou "others")
-        entry_docs = {i: [] for i in range(len(filtered_entries))}
-        others = []
-        for doc in candidates:
-            src = doc.metadata.get("source", "") or ""
-            try:
-                relsrc = os.path.relpath(src, base_dir_str)
-            except Exception:
-                relsrc = src
-            matched = False
-            # prefira o entry com path mais específico (maior comprimento)
-            best_idx = None
-            best_len = -1
-            for idx, e in enumerate(filtered_entries):
-                p = e["path"]
-                if relsrc.startswith(p):
-                    if len(p) > best_len:
-                        best_idx = idx
-                        best_len = len(p)
-                        matched = True
-            if matched and best_idx is not None:
-                entry_docs[best_idx].append(doc)
-            else:
-                others.append(doc)
+        # quantidade de chunks de cada entry no índice (calculada uma vez por versão do índice)
+        sizes = partition_sizes(vectorstores, base_dir_str, filtered_entries, stored=stored_entries)
 
         # considere apenas entradas que possuem docs (não dá pra incluir o que não existe)
-        available = [ (idx, filtered_entries[idx]) for idx, docs in entry_docs.items() if docs ]
+        available = [(idx, e) for idx, e in enumerate(filtered_entries) if sizes[idx]]
         if not available:
-            # fallback: nenhum documento na main/entries, usa retriever padrão
-            docs = local_retriever.invoke(question)
+            # fallback: nenhum documento na main/entries, usa busca padrão
+            docs = search(retriever_k)
         else:
             # calcula pesos
             sum_priorities = max(1, sum(e["priority"] for _, e in available))
@@ -452,23 +381,26 @@ def generate_prompt_markdown(question: str, base_dir: str = None, retriever_k: i
                             counts[idx] += 1
                             remaining -= 1
 
-            # coleta docs seguindo counts (mantendo ordem de similaridade)
+            # busca cada entry só nos seus chunks, já com a cota de cada uma,
+            # no mesmo modo da busca geral (o lexical não embeda a pergunta)
+            entry_hits = search_entries(
+                vectorstores, question, embeddings, base_dir_str, filtered_entries, counts,
+                mode=retrieval_mode, stored=stored_entries
+            )
             selected = []
             for idx in counts:
-                docs_for_entry = entry_docs[idx][:counts[idx]]
-                selected.extend(docs_for_entry)
+                selected.extend(doc for doc, _ in entry_hits[idx])
 
-            # se ainda faltarem docs, preenche com "others" e candidatos remanescentes
+            # se ainda faltarem docs (entries com menos chunks que a cota), completa com a busca geral
             if len(selected) < retriever_k:
                 needed = retriever_k - len(selected)
-                picked = set(id(d) for d in selected)
-                extras = [d for d in candidates if id(d) not in picked]
-                selected.extend(extras[:needed])
+                picked = {d.id for d in selected}
+                selected.extend(search(needed, exclude=picked))
 
             docs = selected[:retriever_k]
     else:
         # sem arquivo de prioridades ou todas priority=-1: comportamento padrão
-        docs = local_retriever.invoke(question)
+        docs = search(retriever_k)
 
     # Integrar histórico de chat se solicitado
     history_docs_final = []  # Documentos do histórico que serão incluídos
@@ -525,7 +457,10 @@ def generate_prompt_markdown(question: str, base_dir: str = None, retriever_k: i
 
     # agora gera o contexto/prompt/md usando os docs selecionados
     # se houver entries, separa os blocos por prioridade/alias
-    context = format_docs_by_priorities(context_docs, filtered_entries, base_dir) if filtered_entries else format_docs(context_docs, base_dir)
+    context = (
+        format_docs_by_priorities(context_docs, filtered_entries, base_dir_str, stored=stored_entries)
+        if filtered_entries else format_docs(context_docs, base_dir)
+    )
     
     # Formatar histórico de conversa se houver
     history_context = ""
@@ -639,9 +574,15 @@ if __name__ == "__main__":
         help="Copia o prompt gerado para o clipboard"
     )
 
+    parser.add_argument(
+        "--retrieval",
+        choices=["vector", "lexical", "hybrid"],
+        help="Modo de busca do contexto (padrão: RETRIEVAL_MODE ou vector)"
+    )
+
     args = parser.parse_args()
 
-    md = generate_prompt_markdown(args.question)
+    md = generate_prompt_markdown(args.question, retrieval_mode=args.retrieval)
 
     if args.output:
         with open(args.output, "w", encoding="utf-8") as f:
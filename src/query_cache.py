@@ -0,0 +1,117 @@
+"""
+Cache em memória dos embeddings de perguntas.
+
+Perguntas repetidas (de usuários diferentes ou novas tentativas) não voltam ao
+Ollama: o vetor fica num LRU com TTL opcional. Antes da consulta o texto é
+normalizado (Unicode NFKC e espaços colapsados), então variações apenas de
+espaçamento ou de forma Unicode compartilham a mesma entrada.
+
+Uma instância de CachedEmbeddings por modelo é compartilhada no processo, pelo
+motor RAG (chat.py e backend) e pelo prompt_preview.py.
+"""
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+
+load_dotenv()
+
+# QUERY_CACHE_SIZE=0 desativa o cache; QUERY_CACHE_TTL=0 mantém as entradas sem expirar
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+
+def normalize_query(text):
+    """Normaliza a pergunta para a chave do cache (NFKC + espaços colapsados)"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class QueryEmbeddingCache:
+    """LRU de vetores por texto normalizado, com TTL opcional"""
+
+    def __init__(self, max_entries=None, ttl=None):
+        self.max_entries = QUERY_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl = QUERY_CACHE_TTL if ttl is None else ttl
+        # texto -> (instante da gravação, vetor), do menos para o mais recente
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Retorna o vetor em cache, ou None se ausente ou expirado"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl > 0 and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, vector):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Resumo do estado do cache"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings com cache para embed_query; embed_documents passa direto"""
+
+    def __init__(self, embeddings, cache=None):
+        self.embeddings = embeddings
+        self.cache = cache if cache is not None else QueryEmbeddingCache()
+        self.model = getattr(embeddings, "model", None)
+
+    def embed_query(self, text):
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(key)
+            self.cache.put(key, vector)
+        return list(vector)
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+
+# modelo -> CachedEmbeddings do processo
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def get_cached_embeddings(model):
+    """Embeddings do Ollama para `model` com o cache de perguntas do processo"""
+    with _shared_lock:
+        embeddings = _shared.get(model)
+        if embeddings is None:
+            embeddings = CachedEmbeddings(OllamaEmbeddings(model=model))
+            _shared[model] = embeddings
+        return embeddings
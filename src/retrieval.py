@@ -0,0 +1,414 @@
+"""
+Busca sobre todos os índices de um BASE_DIR (raiz + shards).
+
+A pergunta é embedada uma única vez; o vetor é buscado em paralelo em cada
+índice (pool de threads do processo; o FAISS libera o GIL durante a busca) e
+os resultados são combinados pela distância L2, mantendo os k melhores.
+Com um único índice a busca roda direto na thread chamadora.
+
+RETRIEVAL_MODE escolhe a busca usada por chat.py/backend e prompt_preview.py:
+- `vector`: similaridade de embeddings (FAISS), padrão
+- `lexical`: BM25 sobre o índice FTS5 do chunks.sqlite; não embeda a pergunta
+- `hybrid`: as duas listas combinadas por reciprocal rank fusion (RRF)
+
+No modo `vector`, o MMR (ver mmr.py) pode reordenar os candidatos para
+evitar chunks quase iguais no contexto.
+
+Para o .rag_priorities, cada entrada é uma partição: as posições dos seus
+chunks em cada índice são calculadas uma vez por versão do índice (a partir
+do `priority_path` gravado pelo index.py, ou pelo source se as entradas
+mudaram desde a indexação), e a busca da entrada é restrita a elas, em vez
+de uma busca ampla filtrada depois. Partições pequenas são pontuadas
+exatamente a partir dos vetores do índice; as maiores usam o IDSelector do
+FAISS, visitando todas as listas em índices IVF (com o nprobe do índice, os
+chunks de uma entrada pequena podem estar só em listas não visitadas).
+"""
+import heapq
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+from chunk_store import SQLiteDocstore, ids_array
+from index_types import exact_search, search_parameters
+from mmr import MMR_ENABLED, MMR_FETCH_K, mmr_select
+from manifest import read_index_meta
+from priorities import PriorityMatcher, priorities_version
+from shards import index_dirs
+from vectorstore_cache import index_signature, shared_cache
+
+load_dotenv()
+
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", str(os.cpu_count() or 4)))
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+# Constante do RRF: score = soma de 1 / (RRF_K + posição)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Candidatos de cada lista na busca híbrida, em múltiplos de k
+_FUSION_FETCH_FACTOR = 4
+
+# Partições até este número de chunks são buscadas exatamente (exact_search)
+_EXACT_PARTITION_SIZE = 4096
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# vectorstore -> {caminhos das entradas: posições por entrada}; some junto com o vectorstore
+_partitions = weakref.WeakKeyDictionary()
+_partitions_lock = threading.Lock()
+
+
+def _get_executor():
+    """Pool compartilhado de buscas, criado no primeiro uso"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, RETRIEVAL_WORKERS),
+                thread_name_prefix="retrieval"
+            )
+        return _executor
+
+
+def get_vectorstores(base_dir, embeddings, cache=None):
+    """Vectorstores de base_dir já indexados (raiz e shards), pelo cache do processo"""
+    cache = cache or shared_cache
+    vectorstores = [
+        cache.get(index_dir, embeddings)
+        for index_dir in index_dirs(base_dir)
+        if index_signature(index_dir) is not None
+    ]
+    if not vectorstores:
+        raise FileNotFoundError(f"Índice FAISS não encontrado em {base_dir}. Execute a indexação primeiro.")
+    return vectorstores
+
+
+def search_by_vector(vectorstores, vector, k, **kwargs):
+    """
+    Busca `vector` em todos os vectorstores e retorna os k [(doc, distância)]
+    mais próximos. kwargs vão para similarity_search_with_score_by_vector.
+    """
+    def search(vectorstore):
+        return vectorstore.similarity_search_with_score_by_vector(vector, k=k, **kwargs)
+
+    if len(vectorstores) == 1:
+        return search(vectorstores[0])
+    results = _get_executor().map(search, vectorstores)
+    return heapq.nsmallest(k, (hit for hits in results for hit in hits), key=lambda hit: hit[1])
+
+
+def _doc_at(vectorstore, position):
+    """Documento na posição do índice, ou None se não estiver no docstore"""
+    doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+    return None if isinstance(doc, str) else doc
+
+
+def search_with_vectors(vectorstores, vector, k):
+    """
+    Como search_by_vector, mas retorna [(doc, distância, vetor)]: os vetores
+    dos resultados vêm do próprio índice (search_and_reconstruct)
+    """
+    query = np.asarray([vector], dtype=np.float32)
+
+    def search(vectorstore):
+        distances, labels, vectors = vectorstore.index.search_and_reconstruct(query, k)
+        hits = []
+        for position, distance, doc_vector in zip(labels[0], distances[0], vectors[0]):
+            doc = _doc_at(vectorstore, position) if position != -1 else None
+            if doc is not None:
+                hits.append((doc, float(distance), doc_vector))
+        return hits
+
+    if len(vectorstores) == 1:
+        return search(vectorstores[0])
+    results = _get_executor().map(search, vectorstores)
+    return heapq.nsmallest(k, (hit for hits in results for hit in hits), key=lambda hit: hit[1])
+
+
+def mmr_search(vectorstores, vector, k, fetch_k=None, lambda_mult=None):
+    """Busca fetch_k candidatos (padrão: MMR_FETCH_K) e escolhe k por MMR: [(doc, distância)]"""
+    candidates = search_with_vectors(vectorstores, vector, max(k, fetch_k or MMR_FETCH_K))
+    if not candidates:
+        return []
+    chosen = mmr_select(vector, np.stack([hit[2] for hit in candidates]), k, lambda_mult)
+    return [candidates[i][:2] for i in chosen]
+
+
+def stored_priorities_valid(base_dir, entries):
+    """True se o `priority_path` gravado em todos os índices de base_dir corresponde às entradas atuais"""
+    version = priorities_version(entries)
+    return all(
+        read_index_meta(index_dir).get("priorities_version") == version
+        for index_dir in index_dirs(base_dir)
+        if index_signature(index_dir) is not None
+    )
+
+
+def lexical_search(vectorstores, question, k):
+    """
+    Busca BM25 da pergunta nos chunks de todos os vectorstores, sem embeddings.
+    Retorna os k [(doc, bm25)] melhores (menor é melhor).
+    """
+    stores = [
+        vectorstore.docstore.store
+        for vectorstore in vectorstores
+        if isinstance(vectorstore.docstore, SQLiteDocstore)
+    ]
+    if len(stores) <= 1:
+        return stores[0].search_lexical(question, k) if stores else []
+    results = _get_executor().map(lambda store: store.search_lexical(question, k), stores)
+    return heapq.nsmallest(k, (hit for hits in results for hit in hits), key=lambda hit: hit[1])
+
+
+def _doc_key(doc):
+    """Identidade de um chunk entre listas de resultados diferentes"""
+    return doc.id or (doc.metadata.get("source"), doc.page_content)
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=None):
+    """
+    Combina listas [(doc, score)] (cada uma já ordenada da melhor para a pior)
+    pela posição de cada documento. Retorna os k [(doc, score RRF)], maior é melhor.
+    Um documento repetido numa mesma lista conta uma vez, pela melhor posição;
+    empates mantêm a ordem em que os documentos apareceram.
+    """
+    rrf_k = RRF_K if rrf_k is None else rrf_k
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        seen = set()
+        for rank, (doc, _) in enumerate(ranking):
+            key = _doc_key(doc)
+            if key in seen:
+                continue
+            seen.add(key)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+    return [(docs[key], score) for key, score in best]
+
+
+def search(base_dir, question, embeddings, k, mode=None, cache=None, vectorstores=None, vector=None,
+           mmr=None, mmr_lambda=None):
+    """
+    Busca pela pergunta em todos os índices de base_dir no modo indicado
+    (padrão: RETRIEVAL_MODE).
+
+    Args:
+        vectorstores: Vectorstores já obtidos (padrão: get_vectorstores)
+        vector: Embedding da pergunta, se já calculado
+        mmr: Reordena por MMR no modo vector (padrão: MMR_ENABLED)
+        mmr_lambda: λ do MMR, entre 0 (diversidade) e 1 (relevância) (padrão: MMR_LAMBDA)
+
+    Returns:
+        [(doc, score)]: distância L2 (vector), BM25 (lexical; menor é melhor)
+        ou score RRF (hybrid; maior é melhor)
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Modo de busca desconhecido: {mode} (use {', '.join(RETRIEVAL_MODES)})")
+    vectorstores = vectorstores or get_vectorstores(base_dir, embeddings, cache=cache)
+
+    if mode == "lexical":
+        hits = lexical_search(vectorstores, question, k)
+        if hits:
+            return hits
+        # Nenhum termo encontrado: cai para a busca vetorial
+        mode = "vector"
+
+    if mode == "vector":
+        if vector is None:
+            vector = embeddings.embed_query(question)
+        if MMR_ENABLED if mmr is None else mmr:
+            return mmr_search(vectorstores, vector, k, lambda_mult=mmr_lambda)
+        return search_by_vector(vectorstores, vector, k)
+
+    # Híbrida: a busca lexical roda enquanto a pergunta é embedada
+    fetch_k = k * _FUSION_FETCH_FACTOR
+    lexical = _get_executor().submit(lexical_search, vectorstores, question, fetch_k)
+    if vector is None:
+        vector = embeddings.embed_query(question)
+    vector_hits = search_by_vector(vectorstores, vector, fetch_k)
+    return reciprocal_rank_fusion([vector_hits, lexical.result()], k)
+
+
+def _chunk_sources(vectorstore):
+    """(id, source) de todos os chunks do vectorstore"""
+    if isinstance(vectorstore.docstore, SQLiteDocstore):
+        return vectorstore.docstore.store.metadata_values("source")
+    # Índice antigo (index.pkl), docstore em memória
+    sources = []
+    for doc_id in vectorstore.index_to_docstore_id.values():
+        doc = vectorstore.docstore.search(doc_id)
+        if not isinstance(doc, str):
+            sources.append((doc_id, doc.metadata.get("source", "")))
+    return sources
+
+
+def _compute_partitions(vectorstore, base_dir, entries, stored):
+    """Posições (int64) dos chunks de cada entrada no índice do vectorstore"""
+    matcher = PriorityMatcher(entries, base_dir)
+    if stored and isinstance(vectorstore.docstore, SQLiteDocstore):
+        assignments = (
+            (doc_id, matcher.index_of_path(path))
+            for doc_id, path in vectorstore.docstore.store.metadata_values("priority_path")
+        )
+    else:
+        assignments = ((doc_id, matcher.match(source)) for doc_id, source in _chunk_sources(vectorstore))
+
+    ids_by_entry = {idx: [] for idx in range(len(entries))}
+    for doc_id, idx in assignments:
+        if idx is not None:
+            ids_by_entry[idx].append(doc_id.encode("utf-8"))
+
+    ids = ids_array(vectorstore.index_to_docstore_id)
+    return {
+        idx: np.flatnonzero(np.isin(ids, np.array(entry_ids))).astype(np.int64) if entry_ids else np.empty(0, dtype=np.int64)
+        for idx, entry_ids in ids_by_entry.items()
+    }
+
+
+def get_partitions(vectorstore, base_dir, entries, stored=False):
+    """
+    Posições de cada entrada do .rag_priorities (priority != -1) no vectorstore,
+    em cache por versão do índice. stored: usa o `priority_path` gravado nos chunks
+    (ver stored_priorities_valid)
+    """
+    key = (str(base_dir), tuple(entry["path"] for entry in entries), stored)
+    with _partitions_lock:
+        cached = _partitions.get(vectorstore, {}).get(key)
+    if cached is not None:
+        return cached
+    partitions = _compute_partitions(vectorstore, base_dir, entries, stored)
+    with _partitions_lock:
+        _partitions.setdefault(vectorstore, {})[key] = partitions
+    return partitions
+
+
+def _search_positions(vectorstore, vector, k, positions):
+    """Busca restrita às posições indicadas; retorna [(doc, distância)]"""
+    index = vectorstore.index
+    k = min(k, len(positions))
+    if k <= 0:
+        return []
+    query = np.asarray([vector], dtype=np.float32)
+    if len(positions) == index.ntotal:
+        distances, labels = (row[0] for row in index.search(query, k))
+    elif len(positions) <= _EXACT_PARTITION_SIZE:
+        distances, labels = exact_search(index, query[0], k, positions)
+    else:
+        selector = faiss.IDSelectorBatch(positions)
+        params = search_parameters(index, selector, exhaustive=True)
+        distances, labels = (row[0] for row in index.search(query, k, params=params))
+    hits = []
+    for position, distance in zip(labels, distances):
+        doc = _doc_at(vectorstore, position) if position != -1 else None
+        if doc is not None:
+            hits.append((doc, float(distance)))
+    return hits
+
+
+def partition_sizes(vectorstores, base_dir, entries, stored=False):
+    """Número de chunks de cada entrada, somando todos os índices"""
+    sizes = {idx: 0 for idx in range(len(entries))}
+    for vectorstore in vectorstores:
+        for idx, positions in get_partitions(vectorstore, base_dir, entries, stored).items():
+            sizes[idx] += len(positions)
+    return sizes
+
+
+def search_partitions(vectorstores, vector, base_dir, entries, quotas, stored=False):
+    """
+    Busca cada entrada apenas nos seus chunks, em paralelo.
+
+    Args:
+        quotas: dict índice da entrada -> quantidade de documentos
+
+    Returns:
+        dict índice da entrada -> [(doc, distância)], do mais próximo ao mais distante
+    """
+    tasks = []
+    for vectorstore in vectorstores:
+        partitions = get_partitions(vectorstore, base_dir, entries, stored)
+        for idx, k in quotas.items():
+            if k > 0 and len(partitions[idx]):
+                tasks.append((idx, k, vectorstore, partitions[idx]))
+
+    results = _get_executor().map(lambda task: _search_positions(task[2], vector, task[1], task[3]), tasks)
+    hits = {idx: [] for idx in quotas}
+    for (idx, _, _, _), task_hits in zip(tasks, results):
+        hits[idx].extend(task_hits)
+    return {
+        idx: heapq.nsmallest(quotas[idx], entry_hits, key=lambda hit: hit[1])
+        for idx, entry_hits in hits.items()
+    }
+
+
+def _lexical_positions(vectorstore, question, k, positions):
+    """Busca BM25 restrita aos chunks das posições indicadas; retorna [(doc, bm25)]"""
+    if not isinstance(vectorstore.docstore, SQLiteDocstore):
+        return []
+    doc_ids = [vectorstore.index_to_docstore_id[position] for position in positions]
+    return vectorstore.docstore.store.search_lexical(question, k, doc_ids=doc_ids)
+
+
+def search_partitions_lexical(vectorstores, question, base_dir, entries, quotas, stored=False):
+    """
+    Como search_partitions, mas por BM25 (sem embeddings): cada entrada é
+    buscada apenas entre os seus chunks no índice lexical.
+
+    Returns:
+        dict índice da entrada -> [(doc, bm25)], menor é melhor
+    """
+    tasks = []
+    for vectorstore in vectorstores:
+        partitions = get_partitions(vectorstore, base_dir, entries, stored)
+        for idx, k in quotas.items():
+            if k > 0 and len(partitions[idx]):
+                tasks.append((idx, k, vectorstore, partitions[idx]))
+
+    results = _get_executor().map(lambda task: _lexical_positions(task[2], question, task[1], task[3]), tasks)
+    hits = {idx: [] for idx in quotas}
+    for (idx, _, _, _), task_hits in zip(tasks, results):
+        hits[idx].extend(task_hits)
+    return {
+        idx: heapq.nsmallest(quotas[idx], entry_hits, key=lambda hit: hit[1])
+        for idx, entry_hits in hits.items()
+    }
+
+
+def search_entries(vectorstores, question, embeddings, base_dir, entries, quotas, mode=None, stored=False):
+    """
+    Busca de cada entrada do .rag_priorities no modo indicado (padrão:
+    RETRIEVAL_MODE), restrita aos chunks da entrada. No modo lexical a
+    pergunta não é embedada; no híbrido, as duas listas de cada entrada são
+    combinadas por RRF.
+
+    Returns:
+        dict índice da entrada -> [(doc, score)], do melhor ao pior
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Modo de busca desconhecido: {mode} (use {', '.join(RETRIEVAL_MODES)})")
+    if mode == "lexical":
+        return search_partitions_lexical(vectorstores, question, base_dir, entries, quotas, stored=stored)
+
+    if mode == "vector":
+        return search_partitions(vectorstores, embeddings.embed_query(question), base_dir, entries, quotas, stored=stored)
+
+    # Híbrida: a busca lexical roda enquanto a pergunta é embedada
+    fetch = {idx: k * _FUSION_FETCH_FACTOR for idx, k in quotas.items()}
+    lexical = _get_executor().submit(
+        search_partitions_lexical, vectorstores, question, base_dir, entries, fetch, stored=stored
+    )
+    vector_hits = search_partitions(vectorstores, embeddings.embed_query(question), base_dir, entries, fetch, stored=stored)
+    lexical_hits = lexical.result()
+    return {
+        idx: reciprocal_rank_fusion([vector_hits[idx], lexical_hits[idx]], k)
+        for idx, k in quotas.items()
+    }
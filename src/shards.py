@@ -0,0 +1,122 @@
+"""
+Shards do índice: subárvores do BASE_DIR indexadas separadamente.
+
+Cada shard tem o próprio índice FAISS (index.faiss, index_ids.npy,
+chunks.sqlite, manifesto e .rag_index_meta.json) em
+BASE_DIR/.rag_shard_stores/<nome>/ e pode ser recriado sem tocar nos demais.
+O índice da raiz do BASE_DIR continua existindo e fica com tudo o que não
+pertence a nenhum shard. Índices de shards que saíram da configuração são
+apagados ao fim de index.run_index_all (ver remove_stale_stores). Na consulta, todos os índices são buscados em
+paralelo e os resultados combinados pela distância (ver retrieval.py).
+
+Formato de BASE_DIR/.rag_shards (uma entrada por linha):
+
+    # comentário
+    nome, caminho/relativo
+    @priorities
+
+`@priorities` cria um shard para cada entrada do .rag_priorities (exceto
+priority -1) cujo caminho seja um diretório. Se um arquivo estiver em mais de
+um shard, vale o de caminho mais longo.
+"""
+import os
+import re
+import shutil
+from pathlib import Path
+
+from priorities import read_rag_priorities
+
+SHARDS_FILE = ".rag_shards"
+SHARDS_DIR = ".rag_shard_stores"
+
+
+def _shard_name(text):
+    """Nome seguro para diretório (letras, números, ponto, hífen e sublinhado)"""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", text).strip("._") or "shard"
+
+
+class Shard:
+    """Subárvore `path` (relativa ao BASE_DIR) com índice próprio em index_dir"""
+
+    def __init__(self, base_dir, name, path):
+        base_dir = Path(base_dir).resolve()
+        self.name = _shard_name(name)
+        self.root = (base_dir / path).resolve()
+        self.path = self.root.relative_to(base_dir).as_posix()
+        self.index_dir = base_dir / SHARDS_DIR / self.name
+
+    def contains(self, path):
+        """True se path (absoluto) estiver dentro da subárvore do shard"""
+        path = str(Path(path).resolve())
+        root = str(self.root)
+        return path == root or path.startswith(root + os.sep)
+
+    def __repr__(self):
+        return f"Shard({self.name!r}, {self.path!r})"
+
+
+def read_shards(base_dir):
+    """Lê BASE_DIR/.rag_shards e retorna a lista de Shard ([] se não existir)"""
+    base_dir = Path(base_dir).resolve()
+    shards_file = base_dir / SHARDS_FILE
+    if not shards_file.exists():
+        return []
+
+    shards = {}
+    for line in shards_file.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line == "@priorities":
+            for entry in read_rag_priorities(str(base_dir)) or []:
+                path = entry["path"]
+                if entry["priority"] == -1 or not (base_dir / path).is_dir():
+                    continue
+                shard = Shard(base_dir, entry.get("alias") or path, path)
+                shards.setdefault(shard.name, shard)
+            continue
+        parts = [p.strip() for p in line.split(",")]
+        if len(parts) < 2 or not parts[1]:
+            continue
+        try:
+            shard = Shard(base_dir, parts[0], parts[1])
+        except ValueError:
+            # Caminho fora do BASE_DIR
+            continue
+        if shard.path == ".":
+            continue
+        shards[shard.name] = shard
+    return list(shards.values())
+
+
+def owner_shard(shards, path):
+    """Shard responsável por path (o de caminho mais longo), ou None para a raiz"""
+    owners = [shard for shard in shards if shard.contains(path)]
+    return max(owners, key=lambda shard: len(shard.path), default=None)
+
+
+def index_dirs(base_dir):
+    """Diretórios de índice a consultar: a raiz do BASE_DIR e os shards"""
+    base_dir = Path(base_dir).resolve()
+    return [base_dir] + [shard.index_dir for shard in read_shards(base_dir)]
+
+
+def remove_stale_stores(base_dir, shards=None):
+    """
+    Apaga de BASE_DIR/.rag_shard_stores os índices de shards que não estão
+    mais configurados (ex.: entrada removida do .rag_priorities).
+
+    Returns:
+        Nomes dos índices apagados
+    """
+    base_dir = Path(base_dir).resolve()
+    stores_dir = base_dir / SHARDS_DIR
+    if not stores_dir.is_dir():
+        return []
+    names = {shard.name for shard in (read_shards(base_dir) if shards is None else shards)}
+    removed = []
+    for store in sorted(stores_dir.iterdir()):
+        if store.is_dir() and store.name not in names:
+            shutil.rmtree(store, ignore_errors=True)
+            removed.append(store.name)
+    return removed
@@ -0,0 +1,131 @@
+"""
+Cache compartilhado de vectorstores FAISS carregados, por BASE_DIR.
+
+Cada entrada guarda a assinatura (mtime + tamanho) dos arquivos do índice no
+momento da carga; o vectorstore só é desserializado de novo quando
+index.faiss/index_ids.npy mudam no disco. Quando a soma dos tamanhos
+ultrapassa o orçamento em bytes, as entradas usadas há mais tempo são
+descartadas (LRU). Os vetores são mapeados em memória (somente leitura, ver
+index_io), então nada no cache deve alterar o índice.
+"""
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from chunk_store import SQLiteDocstore
+from index_io import index_files, read_vectorstore
+from index_types import IndexSpec, apply_search_params
+from manifest import read_index_meta
+
+load_dotenv()
+
+# Orçamento de memória do cache (aproximado pelo tamanho dos arquivos do índice)
+VECTORSTORE_CACHE_MB = int(os.getenv("VECTORSTORE_CACHE_MB", "2048"))
+
+def index_signature(base_dir):
+    """
+    Retorna a assinatura dos arquivos do índice em base_dir: uma tupla de
+    (mtime_ns, tamanho) por arquivo, ou None se algum deles não existir.
+    """
+    signature = []
+    for name in index_files(base_dir):
+        try:
+            stat = os.stat(os.path.join(base_dir, name))
+        except FileNotFoundError:
+            return None
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class VectorStoreCache:
+    """Cache LRU de vectorstores com invalidação por mtime e orçamento em bytes"""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes if max_bytes is not None else VECTORSTORE_CACHE_MB * 1024 * 1024
+        # base_dir -> (assinatura, bytes, vectorstore), do menos para o mais recente
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        # Um lock por base_dir evita carregar o mesmo índice em paralelo
+        self._load_locks = {}
+
+    def _lookup(self, key, signature):
+        """Retorna o vectorstore em cache se a assinatura ainda for válida (exige self._lock)"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            self._entries.move_to_end(key)
+            return entry[2]
+        return None
+
+    def get(self, base_dir, embeddings):
+        """Retorna o vectorstore de base_dir, carregando do disco apenas se necessário"""
+        key = str(Path(base_dir).resolve())
+        signature = index_signature(key)
+        if signature is None:
+            raise FileNotFoundError(f"Índice FAISS não encontrado em {key}. Execute a indexação primeiro.")
+
+        with self._lock:
+            vectorstore = self._lookup(key, signature)
+            if vectorstore is not None:
+                return vectorstore
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Outra thread pode ter carregado o índice enquanto esperávamos
+            with self._lock:
+                vectorstore = self._lookup(key, signature)
+                if vectorstore is not None:
+                    return vectorstore
+
+            # Vetores mapeados em memória: compartilhados entre processos via page cache
+            spec = IndexSpec.from_meta(read_index_meta(key).get("index_spec"))
+            vectorstore = read_vectorstore(key, embeddings, kind=spec.kind)
+            # nprobe/efSearch gravados junto com o índice
+            apply_search_params(vectorstore.index, spec)
+            size = sum(file_size for _, file_size in signature)
+
+            with self._lock:
+                self._discard(key)
+                self._entries[key] = (signature, size, vectorstore)
+                self._total_bytes += size
+                self._evict()
+        return vectorstore
+
+    def _discard(self, key):
+        """Remove a entrada de key e fecha a conexão SQLite dos seus chunks (exige self._lock)"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._total_bytes -= entry[1]
+        docstore = entry[2].docstore
+        if isinstance(docstore, SQLiteDocstore):
+            docstore.store.close()
+
+    def _evict(self):
+        """Remove entradas LRU até caber no orçamento (mantém ao menos a mais recente)"""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._discard(next(iter(self._entries)))
+
+    def invalidate(self, base_dir=None):
+        """Descarta o vectorstore de base_dir (ou todos) do cache"""
+        with self._lock:
+            keys = list(self._entries) if base_dir is None else [str(Path(base_dir).resolve())]
+            for key in keys:
+                self._discard(key)
+
+    def stats(self):
+        """Resumo do estado do cache"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+# Cache do processo, compartilhado entre chat.py, prompt_preview.py e o backend
+shared_cache = VectorStoreCache()
+
@@ -0,0 +1,147 @@
+"""
+Configuração comum dos testes: os módulos de src/ e backend/ são importados
+diretamente, como fazem o chat.py e o backend (sys.path).
+"""
+import hashlib
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+ROOT = Path(__file__).resolve().parent.parent
+for folder in ("src", "backend"):
+    sys.path.insert(0, str(ROOT / folder))
+
+import embedding_cache
+import index
+from job_queue import JobQueue
+from job_store import JobStore
+from scheduler import JobScheduler
+
+
+@pytest.fixture
+def wait_until():
+    """wait_until(condition): espera condition() ser verdadeira (falha o teste após timeout segundos)"""
+    def wait(condition, timeout=5.0):
+        deadline = time.time() + timeout
+        while not condition():
+            if time.time() > deadline:
+                pytest.fail("condição não satisfeita a tempo")
+            time.sleep(0.01)
+    return wait
+
+
+class Runner:
+    """run_job de teste: registra a ordem de início e segura cada job até release()"""
+
+    def __init__(self):
+        self.started = []
+        self._gates = {}
+        self._lock = threading.Lock()
+        self.stop_all = threading.Event()
+
+    def _gate(self, question):
+        with self._lock:
+            return self._gates.setdefault(question, threading.Event())
+
+    def __call__(self, job):
+        with self._lock:
+            self.started.append(job.question)
+        gate = self._gate(job.question)
+        # Como o chat, para ao ver Job.done (cancelamento ou prazo)
+        while not (gate.is_set() or job.done.is_set() or self.stop_all.is_set()):
+            gate.wait(0.01)
+        return {"message": job.question}
+
+    def release(self, question):
+        self._gate(question).set()
+
+
+@pytest.fixture
+def runner():
+    runner = Runner()
+    yield runner
+    runner.stop_all.set()
+
+
+@pytest.fixture
+def make_scheduler(tmp_path, runner):
+    """make_scheduler(**kwargs): JobScheduler com o runner de teste, sem vagas reservadas nem pesos"""
+    schedulers = []
+
+    def make(**kwargs):
+        queue = JobQueue(JobStore(tmp_path / f"jobs{len(schedulers)}.sqlite"))
+        kwargs.setdefault("reserved_interactive", 0)
+        kwargs.setdefault("weights", {})
+        scheduler = JobScheduler(queue, runner, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    runner.stop_all.set()
+    for scheduler in schedulers:
+        scheduler.shutdown(wait=True)
+
+
+@pytest.fixture
+def base_dirs(tmp_path):
+    """base_dirs(*nomes): cria os diretórios em tmp_path e retorna seus caminhos"""
+    def make(*names):
+        paths = []
+        for name in names:
+            path = tmp_path / name
+            path.mkdir()
+            paths.append(str(path))
+        return paths
+    return make
+
+
+@pytest.fixture
+def job_status():
+    """job_status(scheduler, job_id): status atual do job"""
+    return lambda scheduler, job_id: scheduler.job_queue.get_job(job_id).status
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings determinísticos (pelo hash do texto) que registram os textos embedados"""
+
+    embedded = []
+
+    def __init__(self, model=None, **kwargs):
+        pass
+
+    @staticmethod
+    def _vector(text):
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:4], "big")
+        return np.random.default_rng(seed).normal(size=8).tolist()
+
+    def embed_documents(self, texts):
+        FakeEmbeddings.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """Textos enviados ao modelo de embeddings (sem o cache em disco)"""
+    FakeEmbeddings.embedded = []
+    monkeypatch.setattr(index, "OllamaEmbeddings", FakeEmbeddings)
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_ENABLED", False)
+    return FakeEmbeddings.embedded
+
+
+@pytest.fixture
+def write_file():
+    """write_file(base_dir, name, text): grava o arquivo (criando os diretórios) e retorna o caminho"""
+    def write(base_dir, name, text):
+        path = base_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+        return path
+    return write
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+import engine
+from answer_cache import AnswerCache
+from engine import RagEngine
+
+ANSWER = {"message": "resposta", "sources": ["a.md"]}
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_similar_question_hits_and_distant_one_misses():
+    cache = AnswerCache(threshold=0.95, max_entries=10)
+    cache.store("/kb", "v1", vector(1, 0, 0), ANSWER)
+
+    hit = cache.lookup("/kb", "v1", vector(1, 0.1, 0))
+    assert hit["message"] == "resposta" and hit["similarity"] > 0.95
+    assert cache.lookup("/kb", "v1", vector(0, 1, 0)) is None
+    assert cache.lookup("/outro", "v1", vector(1, 0, 0)) is None
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 2)
+
+
+def test_new_index_version_drops_the_answers():
+    cache = AnswerCache(threshold=0.9, max_entries=10)
+    cache.store("/kb", "v1", vector(1, 0), ANSWER)
+    assert cache.lookup("/kb", "v2", vector(1, 0)) is None
+    # As respostas da versão anterior foram descartadas, não só escondidas
+    assert cache.lookup("/kb", "v1", vector(1, 0)) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_answers_are_separated_by_retrieval_options():
+    cache = AnswerCache(threshold=0.9, max_entries=10)
+    cache.store("/kb", "v1", vector(1, 0), ANSWER, options=("vector", "mmr", 0.5))
+    assert cache.lookup("/kb", "v1", vector(1, 0), options=("vector",)) is None
+    assert cache.lookup("/kb", "v1", vector(1, 0), options=("vector", "mmr", 0.7)) is None
+    assert cache.lookup("/kb", "v1", vector(1, 0), options=("vector", "mmr", 0.5)) is not None
+
+    cache.invalidate("/kb")
+    assert cache.stats()["entries"] == 0
+
+
+def test_size_limit_evicts_oldest_answers():
+    cache = AnswerCache(threshold=0.99, max_entries=2)
+    for i, v in enumerate([vector(1, 0, 0), vector(0, 1, 0), vector(0, 0, 1)]):
+        cache.store("/kb", "v1", v, {"message": str(i), "sources": []})
+    assert cache.lookup("/kb", "v1", vector(1, 0, 0)) is None
+    assert cache.lookup("/kb", "v1", vector(0, 0, 1))["message"] == "2"
+    assert cache.stats()["entries"] == 2
+
+    disabled = AnswerCache(max_entries=0)
+    disabled.store("/kb", "v1", vector(1, 0), ANSWER)
+    assert disabled.stats()["entries"] == 0
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.questions = []
+
+    def embed_query(self, text):
+        self.questions.append(text)
+        return [1.0, 0.0]
+
+
+@pytest.fixture
+def rag_engine(monkeypatch):
+    rag_engine = RagEngine()
+    rag_engine.embeddings = CountingEmbeddings()
+    rag_engine.answer_cache = AnswerCache(threshold=0.9, max_entries=10)
+    monkeypatch.setattr(engine, "MMR_ENABLED", False)
+    return rag_engine
+
+
+def test_engine_keys_answers_by_mode_and_mmr(rag_engine, tmp_path):
+    cached, key = rag_engine._lookup_answer(tmp_path, "pergunta", mode="vector", mmr=True, mmr_lambda=0.3)
+    assert cached is None
+    assert key[3] == ("vector", "mmr", 0.3)
+    rag_engine._store_answer(key, "resposta", ["a.md"])
+
+    assert rag_engine._lookup_answer(tmp_path, "pergunta", mode="vector", mmr=True, mmr_lambda=0.3)[0]["message"] == "resposta"
+    assert rag_engine._lookup_answer(tmp_path, "pergunta", mode="vector", mmr=True, mmr_lambda=0.8)[0] is None
+    assert rag_engine._lookup_answer(tmp_path, "pergunta", mode="vector")[0] is None
+    assert rag_engine._lookup_answer(tmp_path, "pergunta", mode="hybrid", mmr=True)[1][3] == ("hybrid",)
+
+
+def test_engine_skips_the_cache_in_lexical_mode(rag_engine, tmp_path):
+    assert rag_engine._lookup_answer(tmp_path, "ERR_42", mode="lexical") == (None, None)
+    # Sem embedding da pergunta
+    assert rag_engine.embeddings.questions == []
@@ -0,0 +1,84 @@
+import threading
+
+from job_queue import JobQueue, JobStatus
+from job_store import JobStore
+
+
+def test_deadline_starts_when_the_job_starts(tmp_path):
+    queue = JobQueue(JobStore(tmp_path / "jobs.sqlite"))
+    job_id = queue.add_job("chat", "/kb", "pergunta", timeout=30)
+    job = queue.get_job(job_id)
+    assert job.deadline is None
+
+    queue.update_job_status(job_id, JobStatus.PROCESSING)
+    assert job.deadline == job.started_at + 30
+    assert queue.store.get(job_id)["deadline"] == job.deadline
+
+
+def test_timeout_stops_running_job_and_notifies(base_dirs, runner, make_scheduler, job_status, wait_until):
+    a, b = base_dirs("a", "b")
+    finished = []
+    scheduler = make_scheduler(max_workers=1, on_finish=finished.append)
+    lento = scheduler.submit("chat", a, "lento", webhook_url="http://cliente/webhook", timeout=0.2)
+    seguinte = scheduler.submit("chat", b, "seguinte")
+
+    wait_until(lambda: job_status(scheduler, lento) == JobStatus.FAILED)
+    job = scheduler.job_queue.get_job(lento)
+    assert job.error.startswith("Timeout")
+    # O término por prazo é notificado (webhook), uma única vez
+    wait_until(lambda: [j.job_id for j in finished] == [lento])
+    assert finished[0].status == JobStatus.FAILED
+
+    # A vaga é liberada quando a execução para
+    wait_until(lambda: "seguinte" in runner.started)
+    runner.release("seguinte")
+    wait_until(lambda: job_status(scheduler, seguinte) == JobStatus.COMPLETED)
+    assert [j.job_id for j in finished] == [lento, seguinte]
+
+
+def test_queue_wait_does_not_consume_the_timeout(base_dirs, runner, make_scheduler, job_status, wait_until):
+    (a,) = base_dirs("a")
+    scheduler = make_scheduler(max_workers=1)
+    scheduler.submit("chat", a, "bloqueio", timeout=0)
+    esperando = scheduler.submit("chat", a, "esperando", timeout=0.2)
+    wait_until(lambda: runner.started == ["bloqueio"])
+    threading.Event().wait(0.4)
+    assert job_status(scheduler, esperando) == JobStatus.PENDING
+
+    runner.release("bloqueio")
+    runner.release("esperando")
+    wait_until(lambda: job_status(scheduler, esperando) == JobStatus.COMPLETED)
+    assert scheduler.job_queue.get_job(esperando).queue_wait >= 0.4
+
+
+def test_cancel_running_job_frees_slot_without_notifying(base_dirs, runner, make_scheduler, job_status, wait_until):
+    (a,) = base_dirs("a")
+    finished = []
+    scheduler = make_scheduler(max_workers=1, on_finish=finished.append)
+    cancelado = scheduler.submit("chat", a, "cancelado", webhook_url="http://cliente/webhook")
+    seguinte = scheduler.submit("chat", a, "seguinte")
+    wait_until(lambda: runner.started == ["cancelado"])
+
+    assert scheduler.job_queue.update_job_status(cancelado, JobStatus.CANCELLED)
+    wait_until(lambda: "seguinte" in runner.started)
+    runner.release("seguinte")
+    wait_until(lambda: job_status(scheduler, seguinte) == JobStatus.COMPLETED)
+
+    # O resultado que o job cancelado ainda devolveu é descartado
+    assert job_status(scheduler, cancelado) == JobStatus.CANCELLED
+    assert [j.job_id for j in finished] == [seguinte]
+
+
+def test_cancelled_pending_job_never_runs(base_dirs, runner, make_scheduler, job_status, wait_until):
+    (a,) = base_dirs("a")
+    scheduler = make_scheduler(max_workers=1)
+    scheduler.submit("chat", a, "bloqueio")
+    cancelado = scheduler.submit("chat", a, "cancelado")
+    seguinte = scheduler.submit("chat", a, "seguinte")
+    wait_until(lambda: runner.started == ["bloqueio"])
+
+    scheduler.job_queue.update_job_status(cancelado, JobStatus.CANCELLED)
+    runner.release("bloqueio")
+    runner.release("seguinte")
+    wait_until(lambda: job_status(scheduler, seguinte) == JobStatus.COMPLETED)
+    assert runner.started == ["bloqueio", "seguinte"]
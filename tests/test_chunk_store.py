@@ -0,0 +1,84 @@
+from langchain_core.documents import Document
+
+from chunk_store import CHUNK_STORE_FILE, ChunkStore, SQLiteDocstore, lexical_query
+from index import run_index
+
+
+def chunk(doc_id, text, source="/kb/a.md"):
+    return doc_id, Document(id=doc_id, page_content=text, metadata={"source": source})
+
+
+def ids(hits):
+    return sorted(doc.id for doc, _ in hits)
+
+
+def test_put_get_and_retain(tmp_path):
+    store = ChunkStore(tmp_path / CHUNK_STORE_FILE)
+    store.put_many([chunk("a", "texto a"), chunk("b", "texto b"), chunk("c", "texto c")])
+    assert store.get("a").page_content == "texto a"
+    assert store.get("a").metadata == {"source": "/kb/a.md"}
+
+    assert store.retain(["a", "c", "inexistente"]) == 1
+    assert store.get("b") is None
+    assert store.count() == 2
+
+
+def test_lexical_index_follows_sync_not_put(tmp_path):
+    store = ChunkStore(tmp_path / CHUNK_STORE_FILE)
+    store.put_many([chunk("a", "erro ERR_42 no servidor"), chunk("b", "backup noturno")])
+    # Gravados, mas ainda fora do índice vetorial em uso
+    assert store.search_lexical("ERR_42", 5) == []
+
+    assert store.sync_lexical(["a", "b"]) == (2, 0)
+    assert ids(store.search_lexical("ERR_42 backup", 5)) == ["a", "b"]
+
+    # Nova versão do índice: b saiu, c entrou; a não é reinserido
+    store.put_many([chunk("c", "backup semanal")])
+    assert store.sync_lexical(["a", "c"]) == (1, 1)
+    assert ids(store.search_lexical("backup", 5)) == ["c"]
+    assert store.sync_lexical(["a", "c"]) == (0, 0)
+
+
+def test_lexical_search_matches_source_path(tmp_path):
+    store = ChunkStore(tmp_path / CHUNK_STORE_FILE)
+    store.put_many([chunk("a", "texto", source="/kb/guia_instalacao.md"), chunk("b", "texto", source="/kb/outro.md")])
+    store.sync_lexical(["a", "b"])
+    assert ids(store.search_lexical("guia_instalacao", 5)) == ["a"]
+
+
+def test_queries_without_usable_terms(tmp_path):
+    store = ChunkStore(tmp_path / CHUNK_STORE_FILE)
+    store.put_many([chunk("a", "a e o")])
+    store.sync_lexical(["a"])
+    # Pontuação, termos de uma letra e operadores do FTS5 não viram consulta
+    assert lexical_query("?! - ...") is None
+    assert lexical_query("a e o") is None
+    assert store.search_lexical("?! a", 5) == []
+    assert store.search_lexical('NEAR( "x" *', 5) == []
+    assert store.search_lexical("texto", 0) == []
+
+
+def test_docstore_deletes_only_hide_chunks(tmp_path):
+    store = ChunkStore(tmp_path / CHUNK_STORE_FILE)
+    docstore = SQLiteDocstore(store)
+    docstore.add(dict([chunk("a", "texto a")]))
+    docstore.delete(["a"])
+    assert isinstance(docstore.search("a"), str)
+    # O chunk continua no banco para quem ainda usa a versão anterior do índice
+    assert store.get("a") is not None
+
+
+def test_partial_reindex_keeps_lexical_index_in_sync(tmp_path, embedded, write_file):
+    write_file(tmp_path, "a.md", "# A\n\nfalha ERR_42 ao iniciar")
+    write_file(tmp_path, "b.md", "# B\n\nrotina de backup")
+    run_index(tmp_path, silent=True)
+
+    write_file(tmp_path, "a.md", "# A\n\nfalha ERR_77 ao iniciar")
+    (tmp_path / "b.md").unlink()
+    run_index(tmp_path, partial=True, silent=True)
+
+    store = ChunkStore(tmp_path / CHUNK_STORE_FILE)
+    assert store.search_lexical("ERR_42", 5) == []
+    assert store.search_lexical("backup", 5) == []
+    hits = store.search_lexical("ERR_77", 5)
+    assert [doc.metadata["source"] for doc, _ in hits] == [str(tmp_path / "a.md")]
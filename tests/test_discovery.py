@@ -0,0 +1,73 @@
+from discovery import IgnoreRules, iter_markdown_files
+
+
+def test_name_patterns_match_at_any_level(tmp_path):
+    rules = IgnoreRules(tmp_path, ["*.tmp.md", "rascunho.md", "# comentário", ""])
+    assert rules.is_ignored("a.tmp.md")
+    assert rules.is_ignored("docs/sub/b.tmp.md")
+    assert rules.is_ignored("docs/rascunho.md")
+    assert not rules.is_ignored("docs/final.md")
+
+
+def test_anchored_patterns(tmp_path):
+    rules = IgnoreRules(tmp_path, ["docs/old.md", "/topo.md", str(tmp_path / "abs.md"), "./rel.md"])
+    assert rules.is_ignored("docs/old.md")
+    assert not rules.is_ignored("outro/docs/old.md")
+    assert rules.is_ignored("topo.md")
+    assert not rules.is_ignored("sub/topo.md")
+    assert rules.is_ignored("abs.md")
+    assert not rules.is_ignored("sub/abs.md")
+    assert rules.is_ignored("rel.md")
+
+
+def test_directory_patterns_only_match_directories(tmp_path):
+    rules = IgnoreRules(tmp_path, ["build/", "docs/tmp/"])
+    assert rules.is_ignored("build", is_dir=True)
+    assert rules.is_ignored("pkg/build", is_dir=True)
+    assert not rules.is_ignored("build")
+    assert rules.is_ignored("docs/tmp", is_dir=True)
+    assert not rules.is_ignored("x/docs/tmp", is_dir=True)
+
+
+def test_double_star(tmp_path):
+    rules = IgnoreRules(tmp_path, ["docs/**/rascunho-*.md", "**/gerado", "arquivo/**"])
+    assert rules.is_ignored("docs/rascunho-1.md")
+    assert rules.is_ignored("docs/a/b/rascunho-2.md")
+    assert not rules.is_ignored("outros/rascunho-1.md")
+    assert rules.is_ignored("gerado")
+    assert rules.is_ignored("a/b/gerado")
+    assert rules.is_ignored("arquivo/x/y.md")
+
+
+def test_negation_last_matching_rule_wins(tmp_path):
+    rules = IgnoreRules(tmp_path, ["rascunho-*.md", "!rascunho-final.md", "docs/rascunho-final.md"])
+    assert rules.is_ignored("rascunho-1.md")
+    assert not rules.is_ignored("rascunho-final.md")
+    assert not rules.is_ignored("notas/rascunho-final.md")
+    # Uma regra posterior volta a ignorar
+    assert rules.is_ignored("docs/rascunho-final.md")
+
+
+def test_negation_of_directory_and_escaped_bang(tmp_path):
+    rules = IgnoreRules(tmp_path, ["cache/", "!docs/cache/", "\\!importante.md"])
+    assert rules.is_ignored("cache", is_dir=True)
+    assert not rules.is_ignored("docs/cache", is_dir=True)
+    assert rules.is_ignored("!importante.md")
+    assert not rules.is_ignored("importante.md")
+
+
+def test_exclude_dir_is_not_overridden_by_negation(tmp_path):
+    rules = IgnoreRules(tmp_path, ["!shard"])
+    rules.exclude_dir("shard")
+    assert rules.is_ignored("shard", is_dir=True)
+
+
+def test_ignored_directories_are_pruned(tmp_path):
+    for rel in ("a.md", "b.txt", "docs/c.md", "docs/rascunho.md", "cache/d.md", ".oculto/e.md", "docs/.f.md"):
+        path = tmp_path / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x", encoding="utf-8")
+    # Arquivo dentro de diretório ignorado não pode ser reincluído
+    rules = IgnoreRules(tmp_path, ["cache/", "!cache/d.md", "rascunho.md"])
+    found = sorted(p.relative_to(tmp_path).as_posix() for p in iter_markdown_files(tmp_path, rules=rules, workers=2))
+    assert found == ["a.md", "docs/c.md"]
@@ -0,0 +1,87 @@
+from job_queue import JobPriority, JobStatus
+from scheduler import parse_weights
+
+
+def test_fair_queueing_interleaves_base_dirs(base_dirs, runner, make_scheduler, wait_until):
+    a, b, c = base_dirs("a", "b", "c")
+    scheduler = make_scheduler(max_workers=1)
+    scheduler.submit("chat", c, "bloqueio")
+    wait_until(lambda: runner.started == ["bloqueio"])
+    for name in ("a1", "a2", "a3"):
+        scheduler.submit("chat", a, name)
+    for name in ("b1", "b2"):
+        scheduler.submit("chat", b, name)
+
+    for question in ("bloqueio", "a1", "a2", "a3", "b1", "b2"):
+        runner.release(question)
+    wait_until(lambda: len(runner.started) == 6)
+
+    # A rajada de a não passa na frente de b: as etiquetas empatadas saem em pares
+    order = [name[0] for name in runner.started[1:]]
+    assert sorted(order[0:2]) == ["a", "b"]
+    assert sorted(order[2:4]) == ["a", "b"]
+    assert order[4] == "a"
+
+
+def test_fair_queueing_weights(base_dirs, runner, make_scheduler, wait_until):
+    a, b, c = base_dirs("a", "b", "c")
+    scheduler = make_scheduler(max_workers=1, weights={a: 2.0})
+    scheduler.submit("chat", c, "bloqueio")
+    wait_until(lambda: runner.started == ["bloqueio"])
+    for name in ("a1", "a2", "a3", "a4"):
+        scheduler.submit("chat", a, name)
+    for name in ("b1", "b2"):
+        scheduler.submit("chat", b, name)
+
+    for question in ("bloqueio", "a1", "a2", "a3", "a4", "b1", "b2"):
+        runner.release(question)
+    wait_until(lambda: len(runner.started) == 7)
+    # Peso 2: a recebe o dobro das vagas de b
+    assert runner.started[1:] == ["a1", "b1", "a2", "a3", "b2", "a4"]
+
+
+def test_parse_weights(base_dirs):
+    a, b = base_dirs("a", "b")
+    assert parse_weights(f"{a}=3, {b}=0.5,invalido,{a}x=abc,{b}=-1") == {a: 3.0, b: 0.5}
+
+
+def test_priority_classes_run_in_order(base_dirs, runner, make_scheduler, wait_until):
+    a, b, c, d = base_dirs("a", "b", "c", "d")
+    scheduler = make_scheduler(max_workers=1)
+    scheduler.submit("chat", a, "bloqueio")
+    wait_until(lambda: runner.started == ["bloqueio"])
+    scheduler.submit("reindex", b, "manutencao", priority=JobPriority.MAINTENANCE)
+    scheduler.submit("chat", c, "lote", priority=JobPriority.BATCH)
+    scheduler.submit("chat", d, "interativo")
+
+    for question in ("bloqueio", "manutencao", "lote", "interativo"):
+        runner.release(question)
+    wait_until(lambda: len(runner.started) == 4)
+    assert runner.started == ["bloqueio", "interativo", "lote", "manutencao"]
+
+
+def test_reserved_interactive_slot(base_dirs, runner, make_scheduler, job_status, wait_until):
+    a, b, c = base_dirs("a", "b", "c")
+    scheduler = make_scheduler(max_workers=2, reserved_interactive=1)
+    scheduler.submit("chat", a, "lote1", priority=JobPriority.BATCH)
+    lote2 = scheduler.submit("chat", b, "lote2", priority=JobPriority.BATCH)
+    wait_until(lambda: runner.started == ["lote1"])
+    # A segunda vaga fica para interactive
+    assert job_status(scheduler, lote2) == JobStatus.PENDING
+
+    scheduler.submit("chat", c, "interativo")
+    wait_until(lambda: "interativo" in runner.started)
+    assert job_status(scheduler, lote2) == JobStatus.PENDING
+
+
+def test_maintenance_has_its_own_base_dir_slot(base_dirs, runner, make_scheduler, job_status, wait_until):
+    (a,) = base_dirs("a")
+    scheduler = make_scheduler(max_workers=3, per_base_dir=1, maintenance_per_base_dir=1)
+    scheduler.submit("reindex", a, "reindex1", priority=JobPriority.MAINTENANCE)
+    reindex2 = scheduler.submit("reindex", a, "reindex2", priority=JobPriority.MAINTENANCE)
+    wait_until(lambda: runner.started == ["reindex1"])
+
+    # A reindexação em andamento não ocupa a vaga do chat no mesmo BASE_DIR
+    scheduler.submit("chat", a, "pergunta")
+    wait_until(lambda: "pergunta" in runner.started)
+    assert job_status(scheduler, reindex2) == JobStatus.PENDING
@@ -0,0 +1,130 @@
+import threading
+
+import pytest
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from index import ChangePlanner, IndexCancelled, run_index
+from manifest import IndexManifest
+
+
+def test_cancelled_index_run_keeps_the_previous_index(tmp_path, embedded, write_file):
+    write_file(tmp_path, "a.md", "# A\n\nprimeira versão")
+    run_index(tmp_path, silent=True)
+    before = (tmp_path / "index.faiss").read_bytes()
+
+    write_file(tmp_path, "b.md", "# B\n\nnovo arquivo")
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(IndexCancelled):
+        run_index(tmp_path, partial=True, silent=True, cancel=cancel)
+    assert (tmp_path / "index.faiss").read_bytes() == before
+    assert "b.md" not in (tmp_path / ".rag_indexeds").read_text(encoding="utf-8")
+
+    # Sem o sinal, a próxima execução inclui o arquivo normalmente
+    assert run_index(tmp_path, partial=True, silent=True)["added"] == 1
+
+
+# Um chunk por parágrafo
+SPLITTER = RecursiveCharacterTextSplitter(chunk_size=20, chunk_overlap=0)
+
+
+def doc(source, *paragraphs):
+    return Document(page_content="\n\n".join(paragraphs), metadata={"source": source})
+
+
+def plan(manifest, documents, unreadable=()):
+    """Uma execução do ChangePlanner: (planner, [(texto, id)] a embedar)"""
+    planner = ChangePlanner(manifest, SPLITTER)
+    new_chunks = [(chunk.page_content, doc_id) for chunk, doc_id in planner.iter_new_chunks(documents)]
+    for path in unreadable:
+        planner.keep(path)
+    planner.finish()
+    return planner, new_chunks
+
+
+def test_unchanged_files_are_not_split_again(tmp_path):
+    manifest = IndexManifest()
+    a = str(tmp_path / "a.md")
+    _, first = plan(manifest, [doc(a, "primeiro parágrafo", "segundo parágrafo")])
+    assert [text for text, _ in first] == ["primeiro parágrafo", "segundo parágrafo"]
+
+    planner, second = plan(manifest, [doc(a, "primeiro parágrafo", "segundo parágrafo")])
+    assert second == []
+    assert (planner.changed_files, planner.added, planner.delete_ids) == (0, 0, [])
+
+
+def test_edited_file_reuses_ids_of_unchanged_chunks(tmp_path):
+    manifest = IndexManifest()
+    a = str(tmp_path / "a.md")
+    _, first = plan(manifest, [doc(a, "primeiro parágrafo", "segundo parágrafo")])
+    ids = dict(first)
+
+    planner, second = plan(manifest, [doc(a, "primeiro parágrafo", "segundo, editado")])
+    # Só o parágrafo novo é embedado; o antigo sai do índice
+    assert [text for text, _ in second] == ["segundo, editado"]
+    assert planner.delete_ids == [ids["segundo parágrafo"]]
+    assert planner.changed_files == 1
+    assert manifest.chunk_ids(a) == [ids["primeiro parágrafo"], second[0][1]]
+
+
+def test_repeated_chunks_get_distinct_ids(tmp_path):
+    manifest = IndexManifest()
+    _, chunks = plan(manifest, [doc(str(tmp_path / "a.md"), "mesmo texto", "mesmo texto")])
+    assert len({doc_id for _, doc_id in chunks}) == 2
+
+
+def test_deleted_file_chunks_are_removed(tmp_path):
+    manifest = IndexManifest()
+    a, b = str(tmp_path / "a.md"), str(tmp_path / "b.md")
+    plan(manifest, [doc(a, "texto de a"), doc(b, "texto de b")])
+    b_ids = manifest.chunk_ids(b)
+
+    planner, new_chunks = plan(manifest, [doc(a, "texto de a")])
+    assert new_chunks == []
+    assert planner.delete_ids == b_ids
+    assert list(manifest.files) == [a]
+
+
+def test_unreadable_file_keeps_its_manifest_entry(tmp_path):
+    manifest = IndexManifest()
+    a, b = str(tmp_path / "a.md"), str(tmp_path / "b.md")
+    plan(manifest, [doc(a, "texto de a"), doc(b, "texto de b")])
+    b_ids = manifest.chunk_ids(b)
+
+    planner, _ = plan(manifest, [doc(a, "texto de a")], unreadable=[b])
+    assert planner.delete_ids == []
+    assert manifest.chunk_ids(b) == b_ids
+
+
+def test_partial_run_embeds_only_changed_chunks(tmp_path, embedded, write_file):
+    write_file(tmp_path, "a.md", "# A\n\nconteúdo estável")
+    write_file(tmp_path, "sub/b.md", "# B\n\nprimeira versão")
+    stats = run_index(tmp_path, silent=True)
+    assert (stats["added"], stats["files"]) == (2, 2)
+    embedded.clear()
+
+    # Nada mudou: nenhum embedding
+    stats = run_index(tmp_path, partial=True, silent=True)
+    assert (stats["changed"], stats["added"], stats["deleted"]) == (0, 0, 0)
+    assert embedded == []
+
+    write_file(tmp_path, "sub/b.md", "# B\n\nsegunda versão")
+    stats = run_index(tmp_path, partial=True, silent=True)
+    assert (stats["changed"], stats["added"], stats["deleted"]) == (1, 1, 1)
+    assert embedded == ["# B\n\nsegunda versão"]
+
+
+def test_partial_run_keeps_unreadable_and_drops_deleted_files(tmp_path, embedded, write_file):
+    write_file(tmp_path, "a.md", "# A\n\ntexto de a")
+    write_file(tmp_path, "b.md", "# B\n\ntexto de b")
+    write_file(tmp_path, "c.md", "# C\n\ntexto de c")
+    run_index(tmp_path, silent=True)
+
+    # b.md existe mas não pode ser lido (UTF-8 inválido); c.md foi apagado
+    (tmp_path / "b.md").write_bytes(b"\xff\xfe texto corrompido")
+    (tmp_path / "c.md").unlink()
+    stats = run_index(tmp_path, partial=True, silent=True)
+    assert (stats["added"], stats["deleted"], stats["files"]) == (0, 1, 2)
+    indexed = (tmp_path / ".rag_indexeds").read_text(encoding="utf-8")
+    assert "b.md" in indexed and "c.md" not in indexed
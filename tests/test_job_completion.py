@@ -0,0 +1,94 @@
+import requests
+
+from job_queue import Job, JobStatus
+from webhooks import WebhookDispatcher, job_payload
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeSession:
+    """Session de teste: devolve as respostas (ou exceções) em ordem e registra as chamadas"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def post(self, url, json=None, timeout=None):
+        self.calls.append((url, json))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return FakeResponse(response)
+
+    def close(self):
+        pass
+
+
+def make_dispatcher(*responses, retries=3):
+    dispatcher = WebhookDispatcher(workers=1, retries=retries, backoff=0)
+    dispatcher.session = FakeSession(*responses)
+    return dispatcher
+
+
+def test_completed_job_is_finished_in_process(base_dirs, runner, make_scheduler, wait_until):
+    (a,) = base_dirs("a")
+    finished = []
+    scheduler = make_scheduler(max_workers=1, on_finish=finished.append)
+    job_id = scheduler.submit("chat", a, "pergunta", webhook_url="http://cliente/webhook")
+    runner.release("pergunta")
+
+    # O valor retornado por run_job conclui o job direto, sem passar por /api/webhook
+    wait_until(lambda: len(finished) == 1)
+    job = scheduler.job_queue.get_job(job_id)
+    assert job.status == JobStatus.COMPLETED
+    assert job.result == {"message": "pergunta"}
+    assert finished[0].job_id == job_id
+
+
+def test_failed_job_is_notified(base_dirs, make_scheduler, wait_until):
+    (a,) = base_dirs("a")
+    finished = []
+    scheduler = make_scheduler(max_workers=1, on_finish=finished.append)
+    scheduler.run_job = lambda job: 1 / 0
+    job_id = scheduler.submit("chat", a, "erro")
+    wait_until(lambda: len(finished) == 1)
+    job = scheduler.job_queue.get_job(job_id)
+    assert job.status == JobStatus.FAILED
+    assert "division" in job.error
+
+
+def test_job_payload():
+    job = Job(job_id="1", status=JobStatus.COMPLETED, command="chat", base_dir="/kb", result={"message": "ok"})
+    assert job_payload(job) == {"status": "success", "job_id": "1", "result": {"message": "ok"}}
+    job.status, job.result, job.error = JobStatus.FAILED, None, "Timeout"
+    assert job_payload(job) == {"status": "error", "job_id": "1", "error": "Timeout"}
+
+
+def test_webhook_retries_server_errors_and_network_failures():
+    dispatcher = make_dispatcher(503, requests.ConnectionError("recusada"), 200)
+    assert dispatcher.dispatch("http://cliente/webhook", {"job_id": "1"}).result() is True
+    assert len(dispatcher.session.calls) == 3
+    dispatcher.shutdown()
+
+
+def test_webhook_does_not_retry_client_errors():
+    dispatcher = make_dispatcher(404, 200)
+    assert dispatcher.dispatch("http://cliente/webhook", {"job_id": "1"}).result() is False
+    assert len(dispatcher.session.calls) == 1
+    dispatcher.shutdown()
+
+
+def test_webhook_gives_up_after_retries():
+    dispatcher = make_dispatcher(500, 500, 500, retries=2)
+    assert dispatcher.dispatch("http://cliente/webhook", {"job_id": "1"}).result() is False
+    assert len(dispatcher.session.calls) == 3
+    dispatcher.shutdown()
+
+
+def test_job_without_webhook_url_is_not_dispatched():
+    dispatcher = make_dispatcher()
+    assert dispatcher.dispatch_job(Job(job_id="1", status=JobStatus.COMPLETED, command="chat", base_dir="/kb")) is None
+    dispatcher.shutdown()
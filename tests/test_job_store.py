@@ -0,0 +1,132 @@
+import sqlite3
+import time
+
+from job_queue import JobPriority, JobQueue, JobStatus
+from job_store import JobStore
+from scheduler import JobScheduler
+
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(JobStore(tmp_path / "jobs.sqlite"), **kwargs)
+
+
+def finished_row(job_id, status, finished_at):
+    return {
+        "job_id": job_id, "status": status, "priority": "interactive", "command": "chat",
+        "base_dir": "/kb", "created_at": finished_at - 1, "finished_at": finished_at
+    }
+
+
+def test_update_job_status_counts_and_finished_jobs_are_immutable(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.add_job("chat", "/kb", "pergunta")
+    assert queue.get_queue_status()["pending"] == 1
+
+    assert queue.update_job_status(job_id, JobStatus.PROCESSING)
+    assert queue.update_job_status(job_id, JobStatus.COMPLETED, result={"message": "ok"})
+    # O resultado de um job já terminado (ex.: cancelado) é descartado
+    assert not queue.update_job_status(job_id, JobStatus.FAILED, error="tarde demais")
+
+    job = queue.get_job(job_id)
+    assert job.status == JobStatus.COMPLETED
+    assert job.result == {"message": "ok"}
+    assert job.done.is_set()
+    assert job.queue_wait is not None
+    assert job_id not in queue.jobs
+    status = queue.get_queue_status()
+    assert (status["pending"], status["processing"], status["completed"], status["failed"]) == (0, 0, 1, 0)
+
+
+def test_recover_fails_interrupted_jobs_and_returns_pending(tmp_path):
+    queue = make_queue(tmp_path)
+    running = queue.add_job("chat", "/kb", "em execução")
+    first = queue.add_job("chat", "/kb", "primeira", priority=JobPriority.BATCH, timeout=10)
+    second = queue.add_job("chat", "/kb", "segunda")
+    queue.update_job_status(running, JobStatus.PROCESSING)
+    queue.store.close()
+
+    # Reinício: um novo JobQueue sobre o mesmo arquivo
+    restarted = make_queue(tmp_path)
+    assert restarted.get_queue_status()["processing"] == 1
+    assert restarted.recover() == [first, second]
+
+    interrupted = restarted.get_job(running)
+    assert interrupted.status == JobStatus.FAILED
+    assert "reiniciado" in interrupted.error
+    resumed = restarted.get_job(first)
+    assert resumed.priority == JobPriority.BATCH
+    assert resumed.timeout == 10
+    status = restarted.get_queue_status()
+    assert (status["pending"], status["processing"], status["failed"]) == (2, 0, 1)
+    # Uma segunda chamada não duplica os jobs já em memória
+    assert restarted.recover() == []
+
+
+def test_prune_keeps_max_finished_and_adjusts_counts(tmp_path):
+    queue = make_queue(tmp_path, max_finished=2)
+    job_ids = [queue.add_job("chat", "/kb", f"q{i}") for i in range(4)]
+    for job_id in job_ids[:3]:
+        queue.update_job_status(job_id, JobStatus.COMPLETED)
+        time.sleep(0.002)
+    queue.update_job_status(job_ids[3], JobStatus.FAILED, error="erro")
+
+    queue.prune(force=True)
+    status = queue.get_queue_status()
+    assert (status["completed"], status["failed"], status["total"]) == (1, 1, 2)
+    assert queue.store.count_by_status() == {"completed": 1, "failed": 1}
+    # Os mais antigos saem primeiro
+    assert queue.get_job(job_ids[0]) is None
+    assert queue.get_job(job_ids[2]).status == JobStatus.COMPLETED
+
+
+def test_store_prune_by_retention_and_max_finished(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite")
+    now = time.time()
+    store.insert(finished_row("velho", "completed", now - 7200))
+    store.insert(finished_row("velho-falhou", "failed", now - 3700))
+    store.insert(finished_row("recente", "completed", now - 10))
+    store.insert(finished_row("mais-recente", "completed", now - 5))
+    store.insert(dict(finished_row("ativo", "pending", now - 9000), finished_at=None))
+
+    assert store.prune(now - 3600, max_finished=100) == {"completed": 1, "failed": 1}
+    assert store.prune(now - 3600, max_finished=1) == {"completed": 1}
+    assert store.get("mais-recente") is not None
+    # Jobs ativos nunca são removidos
+    assert store.prune(now + 1, max_finished=0) == {"completed": 1}
+    assert store.count_by_status() == {"pending": 1}
+
+
+def test_store_migrates_tables_without_the_newer_columns(tmp_path):
+    path = tmp_path / "jobs.sqlite"
+    conn = sqlite3.connect(str(path))
+    conn.execute(
+        "CREATE TABLE jobs (job_id TEXT PRIMARY KEY, status TEXT NOT NULL, command TEXT NOT NULL, "
+        "base_dir TEXT NOT NULL, question TEXT, webhook_url TEXT, options TEXT, result TEXT, error TEXT, "
+        "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+    )
+    conn.execute("INSERT INTO jobs (job_id, status, command, base_dir, created_at) VALUES ('antigo', 'pending', 'chat', '/kb', 1)")
+    conn.commit()
+    conn.close()
+
+    queue = make_queue(tmp_path)
+    job = queue.get_job("antigo")
+    assert job.priority == JobPriority.INTERACTIVE
+    assert job.timeout is None and job.deadline is None
+    assert queue.recover() == ["antigo"]
+
+
+def test_resume_runs_recovered_jobs(tmp_path, base_dirs, runner, wait_until):
+    (a,) = base_dirs("a")
+    queue = make_queue(tmp_path)
+    job_id = queue.add_job("chat", a, "pendente")
+    queue.store.close()
+
+    queue = make_queue(tmp_path)
+    scheduler = JobScheduler(queue, runner, max_workers=1, reserved_interactive=0, weights={})
+    try:
+        scheduler.resume(queue.recover())
+        runner.release("pendente")
+        wait_until(lambda: queue.get_job(job_id).status == JobStatus.COMPLETED)
+    finally:
+        runner.stop_all.set()
+        scheduler.shutdown(wait=True)
@@ -0,0 +1,39 @@
+import numpy as np
+
+from mmr import mmr_select
+
+QUERY = [1.0, 0.0]
+# 0 e 1 são quase iguais e os mais relevantes; 2 é menos relevante, mas diferente
+VECTORS = [[1.0, 0.05], [1.0, 0.06], [0.6, 0.8], [0.0, 1.0]]
+
+
+def test_lambda_one_keeps_relevance_order():
+    assert mmr_select(QUERY, VECTORS, 4, lambda_mult=1.0) == [0, 1, 2, 3]
+
+
+def test_lambda_zero_maximizes_diversity():
+    # O primeiro é sempre o mais relevante; depois, o menos parecido com os escolhidos
+    selected = mmr_select(QUERY, VECTORS, 3, lambda_mult=0.0)
+    assert selected[0] == 0
+    assert selected[1] == 3
+    assert selected[2] == 2
+
+
+def test_intermediate_lambda_skips_near_duplicates():
+    assert mmr_select(QUERY, VECTORS[:3], 2, lambda_mult=0.3) == [0, 2]
+    assert mmr_select(QUERY, VECTORS[:3], 2, lambda_mult=0.9) == [0, 1]
+
+
+def test_k_larger_than_candidates():
+    selected = mmr_select(QUERY, VECTORS, 10, lambda_mult=0.5)
+    assert sorted(selected) == [0, 1, 2, 3]
+
+
+def test_empty_and_non_positive_k():
+    assert mmr_select(QUERY, [], 3) == []
+    assert mmr_select(QUERY, VECTORS, 0) == []
+
+
+def test_zero_vectors_do_not_break_selection():
+    selected = mmr_select([0.0, 0.0], np.zeros((3, 2)), 2, lambda_mult=0.5)
+    assert len(selected) == 2 and len(set(selected)) == 2
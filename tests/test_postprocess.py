@@ -0,0 +1,79 @@
+import threading
+
+from postprocess import PostProcessor
+
+
+class StubReindex:
+    """reindex de teste: registra as execuções e segura cada uma até release()"""
+
+    def __init__(self):
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.gate = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, base_dir):
+        with self._lock:
+            self.calls.append(base_dir)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.gate.wait(5)
+        with self._lock:
+            self.running -= 1
+
+    def release(self):
+        self.gate.set()
+
+
+def test_quick_requests_are_coalesced_into_one_follow_up(wait_until):
+    reindex = StubReindex()
+    processor = PostProcessor(engine=None, debounce=0.01, reindex=reindex)
+    processor.schedule_reindex("/kb")
+    wait_until(lambda: reindex.running == 1)
+
+    # Chegam enquanto a primeira roda: viram uma única reindexação ao final
+    for _ in range(10):
+        processor.schedule_reindex("/kb")
+    reindex.release()
+    wait_until(lambda: len(reindex.calls) == 2 and reindex.running == 0)
+    processor.shutdown()
+    assert reindex.calls == ["/kb", "/kb"]
+    assert reindex.max_running == 1
+
+
+def test_debounce_merges_requests_before_the_run(wait_until):
+    reindex = StubReindex()
+    reindex.release()
+    processor = PostProcessor(engine=None, debounce=0.2, reindex=reindex)
+    for _ in range(10):
+        processor.schedule_reindex("/kb")
+    wait_until(lambda: len(reindex.calls) == 1)
+    processor.shutdown()
+    assert reindex.calls == ["/kb"]
+
+
+def test_shutdown_runs_pending_reindexes_now():
+    reindex = StubReindex()
+    reindex.release()
+    processor = PostProcessor(engine=None, debounce=60, reindex=reindex)
+    processor.schedule_reindex("/a")
+    processor.schedule_reindex("/b")
+    assert reindex.calls == []
+
+    # Sem esperar o debounce: shutdown executa o que estava agendado
+    processor.shutdown()
+    assert sorted(reindex.calls) == ["/a", "/b"]
+
+
+def test_shutdown_waits_for_the_running_reindex_and_its_follow_up(wait_until):
+    reindex = StubReindex()
+    processor = PostProcessor(engine=None, debounce=0.01, reindex=reindex)
+    processor.schedule_reindex("/kb")
+    wait_until(lambda: reindex.running == 1)
+    processor.schedule_reindex("/kb")
+
+    threading.Timer(0.1, reindex.release).start()
+    processor.shutdown()
+    assert reindex.calls == ["/kb", "/kb"]
+    assert reindex.running == 0
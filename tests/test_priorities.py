@@ -0,0 +1,74 @@
+from priorities import PriorityMatcher, priorities_version, read_rag_priorities
+from langchain_core.documents import Document
+
+
+def entry(priority, path):
+    return {"priority": priority, "path": path, "alias": None}
+
+
+ENTRIES = [entry(0, "docs"), entry(1, "docs/api"), entry(2, "docs/api/v2"), entry(-1, "docs/api/v1")]
+
+
+def test_longest_prefix_wins():
+    matcher = PriorityMatcher(ENTRIES, "/kb")
+    paths = [e["path"] for e in matcher.entries]
+    assert paths == ["docs", "docs/api", "docs/api/v2"]
+    assert matcher.match_relative("docs/guia.md") == 0
+    assert matcher.match_relative("docs/api/rotas.md") == 1
+    assert matcher.match_relative("docs/api/v2/rotas.md") == 2
+    # Entradas com priority -1 não entram no contexto: vale o prefixo acima delas
+    assert matcher.match_relative("docs/api/v1/rotas.md") == 1
+    assert matcher.match_relative("outros/x.md") is None
+
+
+def test_prefix_must_end_at_a_directory_boundary():
+    matcher = PriorityMatcher(ENTRIES, "/kb")
+    assert matcher.match_relative("docs/api-old/x.md") == 0
+    assert matcher.match_relative("docs2/x.md") is None
+    # A própria entrada (arquivo ou diretório) casa
+    assert matcher.match_relative("docs/api") == 1
+
+
+def test_file_entries_and_base_dir_entry():
+    matcher = PriorityMatcher([entry(0, "."), entry(1, "notas.md")], "/kb")
+    assert matcher.match_relative("notas.md") == 1
+    assert matcher.match_relative("notas.md.bak") == 0
+    assert matcher.match_relative("qualquer/coisa.md") == 0
+
+
+def test_repeated_path_keeps_first_entry():
+    matcher = PriorityMatcher([entry(0, "docs"), entry(5, "docs")], "/kb")
+    assert matcher.match_relative("docs/x.md") == 0
+    assert matcher.index_of_path("docs") == 0
+
+
+def test_match_absolute_source_and_stored_path(tmp_path):
+    matcher = PriorityMatcher(ENTRIES, tmp_path)
+    assert matcher.match_path(str(tmp_path / "docs" / "api" / "x.md")) == "docs/api"
+    assert matcher.match_path("/fora/do/base/x.md") is None
+    doc = Document(page_content="x", metadata={"source": str(tmp_path / "docs" / "x.md"), "priority_path": "docs/api/v2"})
+    assert matcher.match_doc(doc) == 2
+    assert matcher.match_doc(doc, stored=False) == 0
+
+
+def test_empty_matcher():
+    matcher = PriorityMatcher(None, "/kb")
+    assert matcher.match_relative("docs/x.md") is None
+    assert matcher.match_doc(Document(page_content="x", metadata={})) is None
+
+
+def test_version_ignores_order_and_unused_entries():
+    reordered = [ENTRIES[2], ENTRIES[0], ENTRIES[1]]
+    assert priorities_version(ENTRIES) == priorities_version(reordered)
+    assert priorities_version(ENTRIES) != priorities_version(ENTRIES[:2])
+
+
+def test_read_rag_priorities(tmp_path):
+    (tmp_path / ".rag_priorities").write_text(
+        "# comentário\n0, docs/conceitos/, Conceitos\n1, docs/exemplos\ninvalida\nx, docs/y\n", encoding="utf-8"
+    )
+    assert read_rag_priorities(str(tmp_path)) == [
+        {"priority": 0, "path": "docs/conceitos", "alias": "Conceitos"},
+        {"priority": 1, "path": "docs/exemplos", "alias": None},
+    ]
+    assert read_rag_priorities(str(tmp_path / "nada")) is None
@@ -0,0 +1,60 @@
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+import retrieval
+from index_types import IndexSpec, apply_search_params, convert_index
+from retrieval import search_partitions
+
+DIM = 8
+ENTRIES = [{"priority": 0, "path": "geral", "alias": None}, {"priority": 5, "path": "raro", "alias": None}]
+
+
+def make_vectorstore(kind):
+    """32 grupos bem separados; o único chunk de `raro` fica longe da pergunta"""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(scale=100.0, size=(32, DIM)).astype(np.float32)
+    vectors = np.repeat(centers, 8, axis=0) + rng.normal(size=(256, DIM)).astype(np.float32)
+    sources = ["/kb/geral/x.md"] * 255 + ["/kb/raro/nota.md"]
+
+    flat = faiss.IndexFlatL2(DIM)
+    flat.add(vectors)
+    spec = IndexSpec.parse(kind)
+    index, _ = convert_index(flat, spec, log=lambda _: None)
+    apply_search_params(index, spec)
+
+    ids = [f"c{i}" for i in range(len(vectors))]
+    docstore = InMemoryDocstore({
+        doc_id: Document(id=doc_id, page_content=doc_id, metadata={"source": source})
+        for doc_id, source in zip(ids, sources)
+    })
+    vectorstore = FAISS(None, index, docstore, dict(enumerate(ids)))
+    return vectorstore, vectors[0]
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivfflat:nlist=32,nprobe=1", "ivfflat:nlist=32,nprobe=16", "hnsw", "ivfpq:nlist=32,nprobe=1,m=4,nbits=4"])
+def test_small_entry_is_found_outside_the_probed_lists(kind):
+    vectorstore, query = make_vectorstore(kind)
+    hits = search_partitions([vectorstore], query, "/kb", ENTRIES, {0: 3, 1: 1})
+    assert [doc.id for doc, _ in hits[1]] == ["c255"]
+    assert len(hits[0]) == 3
+    assert hits[0][0][0].id == "c0"
+
+
+def test_large_entry_search_visits_every_ivf_list(monkeypatch):
+    vectorstore, query = make_vectorstore("ivfflat:nlist=32,nprobe=1")
+    # Força o caminho do IDSelector mesmo para partições pequenas
+    monkeypatch.setattr(retrieval, "_EXACT_PARTITION_SIZE", 0)
+    hits = search_partitions([vectorstore], query, "/kb", ENTRIES, {1: 1})
+    assert [doc.id for doc, _ in hits[1]] == ["c255"]
+
+
+def test_exact_and_faiss_distances_agree():
+    vectorstore, query = make_vectorstore("flat")
+    exact = search_partitions([vectorstore], query, "/kb", ENTRIES, {0: 5})[0]
+    expected = vectorstore.similarity_search_with_score_by_vector(query, k=5)
+    assert [doc.id for doc, _ in exact] == [doc.id for doc, _ in expected]
+    assert [d for _, d in exact] == pytest.approx([d for _, d in expected], rel=1e-4)
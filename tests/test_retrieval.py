@@ -0,0 +1,96 @@
+import faiss
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from chunk_store import ChunkStore, SQLiteDocstore
+from retrieval import reciprocal_rank_fusion, search_entries
+
+
+def doc(name, doc_id=None):
+    return Document(id=doc_id, page_content=name, metadata={"source": f"/kb/{name}.md"})
+
+
+def names(hits):
+    return [d.page_content for d, _ in hits]
+
+
+def test_documents_in_both_rankings_come_first():
+    vector = [(doc("a", "a"), 0.1), (doc("b", "b"), 0.2), (doc("c", "c"), 0.3)]
+    lexical = [(doc("c", "c"), -5.0), (doc("d", "d"), -4.0)]
+    hits = reciprocal_rank_fusion([vector, lexical], k=4, rrf_k=60)
+    assert names(hits) == ["c", "a", "b", "d"]
+    assert hits[0][1] == pytest.approx(1 / 63 + 1 / 61)
+    assert hits[1][1] == pytest.approx(1 / 61)
+
+
+def test_ties_keep_first_appearance_order():
+    first = [(doc("a", "a"), 0.0), (doc("b", "b"), 0.0)]
+    second = [(doc("c", "c"), 0.0), (doc("d", "d"), 0.0)]
+    # a e c (e b e d) têm o mesmo score
+    assert names(reciprocal_rank_fusion([first, second], k=4)) == ["a", "c", "b", "d"]
+
+
+def test_duplicate_in_one_ranking_counts_once():
+    # O mesmo chunk vindo de dois índices na mesma lista
+    repeated = [(doc("a", "a"), 0.1), (doc("a", "a"), 0.2), (doc("b", "b"), 0.3)]
+    other = [(doc("b", "b"), -1.0)]
+    hits = reciprocal_rank_fusion([repeated, other], k=3, rrf_k=60)
+    assert names(hits) == ["b", "a"]
+    assert hits[1][1] == pytest.approx(1 / 61)
+
+
+def test_documents_without_id_are_merged_by_source_and_text():
+    hits = reciprocal_rank_fusion([[(doc("a"), 0.1)], [(doc("a"), -1.0)]], k=2)
+    assert names(hits) == ["a"]
+
+
+def test_k_limits_and_empty_rankings():
+    ranking = [(doc(n, n), 0.0) for n in "abcde"]
+    assert names(reciprocal_rank_fusion([ranking, []], k=2)) == ["a", "b"]
+    assert reciprocal_rank_fusion([[], []], k=3) == []
+    assert reciprocal_rank_fusion([ranking], k=0) == []
+
+
+class NoEmbeddings:
+    """Embeddings que não podem ser usados (modo lexical não embeda a pergunta)"""
+
+    def embed_query(self, text):
+        raise AssertionError("a pergunta não deveria ser embedada")
+
+
+def lexical_vectorstore(tmp_path):
+    texts = {
+        "g1": ("/kb/geral/a.md", "configuração do servidor e portas"),
+        "g2": ("/kb/geral/b.md", "erro ERR_42 ao iniciar o servidor"),
+        "r1": ("/kb/raro/c.md", "nota antiga sobre backups"),
+        "r2": ("/kb/raro/d.md", "o erro ERR_42 também aparece nos backups"),
+    }
+    store = ChunkStore(tmp_path / "chunks.sqlite")
+    store.put_many(
+        (doc_id, Document(id=doc_id, page_content=text, metadata={"source": source}))
+        for doc_id, (source, text) in texts.items()
+    )
+    store.sync_lexical(texts)
+    index = faiss.IndexFlatL2(4)
+    index.add(np.eye(4, dtype=np.float32))
+    return FAISS(None, index, SQLiteDocstore(store), dict(enumerate(texts)))
+
+
+ENTRIES = [{"priority": 0, "path": "geral", "alias": None}, {"priority": 5, "path": "raro", "alias": None}]
+
+
+def test_lexical_entry_search_does_not_embed_and_stays_in_the_entry(tmp_path):
+    vectorstore = lexical_vectorstore(tmp_path)
+    hits = search_entries([vectorstore], "ERR_42", NoEmbeddings(), "/kb", ENTRIES, {0: 2, 1: 1}, mode="lexical")
+    assert [d.id for d, _ in hits[0]] == ["g2"]
+    assert [d.id for d, _ in hits[1]] == ["r2"]
+
+
+def test_store_lexical_search_restricted_to_doc_ids(tmp_path):
+    store = lexical_vectorstore(tmp_path).docstore.store
+    assert [d.id for d, _ in store.search_lexical("ERR_42 backups", 5, doc_ids=["r1", "g1"])] == ["r1"]
+    assert store.search_lexical("ERR_42", 5, doc_ids=[]) == []
+    # Sem restrição, os dois chunks com o termo
+    assert {d.id for d, _ in store.search_lexical("ERR_42", 5)} == {"g2", "r2"}
@@ -0,0 +1,42 @@
+from job_queue import JobStatus
+
+
+def test_per_base_dir_limit(base_dirs, runner, make_scheduler, job_status, wait_until):
+    a, b = base_dirs("a", "b")
+    scheduler = make_scheduler(max_workers=4, per_base_dir=1)
+    a1 = scheduler.submit("chat", a, "a1")
+    a2 = scheduler.submit("chat", a, "a2")
+    scheduler.submit("chat", b, "b1")
+
+    wait_until(lambda: sorted(runner.started) == ["a1", "b1"])
+    # Há workers livres, mas o BASE_DIR a já está no limite
+    assert job_status(scheduler, a2) == JobStatus.PENDING
+
+    runner.release("a1")
+    wait_until(lambda: job_status(scheduler, a1) == JobStatus.COMPLETED)
+    wait_until(lambda: "a2" in runner.started)
+
+
+def test_total_workers_limit(base_dirs, runner, make_scheduler, job_status, wait_until):
+    a, b, c = base_dirs("a", "b", "c")
+    scheduler = make_scheduler(max_workers=2, per_base_dir=2)
+    scheduler.submit("chat", a, "a1")
+    scheduler.submit("chat", b, "b1")
+    c1 = scheduler.submit("chat", c, "c1")
+
+    wait_until(lambda: sorted(runner.started) == ["a1", "b1"])
+    assert job_status(scheduler, c1) == JobStatus.PENDING
+    assert scheduler.job_queue.get_queue_status()["processing"] == 2
+
+    # A vaga liberada por um BASE_DIR vai para outro
+    runner.release("b1")
+    wait_until(lambda: "c1" in runner.started)
+
+
+def test_jobs_of_different_base_dirs_run_concurrently(base_dirs, runner, make_scheduler, wait_until):
+    dirs = base_dirs("a", "b", "c")
+    scheduler = make_scheduler(max_workers=3, per_base_dir=1)
+    for base_dir in dirs:
+        scheduler.submit("chat", base_dir, base_dir)
+    # Nenhum job espera o outro terminar
+    wait_until(lambda: sorted(runner.started) == sorted(dirs))
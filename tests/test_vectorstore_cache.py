@@ -0,0 +1,45 @@
+import index
+from index import run_index
+from vectorstore_cache import VectorStoreCache
+
+
+def embeddings():
+    # Com a fixture embedded, os FakeEmbeddings usados na indexação
+    return index.OllamaEmbeddings()
+
+
+def build(base_dir, write_file, text):
+    write_file(base_dir, "a.md", f"# A\n\n{text}")
+    run_index(base_dir, silent=True)
+
+
+def test_evicted_vectorstore_releases_its_sqlite_connection(tmp_path, embedded, write_file):
+    a, b = tmp_path / "a", tmp_path / "b"
+    build(a, write_file, "texto de a")
+    build(b, write_file, "texto de b")
+
+    # Orçamento de 1 byte: só a entrada mais recente fica no cache
+    cache = VectorStoreCache(max_bytes=1)
+    first = cache.get(a, embeddings())
+    assert first.docstore.store._db is not None
+    cache.get(b, embeddings())
+    assert cache.stats()["entries"] == 1
+    assert first.docstore.store._db is None
+
+    # Quem ainda usava o vectorstore descartado continua funcionando
+    assert first.similarity_search("texto de a", k=1)[0].page_content.endswith("texto de a")
+
+
+def test_invalidate_and_reload_close_the_previous_connection(tmp_path, embedded, write_file):
+    build(tmp_path, write_file, "primeira versão")
+    cache = VectorStoreCache()
+    first = cache.get(tmp_path, embeddings())
+
+    build(tmp_path, write_file, "segunda versão")
+    second = cache.get(tmp_path, embeddings())
+    assert second is not first
+    assert first.docstore.store._db is None
+
+    cache.invalidate()
+    assert second.docstore.store._db is None
+    assert cache.stats() == {"entries": 0, "bytes": 0, "max_bytes": cache.max_bytes}